@@ -5,12 +5,21 @@ START_TIME=$(date +%s)
 echo "=== CodeQL Database Builder (Enhanced with Caching) ==="
 echo "Starting build at $(date)"
 
-# 导入缓存管理器
-source /app/scripts/cache-manager.sh
+SCRIPTS_DIR="${SCRIPTS_DIR:-/app/scripts}"
 
-USER_SOURCE_DIR="/app/user-source"
-JDK_SOURCE_DIR="/app/source"
-BOOT_JDK_PATH=""
+# 导入缓存管理器
+source "$SCRIPTS_DIR/cache-manager.sh"
+
+# 构建矩阵的变体和分布式 Worker 使用独立的工作目录，可通过环境变量覆盖
+USER_SOURCE_DIR="${USER_SOURCE_DIR:-/app/user-source}"
+JDK_SOURCE_DIR="${JDK_SOURCE_DIR:-/app/source}"
+BUILD_USER_XML_PATH="${BUILD_USER_XML_PATH:-/app/build-user.xml}"
+DATABASE_DIR="${DATABASE_DIR:-/app/database}"
+# CodeQL 的源码根目录，需包含 JDK 源码和用户源码
+SOURCE_ROOT="${SOURCE_ROOT:-/app}"
+CODEQL_RAM_MB="${CODEQL_RAM_MB:-51200}"
+BOOT_JDK_PATH="${BOOT_JDK_PATH:-}"
+BOOTJDK_EXTRACTOR="${BOOTJDK_EXTRACTOR:-/app/web/bootjdk_extractor.py}"
 
 # Validate prerequisites
 if [ ! -d /app/bootjdk ] || [ -z "$(ls -A /app/bootjdk)" ]; then
@@ -19,14 +28,15 @@ if [ ! -d /app/bootjdk ] || [ -z "$(ls -A /app/bootjdk)" ]; then
 fi
 
 # 检查CodeQL是否存在，如果不存在则自动下载
-if [ ! -d /app/codeql ] || [ -z "$(ls -A /app/codeql)" ]; then
-    echo "CodeQL directory empty or not found at /app/codeql"
+# （目录非空但只有未完成的下载时也需要下载，例如预热被构建打断）
+if [ ! -x /app/codeql/current/codeql ] && [ ! -x /app/codeql/codeql ]; then
+    echo "CodeQL executable not found under /app/codeql"
     echo "Attempting to download CodeQL automatically..."
     
     # 运行CodeQL下载器
-    if [ -f /app/scripts/codeql-downloader.sh ]; then
-        chmod +x /app/scripts/codeql-downloader.sh
-        if /app/scripts/codeql-downloader.sh; then
+    if [ -f "$SCRIPTS_DIR/codeql-downloader.sh" ]; then
+        chmod +x "$SCRIPTS_DIR/codeql-downloader.sh"
+        if "$SCRIPTS_DIR/codeql-downloader.sh"; then
             echo "CodeQL downloaded successfully"
         else
             echo "Error: Failed to download CodeQL automatically"
@@ -47,12 +57,13 @@ if [ -d "$USER_SOURCE_DIR" ] && [ -n "$(ls -A "$USER_SOURCE_DIR" 2>/dev/null ||
   USR_PRESENT=true
 fi
 
-# 计算用户源码哈希（用于缓存）
-USER_SOURCE_HASH="empty"
-if $USR_PRESENT; then
+# 计算用户源码哈希（用于缓存；构建矩阵已计算时直接使用）
+if ! $USR_PRESENT; then
+    USER_SOURCE_HASH="empty"
+elif [ -z "${USER_SOURCE_HASH:-}" ]; then
     USER_SOURCE_HASH=$(calculate_hash "$USER_SOURCE_DIR")
-    echo "User source hash: $USER_SOURCE_HASH"
 fi
+echo "User source hash: $USER_SOURCE_HASH"
 
 # 检查JDK源码缓存
 JDK_VERSION="${JDK_VERSION:-17}"
@@ -71,8 +82,8 @@ else
 fi
 
 if ! $JDK_PRESENT; then
-  echo "[INFO] JDK source not found in $JDK_SOURCE_DIR. Attempting auto-download via /app/scripts/download-jdk.sh ..."
-  bash /app/scripts/download-jdk.sh || {
+  echo "[INFO] JDK source not found in $JDK_SOURCE_DIR. Attempting auto-download via $SCRIPTS_DIR/download-jdk.sh ..."
+  JDK_SOURCE_DIR="$JDK_SOURCE_DIR" bash "$SCRIPTS_DIR/download-jdk.sh" || {
     echo "Error: JDK source download failed. Please verify network and JDK_VERSION/JDK_FULL_VERSION settings."; exit 1; }
   if [ -d "$JDK_SOURCE_DIR" ] && [ -n "$(ls -A "$JDK_SOURCE_DIR" 2>/dev/null || true)" ]; then
     JDK_PRESENT=true
@@ -87,7 +98,7 @@ if ! $JDK_PRESENT; then
   fi
 fi
 
-mkdir -p /app/database
+mkdir -p "$DATABASE_DIR"
 
 echo "User source present: $USR_PRESENT"
 echo "JDK source present: $JDK_PRESENT"
@@ -100,20 +111,22 @@ echo "Database name: $DB_NAME"
 
 # Configure Java
 extract_boot_jdk_if_needed() {
-  # Boot JDK解压现在在Web应用启动时进行，这里只做路径检查
+  # Boot JDK 由 Web 启动时的后台任务解压；这里按需补齐（同一压缩包有标记和文件锁，不会重复解压）
   if [ "$BUILD_MODE" = "user_only" ]; then
     echo "[INFO] Skipping Boot JDK extraction in user_only mode"
     return 0
   fi
   
-  # 检查Boot JDK是否已经解压
-  if [ -d "/app/bootjdk/_extracted" ] && [ -n "$(ls -A /app/bootjdk/_extracted 2>/dev/null || true)" ]; then
-    echo "[INFO] Boot JDK already extracted"
-    return 0
-  else
-    echo "[ERROR] Boot JDK not found in /app/bootjdk/_extracted"
-    echo "Please ensure Boot JDK is properly extracted during web initialization"
-    return 1
+  case "$BOOT_JDK_PATH" in
+    *.tar.gz|*.tgz)
+      echo "[INFO] Ensuring Boot JDK archive is extracted: $BOOT_JDK_PATH"
+      BOOT_JDK_PATH=$(python3 "$BOOTJDK_EXTRACTOR" ensure "$BOOT_JDK_PATH")
+      return 0
+      ;;
+  esac
+  
+  if [ -z "$BOOT_JDK_PATH" ]; then
+    python3 "$BOOTJDK_EXTRACTOR" extract || echo "[WARN] Some Boot JDK archives failed to extract"
   fi
 }
 
@@ -132,8 +145,16 @@ resolve_boot_jdk_path() {
     fi
   fi
   
+  # 构建请求指定的 Boot JDK
+  if [ -n "$BOOT_JDK_PATH" ] && [ -x "$BOOT_JDK_PATH/bin/java" ]; then
+    return 0
+  elif [ -n "$BOOT_JDK_PATH" ]; then
+    echo "[WARN] Requested Boot JDK not usable: $BOOT_JDK_PATH, falling back to auto detection"
+    BOOT_JDK_PATH=""
+  fi
+  
   if [ -d /app/bootjdk/_extracted ]; then
-    BOOT_JDK_PATH=$(find /app/bootjdk/_extracted -maxdepth 2 -type d \( -name "jdk*" -o -name "java-*" -o -name "openjdk*" \) | head -1)
+    BOOT_JDK_PATH=$(find /app/bootjdk/_extracted -maxdepth 2 -type d -not -path "*/.*" \( -name "jdk*" -o -name "java-*" -o -name "openjdk*" \) | head -1)
   fi
   if [ -z "${BOOT_JDK_PATH:-}" ]; then
     BOOT_JDK_PATH=$(find /app/bootjdk -mindepth 1 -maxdepth 1 -type d -not -name "_extracted" | head -1)
@@ -171,8 +192,14 @@ fi
 DESIRED_MAJOR=${CODEQL_RUNTIME_MAJOR:-17}
 echo "Desired CodeQL runtime major: $DESIRED_MAJOR"
 
-# Locate CodeQL CLI
-CODEQL_EXE=$(find /app/codeql -type f -name codeql -o -name codeql.exe | head -1)
+# Locate CodeQL CLI (prefer the version selected via /app/codeql/current)
+if [ -x /app/codeql/current/codeql ]; then
+    CODEQL_EXE=/app/codeql/current/codeql
+elif [ -x /app/codeql/codeql ]; then
+    CODEQL_EXE=/app/codeql/codeql
+else
+    CODEQL_EXE=$(find /app/codeql -path /app/codeql/bundles -prune -o -type f \( -name codeql -o -name codeql.exe \) -print | head -1)
+fi
 if [ -z "$CODEQL_EXE" ]; then
     echo "Error: CodeQL executable not found under /app/codeql"
     exit 1
@@ -189,9 +216,13 @@ ensure_codeql_runtime() {
     export CODEQL_JAVA_HOME="$JAVA_HOME"
     echo "[INFO] Using Boot JDK (major $BOOT_MAJOR) as CodeQL runtime via CODEQL_JAVA_HOME=$CODEQL_JAVA_HOME"
   else
-    # Try installing desired Java headless runtime first
-    echo "[INFO] Boot JDK is $BOOT_MAJOR; installing OpenJDK ${DESIRED_MAJOR} headless for CodeQL runtime..."
-    apt-get update -y && DEBIAN_FRONTEND=noninteractive apt-get install -y "openjdk-${DESIRED_MAJOR}-jre-headless" || true
+    # Try installing desired Java headless runtime first (skipped when already installed, e.g. by the prewarmer)
+    if [ -x "/usr/lib/jvm/java-${DESIRED_MAJOR}-openjdk-amd64/bin/java" ]; then
+      echo "[INFO] Boot JDK is $BOOT_MAJOR; OpenJDK ${DESIRED_MAJOR} runtime already installed"
+    else
+      echo "[INFO] Boot JDK is $BOOT_MAJOR; installing OpenJDK ${DESIRED_MAJOR} headless for CodeQL runtime..."
+      apt-get -o DPkg::Lock::Timeout=600 update -y && DEBIAN_FRONTEND=noninteractive apt-get -o DPkg::Lock::Timeout=600 install -y "openjdk-${DESIRED_MAJOR}-jre-headless" || true
+    fi
     local sys_java_home
     if [ -d "/usr/lib/jvm/java-${DESIRED_MAJOR}-openjdk-amd64" ]; then
       sys_java_home="/usr/lib/jvm/java-${DESIRED_MAJOR}-openjdk-amd64"
@@ -204,7 +235,7 @@ ensure_codeql_runtime() {
     # If desired major not available, fallback to 11
     if [ -z "$sys_java_home" ] || ! "$sys_java_home/bin/java" -version >/dev/null 2>&1; then
       echo "[WARN] Java ${DESIRED_MAJOR} not available; falling back to OpenJDK 11"
-      apt-get update -y && DEBIAN_FRONTEND=noninteractive apt-get install -y openjdk-11-jre-headless
+      apt-get -o DPkg::Lock::Timeout=600 update -y && DEBIAN_FRONTEND=noninteractive apt-get -o DPkg::Lock::Timeout=600 install -y openjdk-11-jre-headless
       if [ -d "/usr/lib/jvm/java-11-openjdk-amd64" ]; then
         sys_java_home="/usr/lib/jvm/java-11-openjdk-amd64"
       elif [ -x "/usr/bin/java" ]; then
@@ -231,13 +262,22 @@ ensure_codeql_runtime() {
 ensure_codeql_runtime
 
 # Prepare build configuration for USER sources (with enhanced project support)
-BUILD_USER_XML_PATH="/app/build-user.xml"
 echo "Generating build configuration for user sources at $BUILD_USER_XML_PATH"
 
 if $USR_PRESENT; then
+    # 在 CodeQL 跟踪之外预解析 Maven/Gradle 依赖（共享缓存，按构建文件哈希命中），跟踪中的编译离线运行
+    if [ -n "${DEPS_OFFLINE:-}" ]; then
+        # 构建矩阵已统一预解析
+        export DEPS_M2_REPO DEPS_GRADLE_HOME DEPS_OFFLINE
+        echo "Dependency cache prepared by build group, offline mode: $DEPS_OFFLINE"
+    elif [ "$BUILD_MODE" != "jdk_only" ]; then
+        prepare_dependency_cache "$USER_SOURCE_DIR"
+        echo "Dependency cache offline mode: $DEPS_OFFLINE"
+    fi
+    
     # 使用项目检测器生成构建配置
     echo "Detecting project type and generating build configuration..."
-    PROJECT_INFO=$(bash /app/scripts/project-detector.sh "$USER_SOURCE_DIR" "$BUILD_USER_XML_PATH")
+    PROJECT_INFO=$(bash "$SCRIPTS_DIR/project-detector.sh" "$USER_SOURCE_DIR" "$BUILD_USER_XML_PATH")
     echo "Project detection result: $PROJECT_INFO"
 else
     # 生成默认的空构建配置
@@ -251,16 +291,16 @@ EOF
 fi
 
 # Build CodeQL database using a single command chaining OpenJDK build and optional user Ant build
-DB_PATH="/app/database/${DB_NAME}"
+DB_PATH="$DATABASE_DIR/${DB_NAME}"
 echo "Creating CodeQL database at: $DB_PATH"
 
 # Prepare command strings for each mode
 # Use double quotes for the -lc string to avoid mismatched single-quote issues
-HYBRID_CMD="/bin/bash -lc \"set -e; cd /app/source; if [ -f configure ]; then chmod +x configure || true; echo Running configure...; ./configure --with-boot-jdk=$JAVA_HOME --with-debug-level=slowdebug || true; fi; echo Running make all for OpenJDK...; make all DISABLE_HOTSPOT_OS_VERSION_CHECK=OK ZIP_DEBUGINFO_FILES=0; if [ -d /app/user-source ] && ls -A /app/user-source >/dev/null 2>&1; then echo Compiling user project via Ant...; ant -f /app/build-user.xml; else echo No user sources; skipping Ant step.; fi\""
+HYBRID_CMD="/bin/bash -lc \"set -e; cd $JDK_SOURCE_DIR; if [ -f configure ]; then chmod +x configure || true; echo Running configure...; ./configure --with-boot-jdk=$JAVA_HOME --with-debug-level=slowdebug || true; fi; echo Running make all for OpenJDK...; make all DISABLE_HOTSPOT_OS_VERSION_CHECK=OK ZIP_DEBUGINFO_FILES=0; if [ -d $USER_SOURCE_DIR ] && ls -A $USER_SOURCE_DIR >/dev/null 2>&1; then echo Compiling user project via Ant...; ant -f $BUILD_USER_XML_PATH; else echo No user sources; skipping Ant step.; fi\""
 
-JDK_ONLY_CMD="/bin/bash -lc \"set -e; cd /app/source; if [ -f configure ]; then chmod +x configure || true; echo Running configure...; ./configure --with-boot-jdk=$JAVA_HOME --with-debug-level=slowdebug || true; fi; echo Running make all for OpenJDK...; make all DISABLE_HOTSPOT_OS_VERSION_CHECK=OK ZIP_DEBUGINFO_FILES=0\""
+JDK_ONLY_CMD="/bin/bash -lc \"set -e; cd $JDK_SOURCE_DIR; if [ -f configure ]; then chmod +x configure || true; echo Running configure...; ./configure --with-boot-jdk=$JAVA_HOME --with-debug-level=slowdebug || true; fi; echo Running make all for OpenJDK...; make all DISABLE_HOTSPOT_OS_VERSION_CHECK=OK ZIP_DEBUGINFO_FILES=0\""
 
-USER_ONLY_CMD="/bin/bash -lc \"set -e; if [ -d /app/user-source ] && ls -A /app/user-source >/dev/null 2>&1; then echo Compiling user project via Ant...; ant -f /app/build-user.xml; else echo No user sources; skipping Ant step.; fi\""
+USER_ONLY_CMD="/bin/bash -lc \"set -e; if [ -d $USER_SOURCE_DIR ] && ls -A $USER_SOURCE_DIR >/dev/null 2>&1; then echo Compiling user project via Ant...; ant -f $BUILD_USER_XML_PATH; else echo No user sources; skipping Ant step.; fi\""
 
 # Select command based on mode
 SELECTED_CMD="$HYBRID_CMD"
@@ -284,9 +324,9 @@ echo "Mode description: $MODE_DESC"
 "$CODEQL_EXE" database create "$DB_PATH" \
   --language=java \
   --command="$SELECTED_CMD" \
-  --source-root="/app" \
+  --source-root="$SOURCE_ROOT" \
   --overwrite \
-  --ram=51200
+  --ram="$CODEQL_RAM_MB"
 
 RESULT=$?
 END_TIME=$(date +%s)
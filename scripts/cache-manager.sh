@@ -4,26 +4,50 @@ set -euo pipefail
 # CodeQL Database Builder - 缓存管理器
 # 实现JDK源码和编译结果的智能缓存机制
 
-CACHE_DIR="/app/cache"
+CACHE_DIR="${CACHE_DIR:-/app/cache}"
 SOURCE_CACHE_DIR="$CACHE_DIR/sources"
 BUILD_CACHE_DIR="$CACHE_DIR/builds"
 METADATA_DIR="$CACHE_DIR/metadata"
+LEDGER_LOCK_FILE="$CACHE_DIR/.ledger.lock"
+
+# 用户项目依赖缓存（Maven 本地仓库 / Gradle 用户目录），所有构建共享
+# resolved/ 下按构建文件哈希记录已完成预解析的标记，命中时跳过预解析并以离线模式编译
+DEPS_CACHE_DIR="$CACHE_DIR/deps"
+DEPS_M2_REPO="$DEPS_CACHE_DIR/m2/repository"
+DEPS_GRADLE_HOME="$DEPS_CACHE_DIR/gradle"
+DEPS_RESOLVED_DIR="$DEPS_CACHE_DIR/resolved"
+DEPS_LOCK_FILE="$DEPS_CACHE_DIR/.lock"
+
+# 缓存配额与淘汰策略
+# CACHE_MAX_SIZE_GB: 缓存总配额，保存新条目前若超额会自动淘汰
+# CACHE_EVICTION_POLICY: lru（最近最少使用）| lfu（最不经常使用）
+# CACHE_PINNED_JDK_VERSIONS: 固定不淘汰的JDK源码版本，如 "8 17" 或 "17.0.2,21"
+CACHE_MAX_SIZE_GB="${CACHE_MAX_SIZE_GB:-10}"
+CACHE_EVICTION_POLICY="${CACHE_EVICTION_POLICY:-lru}"
+CACHE_PINNED_JDK_VERSIONS="${CACHE_PINNED_JDK_VERSIONS:-}"
+
+# 远程缓存层（可选）
+# REMOTE_CACHE_URL: 远程缓存服务地址（web/cache_server.py），为空则只使用本地缓存
+# REMOTE_CACHE_TOKEN: 远程缓存服务的访问令牌（可选）
+REMOTE_CACHE_URL="${REMOTE_CACHE_URL:-}"
+REMOTE_CACHE_TOKEN="${REMOTE_CACHE_TOKEN:-}"
 
 # 创建缓存目录
-mkdir -p "$SOURCE_CACHE_DIR" "$BUILD_CACHE_DIR" "$METADATA_DIR"
+mkdir -p "$SOURCE_CACHE_DIR" "$BUILD_CACHE_DIR" "$METADATA_DIR" "$DEPS_RESOLVED_DIR"
 
-# 日志函数
+# 日志函数（输出到stderr，避免污染 check-* 命令通过stdout返回的缓存路径）
 log() {
-    echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1"
+    echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1" >&2
 }
 
-# 计算文件/目录的哈希值
+# 计算文件/目录的哈希值（目录哈希包含文件路径，在临时目录中计算时用 as_path 指定最终路径）
 calculate_hash() {
     local path="$1"
+    local as_path="${2:-$1}"
     if [ -f "$path" ]; then
         sha256sum "$path" | cut -d' ' -f1
     elif [ -d "$path" ]; then
-        find "$path" -type f -exec sha256sum {} \; | sort | sha256sum | cut -d' ' -f1
+        find "$path" -type f -exec sha256sum {} \; | sed "s|  $path/|  $as_path/|" | sort | sha256sum | cut -d' ' -f1
     else
         echo "empty"
     fi
@@ -50,12 +74,19 @@ check_source_cache() {
     
     if [ -d "$cache_path" ] && [ -f "$metadata_file" ]; then
         log "找到源码缓存: $cache_key"
+        touch_cache_entry "$cache_key"
+        echo "$cache_path"
+        return 0
+    fi
+    
+    # 本地未命中时回退到远程缓存
+    if fetch_remote_cache "$cache_key" "source"; then
         echo "$cache_path"
         return 0
-    else
-        log "未找到源码缓存: $cache_key"
-        return 1
     fi
+    
+    log "未找到源码缓存: $cache_key"
+    return 1
 }
 
 # 保存源码到缓存
@@ -72,28 +103,52 @@ save_source_cache() {
     
     log "保存源码缓存: $cache_key"
     
-    # 复制源码
-    rm -rf "$cache_path"
-    cp -r "$source_path" "$cache_path"
+    # 计算大小，并在写入前按配额淘汰旧条目
+    local size_kb size_mb
+    size_kb=$(du -sk "$source_path" | cut -f1)
+    size_mb=$((size_kb / 1024))
+    remove_cache_entry "$cache_key" "source"
+    ensure_cache_capacity "$size_kb"
+    
+    # 复制源码到临时目录，连同元数据在账本锁内移动到位
+    local tmp_path="$SOURCE_CACHE_DIR/.${cache_key}.save.$$"
+    rm -rf "$tmp_path"
+    if ! cp -r "$source_path" "$tmp_path"; then
+        rm -rf "$tmp_path"
+        return 1
+    fi
     
-    # 计算大小
-    local size_mb
-    size_mb=$(du -sm "$cache_path" | cut -f1)
+    local pinned="false"
+    if is_pinned_jdk_version "$jdk_version" "$jdk_full_version"; then
+        pinned="true"
+    fi
     
     # 保存元数据
-    cat > "$metadata_file" << EOF
+    local now
+    now=$(date +%s)
+    cat > "${metadata_file}.tmp.$$" << EOF
 {
     "cache_key": "$cache_key",
     "jdk_version": "$jdk_version",
     "jdk_full_version": "$jdk_full_version",
     "type": "source",
     "created_time": "$(date -Iseconds)",
+    "created_epoch": $now,
+    "last_hit_epoch": $now,
+    "hit_count": 0,
+    "pinned": $pinned,
     "size_mb": $size_mb,
-    "hash": "$(calculate_hash "$cache_path")"
+    "size_kb": $size_kb,
+    "hash": "$(calculate_hash "$tmp_path" "$cache_path")"
 }
 EOF
+    install_cache_entry "$cache_key" "source" "$tmp_path" "$cache_path"
     
     log "源码缓存已保存: ${size_mb}MB"
+    
+    # 写穿到远程缓存（失败不影响本地构建）
+    push_remote_cache "$cache_key" "$cache_path" "$metadata_file" || \
+        log "警告: 源码缓存上传到远程缓存失败: $cache_key"
 }
 
 # 恢复源码缓存
@@ -129,11 +184,15 @@ check_build_cache() {
         
         if [ "$cached_hash" = "$user_source_hash" ]; then
             log "找到构建缓存: $cache_key"
+            touch_cache_entry "$cache_key"
             echo "$cache_path"
             return 0
         else
             log "用户源码已变化，缓存无效: $cache_key"
         fi
+    elif fetch_remote_cache "$cache_key" "build"; then
+        echo "$cache_path"
+        return 0
     fi
     
     log "未找到构建缓存: $cache_key"
@@ -156,16 +215,25 @@ save_build_cache() {
     
     log "保存构建缓存: $cache_key"
     
-    # 复制构建结果
-    rm -rf "$cache_path"
-    cp -r "$build_path" "$cache_path"
-    
-    # 计算大小
-    local size_mb
-    size_mb=$(du -sm "$cache_path" | cut -f1)
+    # 计算大小，并在写入前按配额淘汰旧条目
+    local size_kb size_mb
+    size_kb=$(du -sk "$build_path" | cut -f1)
+    size_mb=$((size_kb / 1024))
+    remove_cache_entry "$cache_key" "build"
+    ensure_cache_capacity "$size_kb"
+    
+    # 复制构建结果到临时目录，连同元数据在账本锁内移动到位
+    local tmp_path="$BUILD_CACHE_DIR/.${cache_key}.save.$$"
+    rm -rf "$tmp_path"
+    if ! cp -r "$build_path" "$tmp_path"; then
+        rm -rf "$tmp_path"
+        return 1
+    fi
     
     # 保存元数据
-    cat > "$metadata_file" << EOF
+    local now
+    now=$(date +%s)
+    cat > "${metadata_file}.tmp.$$" << EOF
 {
     "cache_key": "$cache_key",
     "jdk_version": "$jdk_version",
@@ -174,12 +242,22 @@ save_build_cache() {
     "user_source_hash": "$user_source_hash",
     "type": "build",
     "created_time": "$(date -Iseconds)",
+    "created_epoch": $now,
+    "last_hit_epoch": $now,
+    "hit_count": 0,
+    "pinned": false,
     "size_mb": $size_mb,
-    "hash": "$(calculate_hash "$cache_path")"
+    "size_kb": $size_kb,
+    "hash": "$(calculate_hash "$tmp_path" "$cache_path")"
 }
 EOF
+    install_cache_entry "$cache_key" "build" "$tmp_path" "$cache_path"
     
     log "构建缓存已保存: ${size_mb}MB"
+    
+    # 写穿到远程缓存（失败不影响本地构建）
+    push_remote_cache "$cache_key" "$cache_path" "$metadata_file" || \
+        log "警告: 构建缓存上传到远程缓存失败: $cache_key"
 }
 
 # 恢复构建缓存
@@ -195,40 +273,356 @@ restore_build_cache() {
     log "构建缓存恢复完成"
 }
 
+# 调用远程缓存服务
+remote_curl() {
+    local auth_args=()
+    if [ -n "$REMOTE_CACHE_TOKEN" ]; then
+        auth_args=(-H "Authorization: Bearer $REMOTE_CACHE_TOKEN")
+    fi
+    curl -sS --fail --connect-timeout 5 "${auth_args[@]}" "$@"
+}
+
+# 等待后台 sha256sum 写出摘要
+wait_for_digest_file() {
+    local digest_file="$1"
+    local i
+    for i in $(seq 1 100); do
+        [ -s "$digest_file" ] && return 0
+        sleep 0.1
+    done
+    return 1
+}
+
+# 上传缓存条目到远程缓存：tar 流式压缩上传，同时本地计算 SHA-256 与服务端结果比对
+push_remote_cache() {
+    local cache_key="$1"
+    local cache_path="$2"
+    local metadata_file="$3"
+    
+    [ -n "$REMOTE_CACHE_URL" ] || return 0
+    
+    # 远程已有相同内容时跳过上传
+    local local_hash remote_hash
+    local_hash=$(jq -r '.hash // ""' "$metadata_file")
+    remote_hash=$(remote_curl "$REMOTE_CACHE_URL/refs/$cache_key" 2>/dev/null | jq -r '.metadata.hash // ""' || true)
+    if [ -n "$local_hash" ] && [ "$local_hash" = "$remote_hash" ]; then
+        log "远程缓存已是最新: $cache_key"
+        return 0
+    fi
+    
+    log "上传缓存到远程: $cache_key -> $REMOTE_CACHE_URL"
+    
+    local work_dir
+    work_dir=$(mktemp -d)
+    local response
+    if ! response=$(tar -C "$cache_path" -cf - . | gzip -1 | \
+        tee >(sha256sum | cut -d' ' -f1 > "$work_dir/sha256") | \
+        remote_curl -X POST -H "Content-Type: application/octet-stream" -T - "$REMOTE_CACHE_URL/cas"); then
+        rm -rf "$work_dir"
+        return 1
+    fi
+    wait_for_digest_file "$work_dir/sha256"
+    
+    local digest local_digest
+    digest=$(echo "$response" | jq -r '.digest')
+    local_digest=$(cat "$work_dir/sha256")
+    rm -rf "$work_dir"
+    
+    if [ "$digest" != "$local_digest" ]; then
+        log "错误: 远程缓存校验失败 (本地 $local_digest, 远程 $digest)"
+        return 1
+    fi
+    
+    jq -c --arg digest "$digest" '{digest: $digest, metadata: .}' "$metadata_file" | \
+        remote_curl -X PUT -H "Content-Type: application/json" --data-binary @- \
+        "$REMOTE_CACHE_URL/refs/$cache_key" >/dev/null
+    
+    log "远程缓存已上传: $cache_key ($digest)"
+}
+
+# 从远程缓存拉取条目到本地：流式下载解压，同时校验 SHA-256，校验失败则丢弃
+fetch_remote_cache() {
+    local cache_key="$1"
+    local cache_type="$2"
+    
+    [ -n "$REMOTE_CACHE_URL" ] || return 1
+    
+    local ref
+    if ! ref=$(remote_curl "$REMOTE_CACHE_URL/refs/$cache_key" 2>/dev/null); then
+        log "远程缓存未命中: $cache_key"
+        return 1
+    fi
+    
+    local digest size_kb
+    digest=$(echo "$ref" | jq -r '.digest')
+    size_kb=$(echo "$ref" | jq -r '.metadata.size_kb // ((.metadata.size_mb // 0) * 1024)')
+    
+    local cache_dir="$BUILD_CACHE_DIR"
+    if [ "$cache_type" = "source" ]; then
+        cache_dir="$SOURCE_CACHE_DIR"
+    fi
+    local cache_path="$cache_dir/$cache_key"
+    
+    log "从远程缓存拉取: $cache_key ($digest)"
+    ensure_cache_capacity "$size_kb"
+    
+    local tmp_path="$cache_dir/.${cache_key}.remote.$$"
+    local work_dir
+    work_dir=$(mktemp -d)
+    mkdir -p "$tmp_path"
+    
+    if ! remote_curl "$REMOTE_CACHE_URL/cas/$digest" | \
+        tee >(sha256sum | cut -d' ' -f1 > "$work_dir/sha256") | \
+        tar -xzf - -C "$tmp_path"; then
+        log "错误: 远程缓存下载失败: $cache_key"
+        rm -rf "$tmp_path" "$work_dir"
+        return 1
+    fi
+    wait_for_digest_file "$work_dir/sha256"
+    
+    local local_digest
+    local_digest=$(cat "$work_dir/sha256")
+    rm -rf "$work_dir"
+    
+    if [ "$local_digest" != "$digest" ]; then
+        log "错误: 远程缓存校验失败 (期望 $digest, 实际 $local_digest)"
+        rm -rf "$tmp_path"
+        return 1
+    fi
+    
+    remove_cache_entry "$cache_key" "$cache_type"
+    mv "$tmp_path" "$cache_path"
+    echo "$ref" | jq --argjson now "$(date +%s)" --arg digest "$digest" \
+        '.metadata | .last_hit_epoch = $now | .hit_count = ((.hit_count // 0) + 1) | .pinned = (.pinned // false) | .remote_digest = $digest' \
+        > "$METADATA_DIR/${cache_key}.json"
+    
+    log "远程缓存已拉取到本地: $cache_key"
+}
+
+# 更新元数据文件（写临时文件后原子替换）
+update_metadata() {
+    local metadata_file="$1"
+    shift
+    local tmp_file="${metadata_file}.tmp.$$"
+    
+    if jq "$@" "$metadata_file" > "$tmp_file"; then
+        mv "$tmp_file" "$metadata_file"
+    else
+        rm -f "$tmp_file"
+        return 1
+    fi
+}
+
+# 记录缓存命中（最近使用时间与命中次数）
+touch_cache_entry() {
+    local cache_key="$1"
+    local metadata_file="$METADATA_DIR/${cache_key}.json"
+    
+    # 与淘汰持有同一把锁，避免命中记录在淘汰过程中丢失
+    (
+        flock 9
+        [ -f "$metadata_file" ] || exit 0
+        update_metadata "$metadata_file" --argjson now "$(date +%s)" \
+            '.last_hit_epoch = $now | .hit_count = ((.hit_count // 0) + 1)' || true
+    ) 9>"$LEDGER_LOCK_FILE"
+}
+
+# 判断JDK版本是否在固定列表中（匹配主版本号或完整版本号）
+is_pinned_jdk_version() {
+    local jdk_version="$1"
+    local jdk_full_version="$2"
+    local pinned_version
+    
+    for pinned_version in ${CACHE_PINNED_JDK_VERSIONS//,/ }; do
+        if [ "$pinned_version" = "$jdk_version" ] || \
+           { [ -n "$jdk_full_version" ] && [ "$pinned_version" = "$jdk_full_version" ]; }; then
+            return 0
+        fi
+    done
+    return 1
+}
+
+# 固定/取消固定缓存条目
+set_cache_pinned() {
+    local cache_key="$1"
+    local pinned="$2"
+    local metadata_file="$METADATA_DIR/${cache_key}.json"
+    
+    if [ ! -f "$metadata_file" ]; then
+        log "缓存条目不存在: $cache_key"
+        return 1
+    fi
+    
+    update_metadata "$metadata_file" --argjson pinned "$pinned" '.pinned = $pinned'
+    log "缓存条目 $cache_key pinned=$pinned"
+}
+
+# 将保存在临时目录中的条目和元数据移动到位
+# 持有账本锁，cleanup 不会看到没有元数据的半成品；同一条目并发保存时后完成的覆盖先完成的
+install_cache_entry() {
+    local cache_key="$1"
+    local cache_type="$2"
+    local tmp_path="$3"
+    local cache_path="$4"
+    local metadata_file="$METADATA_DIR/${cache_key}.json"
+    
+    (
+        flock 9
+        remove_cache_entry "$cache_key" "$cache_type"
+        mv "$tmp_path" "$cache_path"
+        mv "${metadata_file}.tmp.$$" "$metadata_file"
+    ) 9>"$LEDGER_LOCK_FILE"
+}
+
+# 删除单个缓存条目（目录与元数据）
+remove_cache_entry() {
+    local cache_key="$1"
+    local cache_type="$2"
+    
+    if [ -z "$cache_key" ]; then
+        return 0
+    fi
+    
+    if [ "$cache_type" = "source" ]; then
+        rm -rf "${SOURCE_CACHE_DIR:?}/$cache_key"
+    else
+        rm -rf "${BUILD_CACHE_DIR:?}/$cache_key"
+    fi
+    rm -f "${METADATA_DIR:?}/${cache_key}.json"
+}
+
+# 读取缓存账本，每行: cache_key type size_kb last_hit_epoch hit_count pinned
+# 大小和命中时间全部来自元数据，无需重新扫描缓存目录
+read_cache_ledger() {
+    local metadata_files=("$METADATA_DIR"/*.json)
+    [ -e "${metadata_files[0]}" ] || return 0
+    
+    jq -r 'select(.cache_key != null) | [
+        .cache_key,
+        .type,
+        (.size_kb // ((.size_mb // 0) * 1024)),
+        (.last_hit_epoch // .created_epoch // 0),
+        (.hit_count // 0),
+        (if .pinned == true then 1 else 0 end)
+    ] | @tsv' "${metadata_files[@]}" 2>/dev/null || true
+}
+
+# 为旧版元数据补充账本字段（以元数据文件修改时间作为最近使用时间）
+upgrade_legacy_metadata() {
+    local metadata_file
+    for metadata_file in "$METADATA_DIR"/*.json; do
+        [ -f "$metadata_file" ] || continue
+        if ! jq -e 'has("last_hit_epoch")' "$metadata_file" >/dev/null 2>&1; then
+            update_metadata "$metadata_file" --argjson mtime "$(stat -c %Y "$metadata_file")" \
+                '.created_epoch = (.created_epoch // $mtime) | .last_hit_epoch = $mtime | .hit_count = (.hit_count // 0) | .size_kb = (.size_kb // ((.size_mb // 0) * 1024))' || true
+        fi
+    done
+}
+
+# 账本中记录的缓存总大小(KB)
+get_ledger_size_kb() {
+    read_cache_ledger | awk -F'\t' 'NF { total += $3 } END { print total + 0 }'
+}
+
+# 按策略淘汰未固定的条目，直到总大小不超过 target_kb
+evict_to_target() {
+    local target_kb="$1"
+    local policy="${2:-$CACHE_EVICTION_POLICY}"
+    
+    local ledger total_kb
+    ledger=$(read_cache_ledger)
+    total_kb=$(printf '%s\n' "$ledger" | awk -F'\t' 'NF { total += $3 } END { print total + 0 }')
+    
+    if [ "$total_kb" -le "$target_kb" ]; then
+        return 0
+    fi
+    
+    log "缓存超出配额 ($((total_kb / 1024))MB > $((target_kb / 1024))MB)，按 $policy 策略淘汰"
+    
+    local sort_keys
+    case "$policy" in
+        "lfu")
+            sort_keys=(-k5,5n -k4,4n)
+            ;;
+        *)
+            sort_keys=(-k4,4n)
+            ;;
+    esac
+    
+    local cache_key cache_type size_kb last_hit hit_count pinned
+    while IFS=$'\t' read -r cache_key cache_type size_kb last_hit hit_count pinned; do
+        if [ "$total_kb" -le "$target_kb" ]; then
+            break
+        fi
+        log "淘汰缓存条目: $cache_key (${size_kb}KB, 命中${hit_count}次)"
+        remove_cache_entry "$cache_key" "$cache_type"
+        total_kb=$((total_kb - size_kb))
+    done < <(printf '%s\n' "$ledger" | awk -F'\t' 'NF && $6 == 0' | sort -t$'\t' "${sort_keys[@]}")
+    
+    if [ "$total_kb" -gt "$target_kb" ]; then
+        log "警告: 已固定的缓存条目超出配额 ($((total_kb / 1024))MB)"
+    fi
+}
+
+# 为即将写入的条目腾出空间（由 save-* 自动调用）
+ensure_cache_capacity() {
+    local incoming_kb="${1:-0}"
+    local quota_kb=$((CACHE_MAX_SIZE_GB * 1024 * 1024))
+    local target_kb=$((quota_kb - incoming_kb))
+    
+    if [ "$target_kb" -lt 0 ]; then
+        target_kb=0
+    fi
+    
+    (
+        flock 9
+        evict_to_target "$target_kb"
+    ) 9>"$LEDGER_LOCK_FILE"
+}
+
 # 清理过期缓存
 cleanup_cache() {
     local max_age_days="${1:-30}"  # 默认30天
-    local max_size_gb="${2:-10}"   # 默认10GB
+    local max_size_gb="${2:-$CACHE_MAX_SIZE_GB}"   # 默认10GB
     
     log "开始清理缓存 (保留${max_age_days}天, 最大${max_size_gb}GB)"
     
-    # 按时间清理
-    find "$CACHE_DIR" -type f -mtime +$max_age_days -delete
-    find "$CACHE_DIR" -type d -empty -delete
-    
-    # 按大小清理（保留最新的）
-    local current_size_gb
-    current_size_gb=$(du -sg "$CACHE_DIR" 2>/dev/null | cut -f1 || echo "0")
-    
-    if [ "$current_size_gb" -gt "$max_size_gb" ]; then
-        log "缓存大小超限 (${current_size_gb}GB > ${max_size_gb}GB)，清理最旧的缓存"
+    (
+        flock 9
+        
+        upgrade_legacy_metadata
+        
+        # 按最近使用时间清理（整条目删除，固定条目除外）
+        local expire_before
+        expire_before=$(( $(date +%s) - max_age_days * 86400 ))
         
-        # 获取所有缓存目录，按修改时间排序
-        find "$SOURCE_CACHE_DIR" "$BUILD_CACHE_DIR" -maxdepth 1 -type d -not -path "$SOURCE_CACHE_DIR" -not -path "$BUILD_CACHE_DIR" -printf '%T@ %p\n' | sort -n | while read -r timestamp path; do
-            rm -rf "$path"
-            
-            # 删除对应的元数据
-            local basename
-            basename=$(basename "$path")
-            rm -f "$METADATA_DIR/${basename}.json"
-            
-            # 重新检查大小
-            current_size_gb=$(du -sg "$CACHE_DIR" 2>/dev/null | cut -f1 || echo "0")
-            if [ "$current_size_gb" -le "$max_size_gb" ]; then
-                break
+        local cache_key cache_type size_kb last_hit hit_count pinned
+        while IFS=$'\t' read -r cache_key cache_type size_kb last_hit hit_count pinned; do
+            log "清理过期缓存条目: $cache_key"
+            remove_cache_entry "$cache_key" "$cache_type"
+        done < <(read_cache_ledger | awk -F'\t' -v before="$expire_before" 'NF && $6 == 0 && $4 < before')
+        
+        # 清理没有元数据的残留目录（例如中断的保存）
+        local entry_dir
+        for entry_dir in "$SOURCE_CACHE_DIR"/* "$BUILD_CACHE_DIR"/*; do
+            if [ -d "$entry_dir" ] && [ ! -f "$METADATA_DIR/$(basename "$entry_dir").json" ]; then
+                log "清理无元数据的缓存目录: $entry_dir"
+                rm -rf "$entry_dir"
             fi
         done
-    fi
+        
+        # 清理中断的远程缓存拉取和保存留下的临时目录（.<cache_key>.remote|save.<pid>，进程已不存在）
+        for entry_dir in "$SOURCE_CACHE_DIR"/.*.remote.* "$BUILD_CACHE_DIR"/.*.remote.* \
+                         "$SOURCE_CACHE_DIR"/.*.save.* "$BUILD_CACHE_DIR"/.*.save.*; do
+            if [ -d "$entry_dir" ] && ! kill -0 "${entry_dir##*.}" 2>/dev/null; then
+                log "清理未完成的缓存临时目录: $entry_dir"
+                rm -rf "$entry_dir"
+            fi
+        done
+        
+        # 按大小清理
+        evict_to_target $((max_size_gb * 1024 * 1024))
+    ) 9>"$LEDGER_LOCK_FILE"
     
     log "缓存清理完成"
 }
@@ -246,11 +640,25 @@ get_cache_stats() {
     build_count=$(find "$BUILD_CACHE_DIR" -maxdepth 1 -type d | wc -l)
     build_count=$((build_count - 1))  # 减去目录本身
     
+    local ledger_size_kb pinned_count
+    ledger_size_kb=$(get_ledger_size_kb)
+    pinned_count=$(read_cache_ledger | awk -F'\t' 'NF && $6 == 1' | wc -l)
+    
+    local deps_size_mb deps_resolved_count
+    deps_size_mb=$(du -sm "$DEPS_CACHE_DIR" 2>/dev/null | cut -f1 || echo "0")
+    deps_resolved_count=$(find "$DEPS_RESOLVED_DIR" -maxdepth 1 -type f | wc -l)
+    
     cat << EOF
 {
     "total_size_mb": $total_size_mb,
+    "ledger_size_mb": $((ledger_size_kb / 1024)),
+    "quota_mb": $((CACHE_MAX_SIZE_GB * 1024)),
+    "eviction_policy": "$CACHE_EVICTION_POLICY",
     "source_cache_count": $source_count,
     "build_cache_count": $build_count,
+    "pinned_count": $pinned_count,
+    "deps_cache_mb": $deps_size_mb,
+    "deps_resolved_count": $deps_resolved_count,
     "cache_dir": "$CACHE_DIR"
 }
 EOF
@@ -283,6 +691,133 @@ detect_source_changes() {
     return 0  # 有变化
 }
 
+# 检测用户项目的依赖管理工具
+detect_dependency_tool() {
+    local project_dir="$1"
+    
+    if [ -f "$project_dir/pom.xml" ]; then
+        echo "maven"
+    elif [ -f "$project_dir/build.gradle" ] || [ -f "$project_dir/build.gradle.kts" ]; then
+        echo "gradle"
+    else
+        echo "none"
+    fi
+}
+
+# 计算依赖相关构建文件的哈希（pom.xml、build.gradle、锁文件等，忽略源码和构建输出）
+calculate_dependency_hash() {
+    local project_dir="$1"
+    
+    (
+        cd "$project_dir"
+        find . \( -name target -o -name build -o -name .gradle -o -name .git -o -name node_modules \) -prune -o \
+            -type f \( -name pom.xml -o -name 'build.gradle' -o -name 'build.gradle.kts' \
+                -o -name 'settings.gradle' -o -name 'settings.gradle.kts' -o -name gradle.properties \
+                -o -name '*.lockfile' -o -name '*.versions.toml' -o -name gradle-wrapper.properties \
+                -o -name maven-wrapper.properties -o -name extensions.xml \) -print0 \
+            | sort -z | xargs -0 -r sha256sum
+    ) | sha256sum | cut -d' ' -f1
+}
+
+# Gradle 初始化脚本: 为每个项目注册解析全部可解析配置的任务
+write_gradle_resolve_script() {
+    local script_path="$DEPS_CACHE_DIR/resolve-dependencies.gradle"
+    
+    cat > "$script_path" << 'EOF'
+allprojects {
+    tasks.register('codeqlResolveDependencies') {
+        doLast {
+            configurations.findAll { it.canBeResolved }.each { conf ->
+                try {
+                    conf.resolve()
+                } catch (Exception e) {
+                    logger.warn("Could not resolve ${project.path}:${conf.name}: ${e.message}")
+                }
+            }
+        }
+    }
+}
+EOF
+    echo "$script_path"
+}
+
+# 在 CodeQL 跟踪之外预解析用户项目依赖到共享缓存
+# 构建文件哈希未变化时直接命中；成功后导出 DEPS_OFFLINE=true，生成的 Ant 构建以离线模式编译
+prepare_dependency_cache() {
+    local project_dir="$1"
+    
+    export DEPS_M2_REPO DEPS_GRADLE_HOME
+    export DEPS_OFFLINE=false
+    
+    local tool
+    tool=$(detect_dependency_tool "$project_dir")
+    if [ "$tool" = "none" ]; then
+        log "项目不使用 Maven/Gradle，跳过依赖预解析"
+        return 0
+    fi
+    
+    local deps_key marker
+    deps_key="${tool}_$(calculate_dependency_hash "$project_dir")"
+    marker="$DEPS_RESOLVED_DIR/$deps_key"
+    
+    if [ -f "$marker" ]; then
+        log "依赖缓存命中: $deps_key"
+        touch "$marker"
+        DEPS_OFFLINE=true
+        return 0
+    fi
+    
+    log "预解析依赖 ($tool): $deps_key"
+    local start_time resolve_ok=false
+    start_time=$(date +%s)
+    
+    # 共享的本地仓库不支持多个构建同时写入，预解析期间加锁
+    exec 8>"$DEPS_LOCK_FILE"
+    flock 8
+    case "$tool" in
+        "maven")
+            if (cd "$project_dir" && mvn -B -q -Dmaven.repo.local="$DEPS_M2_REPO" -DskipTests \
+                    dependency:go-offline dependency:resolve-plugins) >&2; then
+                resolve_ok=true
+            fi
+            ;;
+        "gradle")
+            if [ -f "$project_dir/gradlew" ]; then
+                chmod +x "$project_dir/gradlew" || true
+                local init_script
+                init_script=$(write_gradle_resolve_script)
+                # --no-daemon: 不能留下未被跟踪的守护进程，否则跟踪中的 gradlew 会复用它
+                if (cd "$project_dir" && ./gradlew --no-daemon -q --gradle-user-home "$DEPS_GRADLE_HOME" \
+                        --init-script "$init_script" codeqlResolveDependencies) >&2; then
+                    resolve_ok=true
+                fi
+            else
+                log "未找到 gradlew，跳过依赖预解析"
+            fi
+            ;;
+    esac
+    flock -u 8
+    exec 8>&-
+    
+    if $resolve_ok; then
+        date +%s > "$marker"
+        DEPS_OFFLINE=true
+        log "依赖预解析完成，耗时 $(( $(date +%s) - start_time )) 秒"
+    else
+        log "依赖预解析失败，编译时联网解析（仍使用共享缓存）"
+    fi
+}
+
+# 清空依赖缓存
+clean_dependency_cache() {
+    (
+        flock 8
+        log "清空依赖缓存: $DEPS_CACHE_DIR"
+        rm -rf "$DEPS_CACHE_DIR/m2" "$DEPS_GRADLE_HOME" "$DEPS_RESOLVED_DIR"
+        mkdir -p "$DEPS_RESOLVED_DIR"
+    ) 8>"$DEPS_LOCK_FILE"
+}
+
 # 主函数
 main() {
     case "${1:-help}" in
@@ -305,7 +840,35 @@ main() {
             restore_build_cache "$2" "$3"
             ;;
         "cleanup")
-            cleanup_cache "${2:-30}" "${3:-10}"
+            cleanup_cache "${2:-30}" "${3:-$CACHE_MAX_SIZE_GB}"
+            ;;
+        "evict")
+            (
+                flock 9
+                evict_to_target $(( ${2:-$CACHE_MAX_SIZE_GB} * 1024 * 1024 )) "${3:-$CACHE_EVICTION_POLICY}"
+            ) 9>"$LEDGER_LOCK_FILE"
+            ;;
+        "pin")
+            set_cache_pinned "$2" true
+            ;;
+        "unpin")
+            set_cache_pinned "$2" false
+            ;;
+        "push-remote")
+            local cache_key="$2"
+            local cache_path="$SOURCE_CACHE_DIR/$cache_key"
+            [ -d "$cache_path" ] || cache_path="$BUILD_CACHE_DIR/$cache_key"
+            push_remote_cache "$cache_key" "$cache_path" "$METADATA_DIR/${cache_key}.json"
+            ;;
+        "ledger")
+            read_cache_ledger | jq -R -s 'split("\n") | map(select(length > 0) | split("\t") | {
+                cache_key: .[0],
+                type: .[1],
+                size_kb: (.[2] | tonumber),
+                last_hit_epoch: (.[3] | tonumber),
+                hit_count: (.[4] | tonumber),
+                pinned: (.[5] == "1")
+            })'
             ;;
         "stats")
             get_cache_stats
@@ -313,6 +876,16 @@ main() {
         "detect-changes")
             detect_source_changes "$2" "$3"
             ;;
+        "hash")
+            calculate_hash "$2"
+            ;;
+        "prepare-deps")
+            prepare_dependency_cache "$2"
+            echo "DEPS_OFFLINE=$DEPS_OFFLINE"
+            ;;
+        "clean-deps")
+            clean_dependency_cache
+            ;;
         "help"|*)
             cat << EOF
 用法: $0 <命令> [参数...]
@@ -337,7 +910,22 @@ main() {
     从缓存恢复构建结果
     
   cleanup [max_age_days] [max_size_gb]
-    清理过期缓存 (默认: 30天, 10GB)
+    清理过期缓存 (默认: 30天, CACHE_MAX_SIZE_GB)
+    
+  evict [max_size_gb] [lru|lfu]
+    按账本淘汰未固定的条目直到不超过配额
+    
+  pin <cache_key>
+    固定缓存条目，使其不被淘汰
+    
+  unpin <cache_key>
+    取消固定缓存条目
+    
+  ledger
+    显示缓存账本（大小、最近命中时间、命中次数、固定状态）
+    
+  push-remote <cache_key>
+    将本地缓存条目上传到远程缓存 (需设置 REMOTE_CACHE_URL)
     
   stats
     显示缓存统计信息
@@ -345,6 +933,15 @@ main() {
   detect-changes <source_path> <hash_file>
     检测源码是否有变化
     
+  hash <path>
+    计算文件/目录的哈希 (与构建缓存使用的用户源码哈希一致)
+    
+  prepare-deps <project_dir>
+    预解析 Maven/Gradle 依赖到共享缓存 (构建文件哈希未变化时直接命中)
+    
+  clean-deps
+    清空 Maven/Gradle 依赖缓存
+    
   help
     显示此帮助信息
 
@@ -352,6 +949,8 @@ main() {
   $0 check-source 17 17.0.2
   $0 save-source 17 17.0.2 /app/source
   $0 cleanup 7 5
+  $0 pin 17_17.0.2_source
+  CACHE_EVICTION_POLICY=lfu $0 evict 5
 EOF
             ;;
     esac
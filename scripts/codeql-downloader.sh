@@ -3,10 +3,11 @@ set -euo pipefail
 
 # CodeQL自动下载器
 # 检查CodeQL目录是否为空，如果为空则自动下载CodeQL CLI
+# 下载、校验、解压和版本切换由 codeql_manager.py 完成（多连接断点续传，发行包缓存在 bundles/）
 
 CODEQL_DIR="/app/codeql"
-DOWNLOAD_URL="https://github.com/github/codeql-cli-binaries/releases/latest/download/codeql-linux64.zip"
-FILE_NAME="codeql-linux64.zip"
+CODEQL_MANAGER="${CODEQL_MANAGER:-/app/web/codeql_manager.py}"
+CODEQL_VERSION="${CODEQL_VERSION:-latest}"
 
 # 日志函数
 log() {
@@ -26,90 +27,52 @@ check_codeql_installation() {
         return 1
     fi
     
-    # 检查是否存在CodeQL可执行文件
-    if [ -f "$CODEQL_DIR/codeql" ] && [ -x "$CODEQL_DIR/codeql" ]; then
+    # 检查是否存在CodeQL可执行文件（current 指向当前版本，兼容旧的平铺安装）
+    if [ -x "$CODEQL_DIR/current/codeql" ] || [ -x "$CODEQL_DIR/codeql" ]; then
         log "CodeQL已安装并可执行"
         return 0
     fi
-    
+
     log "CodeQL目录存在但缺少可执行文件"
     return 1
 }
 
 # 下载CodeQL
 download_codeql() {
-    log "开始下载CodeQL..."
-    log "下载地址: $DOWNLOAD_URL"
-    
-    # 创建临时目录
-    TEMP_DIR=$(mktemp -d)
-    TEMP_FILE="$TEMP_DIR/$FILE_NAME"
-    
-    # 下载文件
-    log "正在下载到临时文件: $TEMP_FILE"
-    if ! wget -q --show-progress "$DOWNLOAD_URL" -O "$TEMP_FILE"; then
-        log "错误: 下载失败"
-        rm -rf "$TEMP_DIR"
-        return 1
-    fi
-    
-    # 验证下载的文件
-    if [ ! -f "$TEMP_FILE" ] || [ ! -s "$TEMP_FILE" ]; then
-        log "错误: 下载的文件无效或为空"
-        rm -rf "$TEMP_DIR"
-        return 1
-    fi
-    
-    log "下载完成，文件大小: $(du -h "$TEMP_FILE" | cut -f1)"
+    log "开始下载CodeQL $CODEQL_VERSION..."
     
     # 确保CodeQL目录存在
     mkdir -p "$CODEQL_DIR"
     
-    # 解压文件
-    log "正在解压到: $CODEQL_DIR"
-    if ! unzip -q "$TEMP_FILE" -d "$CODEQL_DIR"; then
-        log "错误: 解压失败"
-        rm -rf "$TEMP_DIR"
+    # 下载（或复用 bundles/ 中的缓存）、校验、并行解压到 versions/<版本>，然后切换 current
+    if ! python3 "$CODEQL_MANAGER" --base-dir "$(dirname "$CODEQL_DIR")" install "$CODEQL_VERSION"; then
+        log "错误: 下载失败"
         return 1
     fi
     
-    # 移动文件到正确位置（如果解压后在子目录中）
-    if [ -d "$CODEQL_DIR/codeql" ]; then
-        log "移动CodeQL文件到根目录"
-        mv "$CODEQL_DIR/codeql"/* "$CODEQL_DIR/"
-        rmdir "$CODEQL_DIR/codeql"
-    fi
-    
-    # 设置执行权限
-    if [ -f "$CODEQL_DIR/codeql" ]; then
-        chmod +x "$CODEQL_DIR/codeql"
-        log "设置CodeQL可执行权限"
-    fi
-    
-    # 清理临时文件
-    rm -rf "$TEMP_DIR"
-    
     log "CodeQL下载和安装完成"
     return 0
 }
 
 # 验证CodeQL安装
 verify_codeql_installation() {
-    if [ ! -f "$CODEQL_DIR/codeql" ]; then
+    local codeql_exe="$CODEQL_DIR/current/codeql"
+    if [ ! -f "$codeql_exe" ]; then
         log "错误: CodeQL可执行文件不存在"
         return 1
     fi
     
-    if [ ! -x "$CODEQL_DIR/codeql" ]; then
+    if [ ! -x "$codeql_exe" ]; then
         log "错误: CodeQL文件不可执行"
         return 1
     fi
     
     # 尝试运行CodeQL版本命令
     log "验证CodeQL安装..."
-    if "$CODEQL_DIR/codeql" version >/dev/null 2>&1; then
-        CODEQL_VERSION=$("$CODEQL_DIR/codeql" version | head -n1)
-        log "CodeQL安装验证成功: $CODEQL_VERSION"
+    if "$codeql_exe" version >/dev/null 2>&1; then
+        local installed_version
+        installed_version=$("$codeql_exe" version | head -n1)
+        log "CodeQL安装验证成功: $installed_version"
         return 0
     else
         log "错误: CodeQL安装验证失败"
@@ -4,9 +4,22 @@ set -euo pipefail
 # CodeQL Database Builder - 数据库管理器
 # 支持数据库压缩、下载、删除和清理功能
 
-DATABASE_DIR="/app/database"
-ARCHIVE_DIR="/app/database/archives"
-METADATA_FILE="/app/database/.db_metadata.json"
+DATABASE_DIR="${DATABASE_DIR:-/app/database}"
+ARCHIVE_DIR="$DATABASE_DIR/archives"
+METADATA_FILE="$DATABASE_DIR/.db_metadata.json"
+ARCHIVE_TOOL="${ARCHIVE_TOOL:-/app/web/archive_index.py}"
+CHUNK_TOOL="${CHUNK_TOOL:-/app/web/chunk_store.py}"
+
+# 压缩包格式: zip（按条目压缩，支持列出/读取单个成员）| tar.gz（旧格式）
+#            | chunked（跨压缩包分块去重，下载时按需还原为 tar）
+ARCHIVE_FORMAT="${ARCHIVE_FORMAT:-zip}"
+
+# 压缩前裁剪: 清理 CodeQL 缓存并删除查询时不会读取的子目录（相对数据库目录，支持通配符）
+# DB_CLEANUP_MODE 为 codeql database cleanup 的模式（clear | trim | fit，旧版 CLI 对应 brutal | normal | light），none 表示跳过
+DB_TRIM="${DB_TRIM:-false}"
+DB_CLEANUP_MODE="${DB_CLEANUP_MODE:-clear}"
+DB_TRIM_PATHS="${DB_TRIM_PATHS:-log diagnostic working results}"
+CODEQL_HOME="${CODEQL_HOME:-/app/codeql}"
 
 # 确保目录存在
 mkdir -p "$ARCHIVE_DIR"
@@ -26,23 +39,51 @@ compress_database() {
         return 1
     fi
     
-    local archive_name="${db_name}_$(date +%Y%m%d_%H%M%S).tar.gz"
-    local archive_path="$ARCHIVE_DIR/$archive_name"
-    
+    local extension="$ARCHIVE_FORMAT"
+    if [ "$ARCHIVE_FORMAT" = "chunked" ]; then
+        extension="tar"
+    fi
+    local archive_name="${db_name}_$(date +%Y%m%d_%H%M%S).$extension"
+    local archive_path
+    archive_path=$(archive_file_path "$archive_name")
+
     log "开始压缩数据库: $db_name -> $archive_name"
     
+    # 压缩前裁剪（可选），裁剪前后大小和大小分布记入元数据
+    TRIM_INFO=""
+    if [ "$DB_TRIM" = "true" ]; then
+        trim_database "$db_name" || log "数据库裁剪失败，按原样压缩"
+    fi
+    
     # 计算原始大小
     local original_size_mb
     original_size_mb=$(du -sm "$db_path" | cut -f1)
     
     # 压缩数据库
-    tar -czf "$archive_path" -C "$DATABASE_DIR" "$db_name"
+    # zip 按条目独立压缩，已压缩的文件（如 src.zip）直接存储
+    # chunked 只保存本数据库新增的块；压缩后大小记为该压缩包引用的块的存储大小，新增部分另记 new_size_mb
+    local status=0
+    local store_summary=""
+    if [ "$ARCHIVE_FORMAT" = "zip" ]; then
+        (cd "$DATABASE_DIR" && zip -q -r -X -n .zip:.jar:.gz:.zst "$archive_path" "$db_name") || status=$?
+    elif [ "$ARCHIVE_FORMAT" = "chunked" ]; then
+        store_summary=$(python3 "$CHUNK_TOOL" store "$db_path" "$archive_path") || status=$?
+    else
+        tar -czf "$archive_path" -C "$DATABASE_DIR" "$db_name" || status=$?
+    fi
     
-    if [ $? -eq 0 ]; then
+    if [ $status -eq 0 ]; then
         # 计算压缩后大小
         local compressed_size_mb
-        compressed_size_mb=$(du -sm "$archive_path" | cut -f1)
-        
+        local extra_info=""
+        if [ -n "$store_summary" ]; then
+            compressed_size_mb=$(chunked_archive_size_mb "$archive_path")
+            extra_info=$(echo "$store_summary" | jq -c '{new_size_mb: ((.new_bytes + 1048575) / 1048576 | floor)}')
+            log "分块去重: $(echo "$store_summary" | jq -r '"\(.chunks) 个块，新增 \(.new_chunks) 个（\((.new_bytes + 1048575) / 1048576 | floor) MB）"')"
+        else
+            compressed_size_mb=$(du -sm "$archive_path" | cut -f1)
+        fi
+
         # 计算压缩比
         local compression_ratio
         compression_ratio=$(echo "scale=2; $compressed_size_mb * 100 / $original_size_mb" | bc -l)
@@ -50,13 +91,13 @@ compress_database() {
         log "压缩完成: $original_size_mb MB -> $compressed_size_mb MB (${compression_ratio}%)"
         
         # 保存元数据
-        save_archive_metadata "$archive_name" "$db_name" "$original_size_mb" "$compressed_size_mb"
+        save_archive_metadata "$archive_name" "$db_name" "$original_size_mb" "$compressed_size_mb" "$TRIM_INFO" "$extra_info"
         
         # 删除原始数据库目录
         log "删除原始数据库目录: $db_path"
         rm -rf "$db_path"
         
-        echo "$archive_path"
+        echo "$ARCHIVE_DIR/$archive_name"
         return 0
     else
         log "压缩失败"
@@ -65,12 +106,170 @@ compress_database() {
     fi
 }
 
+# 定位 CodeQL CLI（与 build-db.sh 的查找顺序一致）
+find_codeql_exe() {
+    if [ -n "${CODEQL_EXE:-}" ] && [ -x "$CODEQL_EXE" ]; then
+        echo "$CODEQL_EXE"
+    elif [ -x "$CODEQL_HOME/current/codeql" ]; then
+        echo "$CODEQL_HOME/current/codeql"
+    elif [ -x "$CODEQL_HOME/codeql" ]; then
+        echo "$CODEQL_HOME/codeql"
+    elif [ -d "$CODEQL_HOME" ]; then
+        find "$CODEQL_HOME" -path "$CODEQL_HOME/bundles" -prune -o -type f -name codeql -perm -u+x -print | head -1
+    fi
+}
+
+# 数据库大小分布: 两层目录中占用最大的前 N 项（JSON）
+profile_database_size() {
+    local db_path="$1"
+    local limit="${2:-10}"
+    
+    (cd "$db_path" && du -k -d 2 . 2>/dev/null) \
+        | sort -rn \
+        | awk -F'\t' -v n="$limit" '$2 != "." && c++ < n' \
+        | jq -R -s 'split("\n") | map(select(length > 0) | split("\t") | {
+            path: (.[1] | ltrimstr("./")),
+            size_mb: ((.[0] | tonumber) / 1024 * 100 | floor / 100)
+        })'
+}
+
+# 压缩前裁剪数据库，结果（JSON）保存在 TRIM_INFO 中
+trim_database() {
+    local db_name="$1"
+    local db_path="$DATABASE_DIR/$db_name"
+    
+    if [ ! -d "$db_path" ]; then
+        log "数据库不存在: $db_path"
+        return 1
+    fi
+    
+    local before_kb
+    before_kb=$(du -sk "$db_path" | cut -f1)
+    local profile
+    profile=$(profile_database_size "$db_path")
+    log "裁剪前大小分布:"
+    echo "$profile" | jq -r '.[] | "    \(.size_mb) MB\t\(.path)"'
+    
+    # CodeQL 自带的清理（删除查询缓存等）
+    local cleanup_mode="none"
+    local codeql_exe=""
+    if [ "$DB_CLEANUP_MODE" != "none" ]; then
+        codeql_exe=$(find_codeql_exe)
+    fi
+    if [ -n "$codeql_exe" ]; then
+        local cleanup_help mode_arg
+        cleanup_help=$("$codeql_exe" database cleanup --help 2>&1 || true)
+        case "$cleanup_help" in
+            *--cache-cleanup*)
+                mode_arg="--cache-cleanup=$DB_CLEANUP_MODE"
+                ;;
+            *)
+                # 旧版 CLI 只支持 --mode
+                case "$DB_CLEANUP_MODE" in
+                    clear) mode_arg="--mode=brutal" ;;
+                    trim) mode_arg="--mode=normal" ;;
+                    fit) mode_arg="--mode=light" ;;
+                    *) mode_arg="--mode=$DB_CLEANUP_MODE" ;;
+                esac
+                ;;
+        esac
+        if "$codeql_exe" database cleanup "$mode_arg" "$db_path"; then
+            cleanup_mode="${mode_arg#--*=}"
+            log "CodeQL 清理完成: $mode_arg"
+        else
+            log "CodeQL 清理失败，继续删除配置的子目录"
+        fi
+    elif [ "$DB_CLEANUP_MODE" != "none" ]; then
+        log "未找到 CodeQL CLI，跳过 codeql database cleanup"
+    fi
+    
+    # 删除配置的非必需子目录；数据库描述文件、源码包和 db-java 始终保留
+    local removed=()
+    local rel target
+    for rel in $DB_TRIM_PATHS; do
+        case "$rel" in
+            /*|*..*)
+                log "跳过不安全的裁剪路径: $rel"
+                continue
+                ;;
+        esac
+        for target in "$db_path"/$rel; do
+            [ -e "$target" ] || continue
+            case "${target#"$db_path"/}" in
+                codeql-database.yml|src.zip|db-java)
+                    log "跳过必需的数据库内容: ${target#"$db_path"/}"
+                    continue
+                    ;;
+            esac
+            rm -rf "$target"
+            removed+=("${target#"$db_path"/}")
+        done
+    done
+    
+    local after_kb
+    after_kb=$(du -sk "$db_path" | cut -f1)
+    
+    TRIM_INFO=$(jq -n -c \
+        --argjson before "$before_kb" \
+        --argjson after "$after_kb" \
+        --arg mode "$cleanup_mode" \
+        --argjson profile "$profile" \
+        --args '{
+            before_size_mb: ($before / 1024 * 100 | floor / 100),
+            after_size_mb: ($after / 1024 * 100 | floor / 100),
+            cleanup_mode: $mode,
+            removed_paths: $ARGS.positional,
+            size_profile: $profile
+        }' "${removed[@]}")
+    log "裁剪完成: $(echo "$TRIM_INFO" | jq -r '"\(.before_size_mb) MB -> \(.after_size_mb) MB"')，删除: ${removed[*]:-无}"
+}
+
+# 根据文件名判断压缩包格式
+archive_format() {
+    case "$1" in
+        *.zip) echo "zip" ;;
+        *.tar) echo "chunked" ;;
+        *) echo "tar.gz" ;;
+    esac
+}
+
+# 压缩包在磁盘上的文件（分块压缩包只有清单文件）
+archive_file_path() {
+    local archive_name="$1"
+    if [ "$(archive_format "$archive_name")" = "chunked" ]; then
+        echo "$ARCHIVE_DIR/$archive_name.manifest.json"
+    else
+        echo "$ARCHIVE_DIR/$archive_name"
+    fi
+}
+
+# 分块存储当前占用的字节数
+chunk_stored_bytes() {
+    python3 "$CHUNK_TOOL" stats "$ARCHIVE_DIR" | jq '.stored_bytes'
+}
+
+# 分块压缩包引用的块的存储大小（MB，向上取整）
+chunked_archive_size_mb() {
+    python3 "$CHUNK_TOOL" size "$1" | jq '(.stored_bytes + 1048575) / 1048576 | floor'
+}
+
+# 回收不再被任何压缩包引用的块
+gc_chunks() {
+    if [ -d "$ARCHIVE_DIR/.chunks" ]; then
+        local result
+        result=$(python3 "$CHUNK_TOOL" gc "$ARCHIVE_DIR")
+        log "回收未引用的块: $(echo "$result" | jq -r '"\(.removed_chunks) 个，\(.removed_bytes) 字节"')"
+    fi
+}
+
 # 保存压缩包元数据
 save_archive_metadata() {
     local archive_name="$1"
     local db_name="$2"
     local original_size_mb="$3"
     local compressed_size_mb="$4"
+    local trim_info="${5:-}"
+    local extra_info="${6:-}"
     
     local metadata
     metadata=$(cat << EOF
@@ -81,11 +280,22 @@ save_archive_metadata() {
     "original_size_mb": $original_size_mb,
     "compressed_size_mb": $compressed_size_mb,
     "compression_ratio": $(echo "scale=2; $compressed_size_mb * 100 / $original_size_mb" | bc -l),
-    "archive_path": "$ARCHIVE_DIR/$archive_name"
+    "archive_path": "$(archive_file_path "$archive_name")",
+    "format": "$(archive_format "$archive_name")"
 }
 EOF
     )
     
+    # 压缩前裁剪的信息（裁剪前后大小、删除的子目录、大小分布）
+    if [ -n "$trim_info" ]; then
+        metadata=$(echo "$metadata" | jq -c --argjson trim "$trim_info" '. + {trim: $trim}')
+    fi
+    
+    # 其他附加字段（如分块存储的 new_size_mb）
+    if [ -n "$extra_info" ]; then
+        metadata=$(echo "$metadata" | jq -c --argjson extra "$extra_info" '. + $extra')
+    fi
+
     # 读取现有元数据
     local existing_metadata="[]"
     if [ -f "$METADATA_FILE" ]; then
@@ -96,6 +306,39 @@ EOF
     echo "$existing_metadata" | jq ". + [$metadata]" > "$METADATA_FILE"
 }
 
+# 登记外部生成的压缩包（例如分布式Worker上传的压缩包）
+register_archive() {
+    local archive_name="$1"
+    local db_name="$2"
+    local original_size_mb="$3"
+    local archive_path="$ARCHIVE_DIR/$archive_name"
+    
+    if [ ! -f "$archive_path" ]; then
+        log "压缩包不存在: $archive_path"
+        return 1
+    fi
+    
+    local compressed_size_mb
+    compressed_size_mb=$(du -sm "$archive_path" | cut -f1)
+    if [ "${original_size_mb:-0}" -le 0 ]; then
+        original_size_mb="$compressed_size_mb"
+    fi
+    
+    # 同名条目先移除，避免重复登记
+    if [ -f "$METADATA_FILE" ]; then
+        jq --arg name "$archive_name" 'map(select(.archive_name != $name))' "$METADATA_FILE" > "$METADATA_FILE.tmp"
+        mv "$METADATA_FILE.tmp" "$METADATA_FILE"
+    fi
+    
+    save_archive_metadata "$archive_name" "$db_name" "$original_size_mb" "$compressed_size_mb"
+    log "已登记压缩包: $archive_name"
+    
+    # 协调节点使用分块存储时，上传的单文件压缩包登记后转换为分块格式
+    if [ "$ARCHIVE_FORMAT" = "chunked" ] && [ "$(archive_format "$archive_name")" != "chunked" ]; then
+        convert_archive "$archive_name" chunked > /dev/null
+    fi
+}
+
 # 列出所有压缩包
 list_archives() {
     if [ ! -f "$METADATA_FILE" ]; then
@@ -126,22 +369,41 @@ list_archives() {
     cat "$METADATA_FILE"
 }
 
-# 解压数据库
+# 解压数据库（可只解压指定的子路径，如 my_db/src.zip、my_db/codeql-database.yml）
 extract_database() {
     local archive_name="$1"
-    local archive_path="$ARCHIVE_DIR/$archive_name"
-    
+    shift
+    local archive_path
+    archive_path=$(archive_file_path "$archive_name")
+
     if [ ! -f "$archive_path" ]; then
         log "压缩包不存在: $archive_path"
         return 1
     fi
     
-    log "解压数据库: $archive_name"
-    
-    # 解压到数据库目录
-    tar -xzf "$archive_path" -C "$DATABASE_DIR"
+    local status=0
+    if [ $# -gt 0 ]; then
+        log "解压数据库: $archive_name (仅: $*)"
+        local include_args=()
+        local sub_path
+        for sub_path in "$@"; do
+            include_args+=(--include "$sub_path")
+        done
+        python3 "$ARCHIVE_TOOL" extract "$ARCHIVE_DIR/$archive_name" "$DATABASE_DIR" "${include_args[@]}" || status=$?
+    else
+        log "解压数据库: $archive_name"
+        
+        # 解压到数据库目录
+        if [ "$(archive_format "$archive_name")" = "zip" ]; then
+            unzip -q -o "$archive_path" -d "$DATABASE_DIR" || status=$?
+        elif [ "$(archive_format "$archive_name")" = "chunked" ]; then
+            python3 "$ARCHIVE_TOOL" extract "$ARCHIVE_DIR/$archive_name" "$DATABASE_DIR" || status=$?
+        else
+            tar -xzf "$archive_path" -C "$DATABASE_DIR" || status=$?
+        fi
+    fi
     
-    if [ $? -eq 0 ]; then
+    if [ $status -eq 0 ]; then
         log "解压完成"
         return 0
     else
@@ -150,25 +412,113 @@ extract_database() {
     fi
 }
 
+# 列出压缩包成员（zip 直接读取中央目录，tar.gz 首次需要完整扫描）
+list_archive_members() {
+    local archive_name="$1"
+    local archive_path
+    archive_path=$(archive_file_path "$archive_name")
+    
+    if [ ! -f "$archive_path" ]; then
+        log "压缩包不存在: $archive_path"
+        return 1
+    fi
+    
+    python3 "$ARCHIVE_TOOL" list "$ARCHIVE_DIR/$archive_name"
+}
+
+# 转换压缩包格式（zip / tar.gz / chunked），并更新元数据
+convert_archive() {
+    local archive_name="$1"
+    local target_format="$2"
+    local archive_path
+    archive_path=$(archive_file_path "$archive_name")
+    
+    if [ ! -f "$archive_path" ]; then
+        log "压缩包不存在: $archive_path"
+        return 1
+    fi
+    
+    case "$target_format" in
+        zip|tar.gz|chunked) ;;
+        *)
+            log "不支持的目标格式: $target_format"
+            return 1
+            ;;
+    esac
+    
+    if [ "$(archive_format "$archive_name")" = "$target_format" ]; then
+        log "压缩包已是 $target_format 格式: $archive_name"
+        echo "$ARCHIVE_DIR/$archive_name"
+        return 0
+    fi
+    
+    log "转换压缩包格式: $archive_name -> $target_format"
+    local stored_before=0
+    if [ "$target_format" = "chunked" ] && [ -d "$ARCHIVE_DIR/.chunks" ]; then
+        stored_before=$(chunk_stored_bytes)
+    fi
+    
+    local new_path
+    new_path=$(python3 "$ARCHIVE_TOOL" convert "$ARCHIVE_DIR/$archive_name" "$target_format")
+    local new_name
+    new_name=$(basename "$new_path")
+    
+    # 分块格式: 压缩后大小为引用的块的存储大小，本次新增的块另记 new_size_mb
+    local compressed_size_mb
+    local new_size_mb="null"
+    if [ "$target_format" = "chunked" ]; then
+        new_path=$(archive_file_path "$new_name")
+        compressed_size_mb=$(chunked_archive_size_mb "$new_path")
+        new_size_mb=$(( ($(chunk_stored_bytes) - stored_before + 1048575) / 1048576 ))
+    else
+        compressed_size_mb=$(du -sm "$new_path" | cut -f1)
+    fi
+
+    if [ -f "$METADATA_FILE" ]; then
+        jq --arg name "$archive_name" --arg new_name "$new_name" --arg new_path "$new_path" \
+           --arg fmt "$target_format" --argjson size "$compressed_size_mb" --argjson new_size "$new_size_mb" \
+           'map(if .archive_name == $name then
+                    .archive_name = $new_name | .archive_path = $new_path | .format = $fmt
+                    | .compressed_size_mb = $size
+                    | (if $new_size == null then del(.new_size_mb) else .new_size_mb = $new_size end)
+                    | .compression_ratio = (if .original_size_mb > 0 then ($size * 10000 / .original_size_mb | floor) / 100 else 0 end)
+                else . end)' \
+           "$METADATA_FILE" > "$METADATA_FILE.tmp"
+        mv "$METADATA_FILE.tmp" "$METADATA_FILE"
+    fi
+    
+    rm -f "$archive_path" "$archive_path.index.json"
+    if [ "$(archive_format "$archive_name")" = "chunked" ]; then
+        gc_chunks
+    fi
+    log "转换完成: $new_name"
+    echo "$ARCHIVE_DIR/$new_name"
+}
+
 # 删除压缩包
 delete_archive() {
     local archive_name="$1"
-    local archive_path="$ARCHIVE_DIR/$archive_name"
-    
+    local archive_path
+    archive_path=$(archive_file_path "$archive_name")
+
     if [ ! -f "$archive_path" ]; then
         log "压缩包不存在: $archive_path"
         return 1
     fi
     
     log "删除压缩包: $archive_name"
-    rm -f "$archive_path"
-    
+    rm -f "$archive_path" "$archive_path.index.json"
+
     # 从元数据中移除
     if [ -f "$METADATA_FILE" ]; then
         jq --arg name "$archive_name" 'map(select(.archive_name != $name))' "$METADATA_FILE" > "$METADATA_FILE.tmp"
         mv "$METADATA_FILE.tmp" "$METADATA_FILE"
     fi
     
+    if [ "$(archive_format "$archive_name")" = "chunked" ]; then
+        gc_chunks
+    fi
+    
     log "压缩包已删除"
 }
 
@@ -227,11 +577,20 @@ get_storage_stats() {
     local total_archives=0
     local total_compressed_size_mb=0
     local total_original_size_mb=0
-    
+    local trim_saved_mb=0
+
+    # 分块存储的压缩包共享块，各自的大小不能直接相加，按块存储的实际占用计算
+    local chunk_stored_mb=0
+    if [ -d "$ARCHIVE_DIR/.chunks" ]; then
+        chunk_stored_mb=$(chunk_stored_bytes | jq '. / 1048576 * 100 | floor / 100')
+    fi
+
     if [ -f "$METADATA_FILE" ]; then
         total_archives=$(jq 'length' "$METADATA_FILE")
-        total_compressed_size_mb=$(jq 'map(.compressed_size_mb) | add // 0' "$METADATA_FILE")
+        total_compressed_size_mb=$(jq --argjson chunked "$chunk_stored_mb" \
+            'map(select(.format != "chunked") | .compressed_size_mb) | add // 0 | . + $chunked' "$METADATA_FILE")
         total_original_size_mb=$(jq 'map(.original_size_mb) | add // 0' "$METADATA_FILE")
+        trim_saved_mb=$(jq 'map(if .trim then .trim.before_size_mb - .trim.after_size_mb else 0 end) | add // 0 | . * 100 | round / 100' "$METADATA_FILE")
     fi
     
     local avg_compression_ratio=0
@@ -239,13 +598,27 @@ get_storage_stats() {
         avg_compression_ratio=$(echo "scale=2; $total_compressed_size_mb * 100 / $total_original_size_mb" | bc -l)
     fi
     
+    # 分块去重存储: 逻辑大小（各压缩包原始大小之和）与去重后实际占用
+    local chunk_store_stats="null"
+    if [ -d "$ARCHIVE_DIR/.chunks" ]; then
+        chunk_store_stats=$(python3 "$CHUNK_TOOL" stats "$ARCHIVE_DIR" | jq -c '{
+            archives: .archives,
+            chunks: .chunks,
+            logical_size_mb: (.logical_bytes / 1048576 * 100 | floor / 100),
+            deduplicated_size_mb: (.stored_bytes / 1048576 * 100 | floor / 100),
+            dedup_ratio: .dedup_ratio
+        }')
+    fi
+
     cat << EOF
 {
     "total_archives": $total_archives,
     "total_compressed_size_mb": $total_compressed_size_mb,
     "total_original_size_mb": $total_original_size_mb,
     "space_saved_mb": $(echo "$total_original_size_mb - $total_compressed_size_mb" | bc -l),
-    "average_compression_ratio": $avg_compression_ratio
+    "average_compression_ratio": $avg_compression_ratio,
+    "trim_saved_mb": $trim_saved_mb,
+    "chunk_store": $chunk_store_stats
 }
 EOF
 }
@@ -276,8 +649,28 @@ main() {
         "list")
             list_archives
             ;;
+        "register")
+            register_archive "$2" "$3" "${4:-0}"
+            ;;
         "extract")
-            extract_database "$2"
+            shift
+            extract_database "$@"
+            ;;
+        "members")
+            list_archive_members "$2"
+            ;;
+        "convert")
+            convert_archive "$2" "${3:-zip}"
+            ;;
+        "gc-chunks")
+            gc_chunks
+            ;;
+        "trim")
+            trim_database "$2"
+            echo "$TRIM_INFO" | jq '.'
+            ;;
+        "profile")
+            profile_database_size "$DATABASE_DIR/$2" "${3:-10}"
             ;;
         "delete")
             delete_archive "$2"
@@ -304,10 +697,28 @@ main() {
     
   list
     列出所有压缩包
-    
-  extract <archive_name>
-    解压指定的压缩包
-    
+  
+  register <archive_name> <database_name> [original_size_mb]
+    登记已放入 archives 目录的压缩包
+
+  extract <archive_name> [sub_path...]
+    解压指定的压缩包，指定子路径时只解压这些子树
+  
+  members <archive_name>
+    以JSON列出压缩包中的文件
+  
+  convert <archive_name> [zip|tar.gz|chunked]
+    转换压缩包格式（默认转换为 zip）
+  
+  gc-chunks
+    回收分块存储中不再被引用的块
+  
+  trim <database_name>
+    裁剪数据库（codeql database cleanup + 删除 DB_TRIM_PATHS），不压缩
+  
+  profile <database_name> [limit]
+    以JSON列出数据库中占用最大的目录
+
   delete <archive_name>
     删除指定的压缩包
     
@@ -329,6 +740,8 @@ main() {
 示例:
   $0 compress my_database
   $0 list
+  $0 extract my_database_20231028_120000.zip my_database/codeql-database.yml my_database/src.zip
+  $0 convert my_database_20231028_120000.tar.gz zip
   $0 delete my_database_20231028_120000.tar.gz
   $0 stats
 EOF
@@ -2,7 +2,17 @@
 
 JDK_VERSION="${JDK_VERSION:-17}"
 JDK_FULL_VERSION="${JDK_FULL_VERSION}"
-SOURCE_DIR="/app/source"
+SOURCE_DIR="${JDK_SOURCE_DIR:-/app/source}"
+
+# 解析出的 tag 缓存一段时间，避免每次构建都 git ls-remote
+TAG_CACHE_DIR="${JDK_TAG_CACHE_DIR:-${CACHE_DIR:-/app/cache}/jdk-tags}"
+TAG_CACHE_TTL="${JDK_TAG_CACHE_TTL:-86400}"
+
+# resolve-tag: 只解析并输出 tag，不下载（预热使用）
+RESOLVE_ONLY=false
+if [ "${1:-}" = "resolve-tag" ]; then
+    RESOLVE_ONLY=true
+fi
 
 # 检查主版本号是否有效
 if [[ ! "$JDK_VERSION" =~ ^(8|11|17|21)$ ]]; then
@@ -10,13 +20,6 @@ if [[ ! "$JDK_VERSION" =~ ^(8|11|17|21)$ ]]; then
     exit 1
 fi
 
-# 清空源码目录
-rm -rf "${SOURCE_DIR:?}"/*
-
-# 创建临时目录
-TMP_DIR=$(mktemp -d)
-cd "$TMP_DIR" || exit 1
-
 # 获取版本信息的函数
 get_latest_tag() {
     local repo=$1
@@ -46,53 +49,71 @@ fuzzy_match_tag() {
       head -n 1
 }
 
-echo "Downloading OpenJDK $JDK_VERSION source code..."
+# 读取缓存的 tag（未过期时）
+read_cached_tag() {
+    local cache_file="$TAG_CACHE_DIR/${JDK_VERSION}_${JDK_FULL_VERSION:-latest}"
+    if [ -f "$cache_file" ] && [ $(( $(date +%s) - $(stat -c %Y "$cache_file") )) -lt "$TAG_CACHE_TTL" ]; then
+        cat "$cache_file"
+    fi
+}
+
+save_cached_tag() {
+    mkdir -p "$TAG_CACHE_DIR" 2>/dev/null || return 0
+    echo "$1" > "$TAG_CACHE_DIR/${JDK_VERSION}_${JDK_FULL_VERSION:-latest}" 2>/dev/null || true
+}
 
-# 根据版本选择下载地址
+# 根据版本选择仓库
 case "$JDK_VERSION" in
-    "8")
-        REPO="adoptium/jdk8u"
-        if [ -n "$JDK_FULL_VERSION" ]; then
-            TAG=$(fuzzy_match_tag "$REPO" "jdk" "$JDK_FULL_VERSION" "-b[0-9]+")
-        fi
-        # 回退到最新匹配
-        if [ -z "$TAG" ]; then
-            TAG=$(get_latest_tag "$REPO" "jdk8u[0-9]+-b[0-9]+$")
-        fi
-        git clone --depth 1 -b "$TAG" "https://github.com/$REPO.git" "$SOURCE_DIR"
-        ;;
-    "11")
-        REPO="openjdk/jdk11u"
-        if [ -n "$JDK_FULL_VERSION" ]; then
-            TAG=$(fuzzy_match_tag "$REPO" "jdk-" "$JDK_FULL_VERSION" "\\+[0-9]+")
-        fi
-        if [ -z "$TAG" ]; then
-            TAG=$(get_latest_tag "$REPO" "jdk-11\\.[0-9]+\\.[0-9]+\\+[0-9]+$")
-        fi
-        git clone --depth 1 -b "$TAG" "https://github.com/$REPO.git" "$SOURCE_DIR"
-        ;;
-    "17")
-        REPO="openjdk/jdk17u"
-        if [ -n "$JDK_FULL_VERSION" ]; then
-            TAG=$(fuzzy_match_tag "$REPO" "jdk-" "$JDK_FULL_VERSION" "\\+[0-9]+")
-        fi
-        if [ -z "$TAG" ]; then
-            TAG=$(get_latest_tag "$REPO" "jdk-17\\.[0-9]+\\.[0-9]+\\+[0-9]+$")
-        fi
-        git clone --depth 1 -b "$TAG" "https://github.com/$REPO.git" "$SOURCE_DIR"
-        ;;
-    "21")
-        REPO="openjdk/jdk21u"
-        if [ -n "$JDK_FULL_VERSION" ]; then
-            TAG=$(fuzzy_match_tag "$REPO" "jdk-" "$JDK_FULL_VERSION" "\\+[0-9]+")
-        fi
-        if [ -z "$TAG" ]; then
-            TAG=$(get_latest_tag "$REPO" "jdk-21\\.[0-9]+\\.[0-9]+\\+[0-9]+$")
-        fi
-        git clone --depth 1 -b "$TAG" "https://github.com/$REPO.git" "$SOURCE_DIR"
-        ;;
+    "8") REPO="adoptium/jdk8u" ;;
+    "11") REPO="openjdk/jdk11u" ;;
+    "17") REPO="openjdk/jdk17u" ;;
+    "21") REPO="openjdk/jdk21u" ;;
 esac
 
+TAG=$(read_cached_tag)
+if [ -z "$TAG" ]; then
+    case "$JDK_VERSION" in
+        "8")
+            if [ -n "$JDK_FULL_VERSION" ]; then
+                TAG=$(fuzzy_match_tag "$REPO" "jdk" "$JDK_FULL_VERSION" "-b[0-9]+")
+            fi
+            # 回退到最新匹配
+            if [ -z "$TAG" ]; then
+                TAG=$(get_latest_tag "$REPO" "jdk8u[0-9]+-b[0-9]+$")
+            fi
+            ;;
+        *)
+            if [ -n "$JDK_FULL_VERSION" ]; then
+                TAG=$(fuzzy_match_tag "$REPO" "jdk-" "$JDK_FULL_VERSION" "\\+[0-9]+")
+            fi
+            if [ -z "$TAG" ]; then
+                TAG=$(get_latest_tag "$REPO" "jdk-${JDK_VERSION}\\.[0-9]+\\.[0-9]+\\+[0-9]+$")
+            fi
+            ;;
+    esac
+    if [ -z "$TAG" ]; then
+        echo "Error: Failed to resolve a tag for OpenJDK $JDK_VERSION ${JDK_FULL_VERSION}"
+        exit 1
+    fi
+    save_cached_tag "$TAG"
+fi
+
+if $RESOLVE_ONLY; then
+    echo "$TAG"
+    exit 0
+fi
+
+echo "Downloading OpenJDK $JDK_VERSION source code ($REPO $TAG)..."
+
+# 清空源码目录
+rm -rf "${SOURCE_DIR:?}"/*
+
+# 创建临时目录
+TMP_DIR=$(mktemp -d)
+cd "$TMP_DIR" || exit 1
+
+git clone --depth 1 -b "$TAG" "https://github.com/$REPO.git" "$SOURCE_DIR"
+
 if [ $? -eq 0 ]; then
     echo "Successfully downloaded OpenJDK $JDK_VERSION source code"
     
@@ -4,8 +4,9 @@ set -euo pipefail
 # CodeQL Database Builder - Boot JDK 管理器
 # 支持检测、选择和管理多个Boot JDK版本
 
-BOOTJDK_DIR="/app/bootjdk"
-METADATA_FILE="/app/bootjdk/.jdk_metadata.json"
+BOOTJDK_DIR="${BOOTJDK_DIR:-/app/bootjdk}"
+METADATA_FILE="$BOOTJDK_DIR/.jdk_metadata.json"
+BOOTJDK_EXTRACTOR="${BOOTJDK_EXTRACTOR:-/app/web/bootjdk_extractor.py}"
 
 # 日志函数
 log() {
@@ -71,25 +72,13 @@ scan_boot_jdks() {
     
     local jdks=()
     
-    # 检查是否有压缩包需要解压
-    for archive in "$BOOTJDK_DIR"/*.tar.gz "$BOOTJDK_DIR"/*.tgz; do
-        if [ -f "$archive" ]; then
-            local basename=$(basename "$archive" .tar.gz)
-            basename=$(basename "$basename" .tgz)
-            local extract_dir="$BOOTJDK_DIR/${basename}_extracted"
-            
-            if [ ! -d "$extract_dir" ]; then
-                log "解压JDK压缩包: $archive"
-                mkdir -p "$extract_dir"
-                tar -xzf "$archive" -C "$extract_dir" --strip-components=1 2>/dev/null || {
-                    tar -xzf "$archive" -C "$extract_dir"
-                }
-            fi
-        fi
-    done
+    # 解压尚未解压的压缩包（与 Web 启动共用解压服务，已解压的按标记跳过）
+    if compgen -G "$BOOTJDK_DIR/*.tar.gz" >/dev/null || compgen -G "$BOOTJDK_DIR/*.tgz" >/dev/null; then
+        python3 "$BOOTJDK_EXTRACTOR" --bootjdk-dir "$BOOTJDK_DIR" extract >&2 || log "部分JDK压缩包解压失败"
+    fi
     
-    # 扫描所有JDK目录
-    for jdk_dir in "$BOOTJDK_DIR"/*; do
+    # 扫描所有JDK目录（直接放置的目录和 _extracted/<摘要>/ 下的解压结果）
+    for jdk_dir in "$BOOTJDK_DIR"/* "$BOOTJDK_DIR"/_extracted/*/*; do
         if [ -d "$jdk_dir" ] && [ -f "$jdk_dir/bin/java" ]; then
             local jdk_info
             if jdk_info=$(get_jdk_info "$jdk_dir"); then
@@ -79,77 +79,137 @@ is_multimodule_project() {
     esac
 }
 
-# 生成Maven构建配置
-generate_maven_build() {
-    local project_dir="$1"
-    local has_kotlin="$2"
-    local is_multimodule="$3"
-    
+# 依赖缓存相关的Ant属性（DEPS_* 由 cache-manager.sh prepare_dependency_cache 导出）
+generate_dependency_properties() {
     cat << 'EOF'
-<project name="codeql-build-maven" basedir="." default="build">
-    <property name="user.dir" value="user-source"/>
-    <property name="build.dir" value="build_classes"/>
     
-    <!-- Maven构建任务 -->
-    <target name="build" description="Build Maven project">
-        <mkdir dir="${build.dir}"/>
-        
-        <!-- 使用Maven进行构建 -->
-        <exec executable="mvn" dir="${user.dir}" failonerror="false">
+    <!-- 依赖缓存: 预解析成功时 DEPS_OFFLINE=true，跟踪中的编译以离线模式运行 -->
+    <property environment="env"/>
+    <condition property="m2.repo" value="${env.DEPS_M2_REPO}" else="${user.home}/.m2/repository">
+        <isset property="env.DEPS_M2_REPO"/>
+    </condition>
+    <condition property="gradle.home" value="${env.DEPS_GRADLE_HOME}" else="${user.home}/.gradle">
+        <isset property="env.DEPS_GRADLE_HOME"/>
+    </condition>
+    <condition property="deps.offline">
+        <equals arg1="${env.DEPS_OFFLINE}" arg2="true"/>
+    </condition>
+EOF
+}
+
+# Maven编译参数（离线编译和联网重试共用）
+generate_maven_args() {
+    local has_kotlin="$1"
+    local is_multimodule="$2"
+    
+    # 保留 clean: 已是最新的类不会重新编译，CodeQL 就跟踪不到 javac 调用
+    cat << 'EOF'
+            <arg value="-B"/>
+            <arg value="-Dmaven.repo.local=${m2.repo}"/>
             <arg value="clean"/>
             <arg value="compile"/>
 EOF
-
+    
     if [ "$has_kotlin" = "true" ]; then
         cat << 'EOF'
             <arg value="-Dkotlin.compiler.incremental=false"/>
 EOF
     fi
-
+    
     if [ "$is_multimodule" = "true" ]; then
         cat << 'EOF'
             <arg value="-pl"/>
             <arg value="!integration-tests"/>
 EOF
     fi
+}
 
+# 生成Maven构建配置
+generate_maven_build() {
+    local project_dir="$1"
+    local has_kotlin="$2"
+    local is_multimodule="$3"
+    
+    cat << 'EOF'
+<project name="codeql-build-maven" basedir="." default="build">
+    <property name="user.dir" value="user-source"/>
+    <property name="build.dir" value="build_classes"/>
+EOF
+    generate_dependency_properties
+    cat << 'EOF'
+    
+    <!-- Maven构建任务 -->
+    <target name="build" description="Build Maven project">
+        <mkdir dir="${build.dir}"/>
+        
+        <!-- 使用Maven进行构建（依赖已预解析时离线） -->
+        <condition property="mvn.mode.args" value="--offline" else="">
+            <isset property="deps.offline"/>
+        </condition>
+        <exec executable="mvn" dir="${user.dir}" failonerror="false" resultproperty="mvn.result">
+            <arg line="${mvn.mode.args}"/>
+EOF
+    generate_maven_args "$has_kotlin" "$is_multimodule"
     cat << 'EOF'
         </exec>
+        <condition property="mvn.ok">
+            <equals arg1="${mvn.result}" arg2="0"/>
+        </condition>
+        <antcall target="build-online"/>
         
         <!-- 复制编译结果 -->
         <copy todir="${build.dir}" failonerror="false">
             <fileset dir="${user.dir}/target/classes" erroronmissingdir="false"/>
         </copy>
-        
-        <!-- 处理多模块项目 -->
 EOF
-
+    
     if [ "$is_multimodule" = "true" ]; then
         cat << 'EOF'
-        <exec executable="find" outputproperty="module.targets">
-            <arg value="${user.dir}"/>
-            <arg value="-name"/>
-            <arg value="target"/>
-            <arg value="-type"/>
-            <arg value="d"/>
-        </exec>
         
-        <for list="${module.targets}" param="target.dir" delimiter="${line.separator}">
-            <sequential>
-                <copy todir="${build.dir}" failonerror="false">
-                    <fileset dir="@{target.dir}/classes" erroronmissingdir="false"/>
-                </copy>
-            </sequential>
-        </for>
+        <!-- 处理多模块项目: 各模块的 target/classes 合并到 build.dir -->
+        <copy todir="${build.dir}" failonerror="false">
+            <fileset dir="${user.dir}" includes="**/target/classes/**" excludes="target/classes/**"/>
+            <regexpmapper from="^(.*/)?target/classes/(.*)$$" to="\2" handledirsep="true"/>
+        </copy>
 EOF
     fi
-
+    
+    cat << 'EOF'
+    </target>
+    
+    <!-- 离线编译失败时（缓存中缺少依赖）联网重试 -->
+    <target name="build-online" if="deps.offline" unless="mvn.ok">
+        <echo message="Offline Maven build failed, retrying online"/>
+        <exec executable="mvn" dir="${user.dir}" failonerror="false">
+EOF
+    generate_maven_args "$has_kotlin" "$is_multimodule"
     cat << 'EOF'
+        </exec>
     </target>
 </project>
 EOF
 }
 
+# Gradle编译参数（离线编译和联网重试共用）
+generate_gradle_args() {
+    local has_kotlin="$1"
+    
+    # 保留 clean（原因同 Maven）；--no-daemon 保证编译发生在被跟踪的进程中
+    cat << 'EOF'
+            <arg value="--no-daemon"/>
+            <arg value="--gradle-user-home"/>
+            <arg value="${gradle.home}"/>
+            <arg value="clean"/>
+            <arg value="compileJava"/>
+EOF
+    
+    if [ "$has_kotlin" = "true" ]; then
+        cat << 'EOF'
+            <arg value="compileKotlin"/>
+EOF
+    fi
+}
+
 # 生成Gradle构建配置
 generate_gradle_build() {
     local project_dir="$1"
@@ -160,56 +220,58 @@ generate_gradle_build() {
 <project name="codeql-build-gradle" basedir="." default="build">
     <property name="user.dir" value="user-source"/>
     <property name="build.dir" value="build_classes"/>
+EOF
+    generate_dependency_properties
+    cat << 'EOF'
     
     <!-- Gradle构建任务 -->
     <target name="build" description="Build Gradle project">
         <mkdir dir="${build.dir}"/>
         
-        <!-- 使用Gradle进行构建 -->
-        <exec executable="./gradlew" dir="${user.dir}" failonerror="false">
-            <arg value="clean"/>
-            <arg value="compileJava"/>
-EOF
-
-    if [ "$has_kotlin" = "true" ]; then
-        cat << 'EOF'
-            <arg value="compileKotlin"/>
+        <!-- 使用Gradle进行构建（依赖已预解析时离线） -->
+        <condition property="gradle.mode.args" value="--offline" else="">
+            <isset property="deps.offline"/>
+        </condition>
+        <exec executable="./gradlew" dir="${user.dir}" failonerror="false" resultproperty="gradle.result">
+            <arg line="${gradle.mode.args}"/>
 EOF
-    fi
-
+    generate_gradle_args "$has_kotlin"
     cat << 'EOF'
         </exec>
+        <condition property="gradle.ok">
+            <equals arg1="${gradle.result}" arg2="0"/>
+        </condition>
+        <antcall target="build-online"/>
         
         <!-- 复制编译结果 -->
         <copy todir="${build.dir}" failonerror="false">
             <fileset dir="${user.dir}/build/classes" erroronmissingdir="false"/>
         </copy>
-        
 EOF
-
+    
     if [ "$is_multimodule" = "true" ]; then
         cat << 'EOF'
-        <!-- 处理多模块项目 -->
-        <exec executable="find" outputproperty="module.builds">
-            <arg value="${user.dir}"/>
-            <arg value="-name"/>
-            <arg value="build"/>
-            <arg value="-type"/>
-            <arg value="d"/>
-        </exec>
         
-        <for list="${module.builds}" param="build.dir.path" delimiter="${line.separator}">
-            <sequential>
-                <copy todir="${build.dir}" failonerror="false">
-                    <fileset dir="@{build.dir.path}/classes" erroronmissingdir="false"/>
-                </copy>
-            </sequential>
-        </for>
+        <!-- 处理多模块项目: 各子项目的 build/classes 合并到 build.dir -->
+        <copy todir="${build.dir}" failonerror="false">
+            <fileset dir="${user.dir}" includes="**/build/classes/**" excludes="build/classes/**"/>
+            <regexpmapper from="^(.*/)?build/classes/(.*)$$" to="\2" handledirsep="true"/>
+        </copy>
 EOF
     fi
-
+    
     cat << 'EOF'
     </target>
+    
+    <!-- 离线编译失败时（缓存中缺少依赖）联网重试 -->
+    <target name="build-online" if="deps.offline" unless="gradle.ok">
+        <echo message="Offline Gradle build failed, retrying online"/>
+        <exec executable="./gradlew" dir="${user.dir}" failonerror="false">
+EOF
+    generate_gradle_args "$has_kotlin"
+    cat << 'EOF'
+        </exec>
+    </target>
 </project>
 EOF
 }
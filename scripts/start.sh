@@ -34,9 +34,18 @@ if [ "${WEB_UI_ENABLED:-false}" = "true" ]; then
   echo ""
 fi
 
+# 启动分布式构建Worker（如果启用）
+if [ "${WORKER_MODE:-false}" = "true" ]; then
+  echo "Starting build worker, coordinator: ${COORDINATOR_URL:-http://localhost:8080}"
+  cd /app/web && python3 build_worker.py &
+  WORKER_PID=$!
+  echo "Build worker started with PID: $WORKER_PID"
+  echo ""
+fi
+
 # 清理过期缓存
 echo "Cleaning up expired cache..."
-bash /app/scripts/cache-manager.sh cleanup 30 10
+bash /app/scripts/cache-manager.sh cleanup 30 "${CACHE_MAX_SIZE_GB:-10}"
 
 if [ "${AUTO_BUILD}" = "true" ]; then
   echo "Starting database build automatically..."
@@ -55,6 +64,9 @@ fi
 if [ "${WEB_UI_ENABLED:-false}" = "true" ]; then
   echo "Container will keep running with Web UI..."
   wait $WEB_PID
+elif [ "${WORKER_MODE:-false}" = "true" ]; then
+  echo "Container will keep running as build worker..."
+  wait $WORKER_PID
 else
   echo "Build process completed. Container will exit."
 fi
\ No newline at end of file
@@ -19,19 +19,42 @@ from werkzeug.utils import secure_filename
 import zipfile
 import shutil
 import signal
-import tarfile
-import glob
+import uuid
+import hashlib
 from codeql_manager import CodeQLManager
+from bootjdk_extractor import BootJdkExtractor
+import archive_index
+import chunk_store
+from build_worker import build_environment
+import build_matrix
+from log_index import LogIndex
+from prewarmer import Prewarmer
 
 app = Flask(__name__)
 app.secret_key = 'codeql_builder_secret_key'
 
 # 路径配置
-BASE_DIR = Path('/app')
+BASE_DIR = Path(os.getenv('APP_BASE_DIR', '/app'))
 DATA_DIR = BASE_DIR / 'data'
 BOOTJDK_DIR = BASE_DIR / 'bootjdk'
 DB_PATH = BASE_DIR / 'web' / 'build_history.db'
 LOG_DIR = BASE_DIR / 'logs'
+ARCHIVE_DIR = BASE_DIR / 'database' / 'archives'
+USER_SOURCE_DIR = BASE_DIR / 'user-source'
+MATRIX_WORK_DIR = Path(os.getenv('MATRIX_WORK_DIR', str(BASE_DIR / 'matrix')))
+# 分布式任务入队时保存的用户源码快照，由租用任务的 Worker 下载
+WORKER_JOB_DIR = BASE_DIR / 'worker-jobs'
+
+# 构建执行方式: local（Web进程内执行）| distributed（入队，由 build_worker.py 租用执行）
+BUILD_EXECUTOR = os.getenv('BUILD_EXECUTOR', 'local')
+WORKER_LEASE_TTL = int(os.getenv('WORKER_LEASE_TTL', '60'))
+WORKER_MAX_ATTEMPTS = int(os.getenv('WORKER_MAX_ATTEMPTS', '3'))
+LOG_ROTATE_DAYS = int(os.getenv('LOG_ROTATE_DAYS', '7'))
+
+# 压缩包下载交给前置服务器用 sendfile 发送: USE_X_SENDFILE=true（Apache/lighttpd 的 X-Sendfile），
+# 或 X_ACCEL_REDIRECT_PREFIX 为 nginx 中指向 archives 目录的 internal location（X-Accel-Redirect）
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', 'false') == 'true'
+X_ACCEL_REDIRECT_PREFIX = os.getenv('X_ACCEL_REDIRECT_PREFIX', '')
 
 # 确保目录存在
 LOG_DIR.mkdir(exist_ok=True)
@@ -48,75 +71,42 @@ logging.basicConfig(
     ]
 )
 
-def extract_boot_jdk_on_startup():
-    """在Web应用启动时解压Boot JDK压缩包"""
+def refresh_boot_jdk_metadata():
+    """Boot JDK 解压完成后刷新 jdk-manager.sh 的元数据"""
     try:
-        # 查找Boot JDK压缩包
-        archive_patterns = [
-            str(BOOTJDK_DIR / "*.tar.gz"),
-            str(BOOTJDK_DIR / "*.tgz")
-        ]
-        
-        archives = []
-        for pattern in archive_patterns:
-            archives.extend(glob.glob(pattern))
-        
-        if not archives:
-            logging.info("No Boot JDK archives found in /app/bootjdk")
-            return
-        
-        extract_dir = BOOTJDK_DIR / "_extracted"
-        
-        for archive_path in archives:
-            archive_name = os.path.basename(archive_path)
-            logging.info(f"Found Boot JDK archive: {archive_name}")
-            
-            # 检查是否已经解压过
-            if extract_dir.exists() and any(extract_dir.iterdir()):
-                logging.info("Boot JDK already extracted, skipping extraction")
-                # 删除压缩文件
-                try:
-                    os.remove(archive_path)
-                    logging.info(f"Deleted archive file: {archive_name}")
-                except Exception as e:
-                    logging.error(f"Failed to delete archive {archive_name}: {str(e)}")
-                continue
-            
-            # 创建解压目录
-            extract_dir.mkdir(exist_ok=True)
-            
-            # 解压压缩包
-            logging.info(f"Extracting Boot JDK archive: {archive_name}")
-            try:
-                with tarfile.open(archive_path, 'r:gz') as tar:
-                    tar.extractall(path=extract_dir)
-                logging.info(f"Successfully extracted {archive_name}")
-                
-                # 解压成功后删除压缩文件
-                os.remove(archive_path)
-                logging.info(f"Deleted archive file: {archive_name}")
-                
-            except Exception as e:
-                logging.error(f"Failed to extract {archive_name}: {str(e)}")
-                # 如果解压失败，清理可能的部分解压文件
-                if extract_dir.exists():
-                    shutil.rmtree(extract_dir, ignore_errors=True)
-                
+        subprocess.run(['/app/scripts/jdk-manager.sh', 'scan'], capture_output=True, text=True, check=True)
     except Exception as e:
-        logging.error(f"Error during Boot JDK extraction: {str(e)}")
+        logging.error(f"Failed to refresh Boot JDK metadata: {str(e)}")
 
-# 在Web应用启动时执行Boot JDK解压
-extract_boot_jdk_on_startup()
+# Boot JDK 压缩包在后台线程中并行解压，不阻塞 Web 服务启动；
+# 构建选中尚未解压的压缩包时由 _run_build 按需等待
+boot_jdk_extractor = BootJdkExtractor(BOOTJDK_DIR)
+boot_jdk_extractor.start_background(on_complete=refresh_boot_jdk_metadata)
 
 # 初始化CodeQL管理器
-codeql_manager = CodeQLManager()
+codeql_manager = CodeQLManager(BASE_DIR)
+
+# 构建日志全文索引（日志写入时同步建立）
+log_index = LogIndex(LOG_DIR)
+
+class LeaseError(Exception):
+    """Worker 不再持有任务租约"""
+
 
 class BuildManager:
-    def __init__(self):
+    def __init__(self, executor='local'):
         self.current_builds = {}
         self.build_processes = {}  # 存储构建进程
+        self.groups = {}  # 构建矩阵（构建组）状态
+        self.executor = executor
+        self.job_lock = threading.Lock()
         self.init_database()
-    
+        
+        if self.executor == 'distributed':
+            reaper_thread = threading.Thread(target=self._reap_expired_leases)
+            reaper_thread.daemon = True
+            reaper_thread.start()
+
     def init_database(self):
         """初始化数据库"""
         conn = sqlite3.connect(DB_PATH)
@@ -142,13 +132,41 @@ class BuildManager:
             )
         ''')
         
+        # 创建分布式构建任务队列表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS build_jobs (
+                build_id TEXT PRIMARY KEY,
+                config TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker_id TEXT,
+                lease_expires REAL,
+                attempts INTEGER DEFAULT 0,
+                created_time REAL NOT NULL,
+                updated_time REAL
+            )
+        ''')
+        
+        # 创建构建组（构建矩阵）表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS build_groups (
+                group_id TEXT PRIMARY KEY,
+                spec TEXT NOT NULL,
+                build_ids TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_time REAL NOT NULL,
+                end_time REAL,
+                error_message TEXT
+            )
+        ''')
+
         conn.commit()
         conn.close()
-    
-    def start_build(self, config):
-        """启动构建任务"""
-        build_id = f"build_{int(time.time())}"
-        
+
+    def start_build(self, config, group_id=None):
+        """启动构建任务；属于构建组的任务只登记，由 _run_group 调度执行"""
+        # 同一秒内可能创建多个任务（构建矩阵），加随机后缀避免 build_id 冲突
+        build_id = f"build_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+
         # 记录构建开始
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
@@ -164,19 +182,26 @@ class BuildManager:
             config['db_name'],
             config.get('boot_jdk_path', ''),
             config['db_name'],
-            'running'
+            'queued' if self.executor == 'distributed' or group_id else 'running'
         ))
         conn.commit()
         conn.close()
         
+        if self.executor == 'distributed':
+            return self._enqueue_build(build_id, config)
+        
         # 初始化构建状态
         self.current_builds[build_id] = {
-            'status': 'running',
+            'status': 'queued' if group_id else 'running',
             'progress': 0,
             'start_time': datetime.now(),
             'config': config
         }
         
+        if group_id:
+            self.current_builds[build_id]['group_id'] = group_id
+            return build_id
+
         # 启动构建线程
         build_thread = threading.Thread(target=self._run_build, args=(build_id, config))
         build_thread.daemon = True
@@ -188,7 +213,26 @@ class BuildManager:
         """停止构建任务"""
         if build_id not in self.current_builds:
             return False
-            
+        
+        if self.executor == 'distributed':
+            # 由Worker在下次心跳时终止构建
+            conn = sqlite3.connect(DB_PATH)
+            cursor = conn.cursor()
+            # 已结束的任务不再改写
+            cursor.execute('''
+                UPDATE build_jobs SET status = ?, updated_time = ?
+                WHERE build_id = ? AND status IN ('queued', 'leased', 'running')
+            ''', ('stopped', time.time(), build_id))
+            stopped = cursor.rowcount > 0
+            conn.commit()
+            conn.close()
+            if not stopped:
+                return False
+            # 排队中被停止的任务不会再经过 _finish_build，这里删除用户源码快照
+            snapshot = self.user_source_snapshot(build_id)
+            if snapshot.exists():
+                snapshot.unlink()
+        
         if build_id in self.build_processes:
             try:
                 process = self.build_processes[build_id]
@@ -221,20 +265,499 @@ class BuildManager:
         
         return True
     
-    def _run_build(self, build_id, config):
-        """执行构建任务"""
+    def start_group(self, spec):
+        """构建矩阵：展开为一组构建，共享准备工作后并发执行，返回 (group_id, build_ids)"""
+        variants = build_matrix.expand_matrix(spec)
+        group_id = f"group_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+        build_ids = [self.start_build(variant, group_id=group_id) for variant in variants]
+        
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO build_groups (group_id, spec, build_ids, status, created_time)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (group_id, json.dumps(spec), json.dumps(build_ids),
+              'queued' if self.executor == 'distributed' else 'preparing', time.time()))
+        conn.commit()
+        conn.close()
+        
+        self.groups[group_id] = {
+            'status': 'queued' if self.executor == 'distributed' else 'preparing',
+            'build_ids': build_ids,
+            'start_time': datetime.now()
+        }
+        
+        # 分布式模式下各变体已入队，由各Worker执行（准备工作在Worker上通过共享缓存复用）
+        if self.executor != 'distributed':
+            group_thread = threading.Thread(target=self._run_group, args=(group_id, spec, build_ids))
+            group_thread.daemon = True
+            group_thread.start()
+        
+        return group_id, build_ids
+    
+    def _run_group(self, group_id, spec, build_ids):
+        """执行构建组：共享准备 -> 在并发上限内为每个变体准备工作目录并构建"""
+        work_dir = MATRIX_WORK_DIR / group_id
+        log_file = LOG_DIR / f'{group_id}.log'
+        variants = [self.current_builds[build_id]['config'] for build_id in build_ids]
+        
         try:
-            # 设置环境变量
-            env = os.environ.copy()
-            env.update({
-                'JDK_VERSION': config['jdk_version'],
-                'JDK_FULL_VERSION': config.get('jdk_full_version', ''),
-                'BUILD_MODE': config['build_mode'],
-                'DB_NAME': config['db_name']
+            shared_env = build_matrix.prepare_shared(variants, USER_SOURCE_DIR, work_dir, log_file)
+        except Exception as e:
+            logging.error(f"Build group {group_id} preparation failed: {str(e)}")
+            for build_id in build_ids:
+                self._finish_build(build_id, 'failed', f'构建组准备失败: {str(e)}')
+            self._finish_group(group_id, 'failed', str(e))
+            shutil.rmtree(work_dir, ignore_errors=True)
+            return
+        
+        threads = []
+        try:
+            self.groups[group_id]['status'] = 'running'
+            parallel = build_matrix.max_parallel_for(spec)
+            slots = threading.Semaphore(parallel)
+            
+            for build_id, config in zip(build_ids, variants):
+                slots.acquire()
+                if self.current_builds[build_id]['status'] == 'stopped':
+                    slots.release()
+                    continue
+                
+                try:
+                    env = build_matrix.prepare_workdir(work_dir, config, USER_SOURCE_DIR, parallel)
+                except Exception as e:
+                    slots.release()
+                    self._finish_build(build_id, 'failed', f'工作目录准备失败: {str(e)}')
+                    continue
+                config['env'] = dict(shared_env, **env)
+                
+                self.current_builds[build_id]['status'] = 'running'
+                self._set_history_status(build_id, 'running')
+                thread = threading.Thread(target=self._run_group_variant,
+                                          args=(build_id, config, slots, work_dir))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+            
+            for thread in threads:
+                thread.join()
+            
+            statuses = [self.current_builds[build_id]['status'] for build_id in build_ids]
+            self._finish_group(group_id, self._group_result(statuses))
+        except Exception as e:
+            logging.error(f"Build group {group_id} failed: {str(e)}")
+            # 已启动的变体照常结束，尚未启动的标记为失败
+            for thread in threads:
+                thread.join()
+            for build_id in build_ids:
+                if self.current_builds[build_id]['status'] == 'queued':
+                    self._finish_build(build_id, 'failed', f'构建组执行失败: {str(e)}')
+            self._finish_group(group_id, 'failed', str(e))
+        finally:
+            # 准备阶段日志由脚本直接写入，结束后补建索引
+            if log_file.exists():
+                log_index.index_file(group_id)
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    @staticmethod
+    def _group_result(statuses):
+        """根据各变体的最终状态得出构建组结果"""
+        if all(status == 'success' for status in statuses):
+            return 'success'
+        if any(status == 'success' for status in statuses):
+            return 'partial'
+        if all(status == 'stopped' for status in statuses):
+            return 'stopped'
+        return 'failed'
+    
+    def _run_group_variant(self, build_id, config, slots, work_dir):
+        try:
+            self._run_build(build_id, config)
+        finally:
+            # 变体的JDK源码副本和构建输出有数 GB，数据库已在 DATABASE_DIR 中，构建结束即删除
+            shutil.rmtree(work_dir / config['db_name'], ignore_errors=True)
+            slots.release()
+    
+    def _set_history_status(self, build_id, status):
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute('UPDATE build_history SET status = ? WHERE build_id = ?', (status, build_id))
+        conn.commit()
+        conn.close()
+    
+    def _finish_group(self, group_id, status, error_message=None):
+        if group_id in self.groups:
+            self.groups[group_id]['status'] = status
+        
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE build_groups SET status = ?, end_time = ?, error_message = ?
+            WHERE group_id = ?
+        ''', (status, time.time(), error_message, group_id))
+        conn.commit()
+        conn.close()
+    
+    def stop_group(self, group_id):
+        """停止构建组中所有未结束的构建"""
+        group = self.get_group(group_id)
+        if group is None:
+            return False
+        
+        for build in group['builds']:
+            build_id = build['build_id']
+            if build['status'] in ('queued', 'running') and build_id in self.current_builds:
+                if build_id in self.build_processes or self.executor == 'distributed':
+                    self.stop_build(build_id)
+                else:
+                    self.current_builds[build_id]['status'] = 'stopped'
+                    self._finish_build(build_id, 'stopped')
+        return True
+    
+    def get_group(self, group_id):
+        """构建组状态：各变体的状态/进度和汇总进度"""
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute('SELECT spec, build_ids, status, created_time, end_time, error_message '
+                       'FROM build_groups WHERE group_id = ?', (group_id,))
+        row = cursor.fetchone()
+        if row is None:
+            conn.close()
+            return None
+        
+        build_ids = json.loads(row[1])
+        placeholders = ','.join('?' * len(build_ids))
+        cursor.execute(f'''
+            SELECT build_id, jdk_version, jdk_full_version, build_mode, db_name, status, duration, compressed
+            FROM build_history WHERE build_id IN ({placeholders})
+        ''', build_ids)
+        history = {r[0]: r for r in cursor.fetchall()}
+        conn.close()
+        
+        builds = []
+        for build_id in build_ids:
+            record = history.get(build_id)
+            if record is None:
+                continue
+            live = self.current_builds.get(build_id, {})
+            status = live.get('status', record[5])
+            builds.append({
+                'build_id': build_id,
+                'jdk_version': record[1],
+                'jdk_full_version': record[2],
+                'build_mode': record[3],
+                'db_name': record[4],
+                'status': status,
+                'progress': live.get('progress', 100 if status == 'success' else 0),
+                'duration': record[6],
+                'compressed': bool(record[7]),
+                'error': live.get('error')
             })
+        
+        status = self.groups.get(group_id, {}).get('status', row[2])
+        if status == 'queued':
+            # 分布式模式下由各Worker执行，组状态按变体状态汇总
+            statuses = [b['status'] for b in builds]
+            if all(s not in ('queued', 'running') for s in statuses):
+                status = self._group_result(statuses)
+            elif 'running' in statuses:
+                status = 'running'
+        
+        return {
+            'group_id': group_id,
+            'status': status,
+            'spec': json.loads(row[0]),
+            'created_time': row[3],
+            'end_time': row[4],
+            'error': row[5],
+            'progress': int(sum(b['progress'] for b in builds) / len(builds)) if builds else 0,
+            'summary': {s: sum(1 for b in builds if b['status'] == s)
+                        for s in sorted({b['status'] for b in builds})},
+            'builds': builds
+        }
+    
+    def _update_progress(self, build_id, line):
+        """根据日志内容简单估算构建进度"""
+        if build_id not in self.current_builds:
+            return
+        
+        if 'Downloading' in line:
+            self.current_builds[build_id]['progress'] = 20
+        elif 'Compiling' in line:
+            self.current_builds[build_id]['progress'] = 50
+        elif 'Creating database' in line:
+            self.current_builds[build_id]['progress'] = 80
+        elif 'Build completed' in line:
+            self.current_builds[build_id]['progress'] = 100
+    
+    def _finish_build(self, build_id, status, error_message=None):
+        """记录构建结束状态"""
+        snapshot = self.user_source_snapshot(build_id)
+        if snapshot.exists():
+            snapshot.unlink()
+        
+        if build_id in self.current_builds:
+            self.current_builds[build_id]['status'] = status
+            if status == 'success':
+                self.current_builds[build_id]['progress'] = 100
+            if error_message:
+                self.current_builds[build_id]['error'] = error_message
+        
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE build_history
+            SET status = ?, end_time = CURRENT_TIMESTAMP, error_message = ?,
+                duration = (julianday(CURRENT_TIMESTAMP) - julianday(start_time)) * 86400
+            WHERE build_id = ?
+        ''', (status, error_message, build_id))
+        conn.commit()
+        conn.close()
+    
+    @staticmethod
+    def user_source_snapshot(build_id):
+        return WORKER_JOB_DIR / f'{build_id}.user-source.tar.gz'
+    
+    def _snapshot_user_source(self, build_id, user_source_dir):
+        """打包当前用户源码，返回 {sha256, size}（Worker 上没有协调节点的 user-source 目录）"""
+        WORKER_JOB_DIR.mkdir(parents=True, exist_ok=True)
+        snapshot = self.user_source_snapshot(build_id)
+        tmp_path = snapshot.with_name(f'.{snapshot.name}.tmp')
+        subprocess.run(['tar', '-czf', str(tmp_path), '-C', str(user_source_dir), '.'], check=True)
+        
+        digest = hashlib.sha256()
+        with open(tmp_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        os.replace(tmp_path, snapshot)
+        return {'sha256': digest.hexdigest(), 'size': snapshot.stat().st_size}
+    
+    def _enqueue_build(self, build_id, config):
+        """分布式模式：将构建任务加入队列，等待Worker租用"""
+        user_source_dir = Path((config.get('env') or {}).get('USER_SOURCE_DIR', USER_SOURCE_DIR))
+        if config['build_mode'] != 'jdk_only' and user_source_dir.is_dir() and any(user_source_dir.iterdir()):
+            config['user_source'] = self._snapshot_user_source(build_id, user_source_dir)
+        
+        now = time.time()
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO build_jobs (build_id, config, status, created_time, updated_time)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (build_id, json.dumps(config), 'queued', now, now))
+        conn.commit()
+        conn.close()
+        
+        self.current_builds[build_id] = {
+            'status': 'queued',
+            'progress': 0,
+            'start_time': datetime.now(),
+            'config': config
+        }
+        
+        return build_id
+    
+    def lease_job(self, worker_id):
+        """Worker 租用最早排队的任务，没有任务时返回 None"""
+        with self.job_lock:
+            conn = sqlite3.connect(DB_PATH)
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT build_id, config FROM build_jobs
+                WHERE status = 'queued'
+                ORDER BY created_time
+                LIMIT 1
+            ''')
+            row = cursor.fetchone()
+            if row is None:
+                conn.close()
+                return None
             
+            build_id, config = row
+            now = time.time()
+            cursor.execute('''
+                UPDATE build_jobs
+                SET status = 'leased', worker_id = ?, lease_expires = ?,
+                    attempts = attempts + 1, updated_time = ?
+                WHERE build_id = ?
+            ''', (worker_id, now + WORKER_LEASE_TTL, now, build_id))
+            cursor.execute('UPDATE build_history SET status = ? WHERE build_id = ?', ('running', build_id))
+            conn.commit()
+            conn.close()
+        
+        config = json.loads(config)
+        if build_id not in self.current_builds:
+            self.current_builds[build_id] = {
+                'progress': 0,
+                'start_time': datetime.now(),
+                'config': config
+            }
+        self.current_builds[build_id]['status'] = 'running'
+        self.current_builds[build_id]['worker_id'] = worker_id
+        logging.info(f"Build {build_id} leased by worker {worker_id}")
+        
+        return {'build_id': build_id, 'config': config, 'lease_ttl': WORKER_LEASE_TTL}
+    
+    def _check_lease(self, cursor, build_id, worker_id):
+        """确认 Worker 仍持有任务租约，返回任务状态"""
+        cursor.execute('SELECT status, worker_id FROM build_jobs WHERE build_id = ?', (build_id,))
+        row = cursor.fetchone()
+        if row is None or row[1] != worker_id or row[0] not in ('leased', 'stopped'):
+            raise LeaseError(f"worker {worker_id} does not hold the lease for {build_id}")
+        return row[0]
+    
+    def heartbeat(self, build_id, worker_id):
+        """续约；返回 True 表示任务已被停止，Worker 应终止构建（上传压缩包期间也会调用）"""
+        with self.job_lock:
+            conn = sqlite3.connect(DB_PATH)
+            cursor = conn.cursor()
+            try:
+                status = self._check_lease(cursor, build_id, worker_id)
+                if status == 'leased':
+                    now = time.time()
+                    cursor.execute('''
+                        UPDATE build_jobs SET lease_expires = ?, updated_time = ?
+                        WHERE build_id = ?
+                    ''', (now + WORKER_LEASE_TTL, now, build_id))
+                    conn.commit()
+            finally:
+                conn.close()
+        
+        return status == 'stopped'
+    
+    def user_source_for_worker(self, build_id, worker_id):
+        """持有租约的 Worker 下载任务的用户源码快照"""
+        with self.job_lock:
+            conn = sqlite3.connect(DB_PATH)
+            try:
+                self._check_lease(conn.cursor(), build_id, worker_id)
+            finally:
+                conn.close()
+        return self.user_source_snapshot(build_id)
+    
+    def append_log(self, build_id, worker_id, lines):
+        """追加 Worker 回传的构建日志"""
+        with self.job_lock:
+            conn = sqlite3.connect(DB_PATH)
+            try:
+                self._check_lease(conn.cursor(), build_id, worker_id)
+            finally:
+                conn.close()
+        
+        with log_index.open_writer(build_id, append=True) as writer:
+            for line in lines:
+                writer.write(line)
+                self._update_progress(build_id, line)
+    
+    def store_archive(self, build_id, worker_id, archive_name, stream, original_size_mb):
+        """流式接收 Worker 上传的数据库压缩包并登记元数据"""
+        with self.job_lock:
+            conn = sqlite3.connect(DB_PATH)
+            try:
+                self._check_lease(conn.cursor(), build_id, worker_id)
+            finally:
+                conn.close()
+        
+        ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        archive_path = ARCHIVE_DIR / archive_name
+        tmp_path = ARCHIVE_DIR / f'.{archive_name}.upload'
+        try:
+            with open(tmp_path, 'wb') as f:
+                # 大压缩包上传期间持续续约，避免租约过期后任务被重新排队
+                last_refresh = time.time()
+                for block in iter(lambda: stream.read(64 * 1024), b''):
+                    f.write(block)
+                    if time.time() - last_refresh >= WORKER_LEASE_TTL / 3:
+                        self.heartbeat(build_id, worker_id)
+                        last_refresh = time.time()
+            os.replace(tmp_path, archive_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        
+        config = self.current_builds.get(build_id, {}).get('config', {})
+        subprocess.run(['/bin/bash', str(BASE_DIR / 'scripts' / 'database-manager.sh'), 'register',
+                        archive_name, config.get('db_name', archive_name), str(original_size_mb)],
+                       check=True)
+        # 登记（分块存储时需要分块）也可能耗时较长
+        self.heartbeat(build_id, worker_id)
+        
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute('UPDATE build_history SET compressed = 1 WHERE build_id = ?', (build_id,))
+        conn.commit()
+        conn.close()
+    
+    def complete_job(self, build_id, worker_id, status, error_message=None):
+        """Worker 上报任务结束"""
+        with self.job_lock:
+            conn = sqlite3.connect(DB_PATH)
+            cursor = conn.cursor()
+            try:
+                job_status = self._check_lease(cursor, build_id, worker_id)
+                if job_status == 'stopped':
+                    status = 'stopped'
+                cursor.execute('''
+                    UPDATE build_jobs SET status = ?, lease_expires = NULL, updated_time = ?
+                    WHERE build_id = ?
+                ''', (status, time.time(), build_id))
+                conn.commit()
+            finally:
+                conn.close()
+        
+        self._finish_build(build_id, status, error_message)
+        logging.info(f"Build {build_id} finished on worker {worker_id}: {status}")
+    
+    def _reap_expired_leases(self):
+        """回收租约过期的任务（Worker 宕机或失联），重新排队或标记失败"""
+        while True:
+            time.sleep(max(WORKER_LEASE_TTL / 4, 1))
+            try:
+                failed = []
+                with self.job_lock:
+                    conn = sqlite3.connect(DB_PATH)
+                    cursor = conn.cursor()
+                    cursor.execute('''
+                        SELECT build_id, worker_id, attempts, status FROM build_jobs
+                        WHERE status IN ('leased', 'stopped') AND lease_expires < ?
+                    ''', (time.time(),))
+                    for build_id, worker_id, attempts, status in cursor.fetchall():
+                        if status == 'stopped':
+                            new_status = 'stopped'
+                        elif attempts >= WORKER_MAX_ATTEMPTS:
+                            new_status = 'failed'
+                        else:
+                            new_status = 'queued'
+                        cursor.execute('''
+                            UPDATE build_jobs SET status = ?, worker_id = NULL, lease_expires = NULL, updated_time = ?
+                            WHERE build_id = ?
+                        ''', (new_status, time.time(), build_id))
+                        logging.warning(f"Lease of {build_id} held by {worker_id} expired, job {new_status}")
+                        with log_index.open_writer(build_id, append=True) as writer:
+                            writer.write(f"[coordinator] worker {worker_id} lost, job {new_status}\n")
+                        if new_status == 'queued':
+                            if build_id in self.current_builds:
+                                self.current_builds[build_id]['status'] = 'queued'
+                                self.current_builds[build_id]['progress'] = 0
+                        else:
+                            failed.append((build_id, new_status))
+                    conn.commit()
+                    conn.close()
+                
+                for build_id, new_status in failed:
+                    self._finish_build(build_id, new_status, 'worker lease expired')
+            except Exception as e:
+                logging.error(f"Lease reaper error: {str(e)}")
+    
+    def _run_build(self, build_id, config):
+        """执行构建任务"""
+        try:
+            # 选中的是压缩包时先确保已解压（后台解压未完成则等待同一任务）
             if config.get('boot_jdk_path'):
-                env['BOOT_JDK_PATH'] = config['boot_jdk_path']
+                config['boot_jdk_path'] = boot_jdk_extractor.ensure(config['boot_jdk_path'])
+            
+            # 设置环境变量
+            env = build_environment(config)
             
             # 启动构建脚本
             cmd = ['/bin/bash', '/app/scripts/build-db.sh']
@@ -250,29 +773,18 @@ class BuildManager:
             # 保存进程引用
             self.build_processes[build_id] = process
             
-            # 创建日志文件
-            log_file = LOG_DIR / f'{build_id}.log'
-            
-            # 读取输出并更新进度
-            with open(log_file, 'w') as f:
+            # 读取输出并更新进度（写日志文件的同时建立索引）
+            with log_index.open_writer(build_id) as writer:
                 for line in process.stdout:
-                    f.write(line)
-                    f.flush()
+                    writer.write(line)
                     
                     # 检查是否被中断
                     if build_id not in self.current_builds or self.current_builds[build_id]['status'] == 'stopped':
                         break
                     
                     # 简单的进度估算
-                    if 'Downloading' in line:
-                        self.current_builds[build_id]['progress'] = 20
-                    elif 'Compiling' in line:
-                        self.current_builds[build_id]['progress'] = 50
-                    elif 'Creating database' in line:
-                        self.current_builds[build_id]['progress'] = 80
-                    elif 'Build completed' in line:
-                        self.current_builds[build_id]['progress'] = 100
-            
+                    self._update_progress(build_id, line)
+
             # 等待进程完成
             return_code = process.wait()
             
@@ -328,7 +840,34 @@ class BuildManager:
             if build_id in self.build_processes:
                 del self.build_processes[build_id]
 
-build_manager = BuildManager()
+build_manager = BuildManager(BUILD_EXECUTOR)
+
+def rotate_logs_periodically():
+    """定期压缩旧的构建日志（索引保留，仍可搜索和按范围读取）"""
+    while True:
+        try:
+            active = {build_id for build_id, build in build_manager.current_builds.items()
+                      if build['status'] in ('queued', 'running')}
+            rotated = log_index.rotate(LOG_ROTATE_DAYS, skip=active)
+            if rotated:
+                logging.info(f"Rotated {len(rotated)} build logs")
+        except Exception as e:
+            logging.error(f"Log rotation error: {str(e)}")
+        time.sleep(3600)
+
+if LOG_ROTATE_DAYS > 0:
+    rotate_thread = threading.Thread(target=rotate_logs_periodically)
+    rotate_thread.daemon = True
+    rotate_thread.start()
+
+def builds_active():
+    """是否有排队或运行中的构建（预热在此期间让出）"""
+    return any(build['status'] in ('queued', 'running') for build in list(build_manager.current_builds.values()))
+
+# 空闲时预热 PREWARM_JDK_VERSIONS 中的JDK源码和 CodeQL 工具链
+prewarmer = Prewarmer(BASE_DIR, is_busy=builds_active, log_file=LOG_DIR / 'prewarm.log')
+if prewarmer.enabled:
+    prewarmer.start_background()
 
 @app.route('/')
 def index():
@@ -353,11 +892,42 @@ def get_boot_jdks():
         result = subprocess.run(['/app/scripts/jdk-manager.sh', 'list'], 
                               capture_output=True, text=True, check=True)
         jdks = json.loads(result.stdout)
+        # 尚未解压完成的压缩包也列出，构建时按需解压
+        for entry in boot_jdk_extractor.get_status():
+            if entry['state'] != 'done':
+                jdks.append({
+                    'path': entry['path'],
+                    'version': entry['archive'],
+                    'major_version': '',
+                    'vendor': '',
+                    'pending': True,
+                    'state': entry['state']
+                })
         return jsonify(jdks)
     except Exception as e:
         logging.error(f"Failed to get Boot JDKs: {str(e)}")
         return jsonify([])
 
+@app.route('/api/boot-jdks/extraction')
+def get_boot_jdk_extraction():
+    """Boot JDK 压缩包的解压状态"""
+    return jsonify(boot_jdk_extractor.get_status())
+
+@app.route('/api/prewarm')
+def get_prewarm_status():
+    """预热状态：CodeQL 运行时、CodeQL CLI 和各JDK版本源码缓存是否已就绪"""
+    if not prewarmer.running:
+        prewarmer.refresh()
+    return jsonify(prewarmer.get_status())
+
+@app.route('/api/prewarm/run', methods=['POST'])
+def run_prewarm():
+    """尽快执行一轮预热（仍会等到没有构建运行）"""
+    if not prewarmer.enabled:
+        return jsonify({'status': 'error', 'message': '未配置 PREWARM_JDK_VERSIONS'}), 400
+    prewarmer.trigger()
+    return jsonify({'status': 'success', 'message': '预热已排队'})
+
 @app.route('/api/boot-jdks/scan', methods=['POST'])
 def scan_boot_jdks():
     """扫描Boot JDK"""
@@ -374,6 +944,58 @@ def start_build():
     build_id = build_manager.start_build(config)
     return jsonify({'build_id': build_id, 'status': 'started'})
 
+@app.route('/api/build/matrix', methods=['POST'])
+def start_build_matrix():
+    """构建矩阵：一次提交多个JDK版本 × 构建模式，作为一个构建组执行"""
+    spec = request.get_json(silent=True) or {}
+    try:
+        group_id, build_ids = build_manager.start_group(spec)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({'group_id': group_id, 'build_ids': build_ids, 'status': 'started'})
+
+@app.route('/api/build-groups')
+def get_build_groups():
+    """最近的构建组"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('SELECT group_id FROM build_groups ORDER BY created_time DESC LIMIT 20')
+    group_ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return jsonify([build_manager.get_group(group_id) for group_id in group_ids])
+
+@app.route('/api/build-groups/<group_id>')
+def get_build_group(group_id):
+    """构建组状态：各变体状态、汇总进度"""
+    group = build_manager.get_group(group_id)
+    if group is None:
+        return jsonify({'error': 'Build group not found'}), 404
+    return jsonify(group)
+
+@app.route('/api/build-groups/<group_id>/stop', methods=['POST'])
+def stop_build_group(group_id):
+    """停止构建组中所有未结束的构建"""
+    if build_manager.stop_group(group_id):
+        return jsonify({'status': 'success', 'message': '构建组已停止'})
+    return jsonify({'status': 'error', 'message': '构建组不存在'}), 404
+
+@app.route('/api/build-groups/<group_id>/download')
+def download_build_group(group_id):
+    """打包下载构建组中各变体最新的数据库压缩包（tar 流，不落盘）"""
+    group = build_manager.get_group(group_id)
+    if group is None:
+        return "Build group not found", 404
+    
+    db_names = [b['db_name'] for b in group['builds'] if b['status'] == 'success']
+    members = build_matrix.bundle_members(ARCHIVE_DIR, db_names)
+    if not members:
+        return "No archives available for this build group", 404
+    
+    response = Response(build_matrix.iter_bundle(members), mimetype='application/x-tar')
+    response.headers['Content-Length'] = str(build_matrix.bundle_size(members))
+    response.headers['Content-Disposition'] = f'attachment; filename="{group_id}.tar"'
+    return response
+
 @app.route('/api/build/<build_id>/status')
 def get_build_status(build_id):
     """获取构建状态"""
@@ -448,14 +1070,52 @@ def get_builds():
     
     return jsonify(builds)
 
+@app.route('/api/logs/search')
+def search_build_logs():
+    """跨构建搜索日志：q 为关键词，kind 限定 error/warning/phase 标记行，context 为上下文行数"""
+    query = request.args.get('q', '')
+    kind = request.args.get('kind')
+    if not query and not kind:
+        return jsonify({'error': 'q or kind is required'}), 400
+    try:
+        results = log_index.search(
+            query,
+            build_id=request.args.get('build_id'),
+            kind=kind,
+            limit=request.args.get('limit', 50, type=int),
+            context=request.args.get('context', 0, type=int)
+        )
+    except sqlite3.OperationalError as e:
+        return jsonify({'error': f'Invalid query: {str(e)}'}), 400
+    return jsonify(results)
+
 @app.route('/api/logs/<build_id>')
 def get_build_log(build_id):
     """获取构建日志"""
     log_file = LOG_DIR / f"{build_id}.log"
     if log_file.exists():
         return send_file(log_file, as_attachment=False, mimetype='text/plain')
+    if log_index.gz_path(build_id).exists():
+        # 已压缩的旧日志边解压边返回
+        return Response(log_index.iter_log(build_id), mimetype='text/plain')
     return "Log file not found", 404
 
+@app.route('/api/logs/<build_id>/markers')
+def get_build_log_markers(build_id):
+    """构建日志中的错误、警告和阶段标记（含行号和字节偏移）"""
+    return jsonify(log_index.markers(build_id, kind=request.args.get('kind')))
+
+@app.route('/api/logs/<build_id>/range')
+def get_build_log_range(build_id):
+    """按字节范围读取构建日志（压缩后的日志同样支持）"""
+    offset = request.args.get('offset', 0, type=int)
+    length = request.args.get('length', 64 * 1024, type=int)
+    try:
+        data = log_index.read_range(build_id, max(offset, 0), length)
+    except FileNotFoundError:
+        return "Log file not found", 404
+    return Response(data, mimetype='text/plain')
+
 @app.route('/api/upload-source', methods=['POST'])
 def upload_source():
     """上传用户源码"""
@@ -658,14 +1318,91 @@ def get_database_archives():
         logging.error(f"Failed to get database archives: {str(e)}")
         return jsonify([])
 
+def not_modified(etag):
+    """If-None-Match 命中时返回 304 响应"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def ranged_stream(make_iter, size, etag, filename, mimetype):
+    """按需生成的下载流，支持 ETag 条件请求和单段 Range（断点续传、分段并行下载）
+    
+    make_iter(start, end) 生成 [start, end) 字节范围的数据，end 为 None 表示到结尾。
+    """
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    
+    byte_range = request.range
+    # If-Range 与当前版本不一致时忽略 Range，返回完整内容
+    if byte_range and 'If-Range' in request.headers and request.if_range.etag != etag:
+        byte_range = None
+    
+    if byte_range and len(byte_range.ranges) == 1:
+        span = byte_range.range_for_length(size)
+        if span is None:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return response
+        start, end = span
+        response = Response(make_iter(start, end), status=206, mimetype=mimetype)
+        response.headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+        response.headers['Content-Length'] = str(end - start)
+    else:
+        response = Response(make_iter(0, None), mimetype=mimetype)
+        response.headers['Content-Length'] = str(size)
+    
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.set_etag(etag)
+    return response
+
 @app.route('/api/database-archives/<archive_name>/download')
 def download_database_archive(archive_name):
-    """下载数据库压缩包"""
-    archive_path = Path('/app/data/database/archives') / archive_name
+    """下载数据库压缩包（支持 Range 断点续传/分段并行下载和 ETag 条件请求）"""
+    archive_path = ARCHIVE_DIR / secure_filename(archive_name)
     if archive_path.exists():
-        return send_file(archive_path, as_attachment=True)
+        etag = archive_index.archive_etag(archive_path)
+        if X_ACCEL_REDIRECT_PREFIX:
+            # 由 nginx 直接发送文件（sendfile，Range 也由 nginx 处理）
+            response = not_modified(etag) or Response(mimetype='application/octet-stream')
+            response.headers['X-Accel-Redirect'] = f"{X_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{archive_path.name}"
+            response.headers['Content-Disposition'] = f'attachment; filename="{archive_path.name}"'
+            response.set_etag(etag)
+            return response
+        # conditional 处理 Range/If-Range/If-None-Match；USE_X_SENDFILE 时由前置服务器发送
+        return send_file(archive_path, as_attachment=True, conditional=True, etag=etag)
+    
+    # 分块去重存储的压缩包磁盘上只有清单，按需还原为 tar 流（Range 请求只读取范围内的块）
+    manifest_path = chunk_store.manifest_path_for(archive_path)
+    if manifest_path.exists():
+        manifest = chunk_store.load_manifest(manifest_path)
+        return ranged_stream(
+            lambda start, end: chunk_store.iter_tar(manifest_path, start, end),
+            chunk_store.tar_size(manifest),
+            archive_index.archive_etag(archive_path),
+            archive_path.name,
+            'application/x-tar'
+        )
     return "Archive not found", 404
 
+@app.route('/api/databases/<db_name>/stream')
+def stream_database(db_name):
+    """将未压缩的数据库目录实时打包下载（默认 tar.gz，format=tar 时不压缩），不生成临时压缩包"""
+    db_name = secure_filename(db_name)
+    db_path = ARCHIVE_DIR.parent / db_name
+    if not db_name or db_path == ARCHIVE_DIR or not db_path.is_dir():
+        return "Database not found", 404
+    
+    compress = request.args.get('format', 'tar.gz') != 'tar'
+    filename = f"{db_name}.tar.gz" if compress else f"{db_name}.tar"
+    response = Response(archive_index.iter_directory_tar(db_path, compress=compress),
+                        mimetype='application/gzip' if compress else 'application/x-tar')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 @app.route('/api/database-archives/<archive_name>', methods=['DELETE'])
 def delete_database_archive(archive_name):
     """删除数据库压缩包"""
@@ -678,14 +1415,58 @@ def delete_database_archive(archive_name):
 
 @app.route('/api/database-archives/<archive_name>/extract', methods=['POST'])
 def extract_database_archive(archive_name):
-    """解压数据库压缩包"""
+    """解压数据库压缩包，请求体可带 {"paths": [...]} 只解压指定子树"""
     try:
-        subprocess.run(['/app/scripts/database-manager.sh', 'extract', archive_name], 
+        paths = (request.get_json(silent=True) or {}).get('paths') or []
+        subprocess.run(['/app/scripts/database-manager.sh', 'extract', archive_name] + list(paths),
                       check=True)
         return jsonify({'status': 'success'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/api/database-archives/<archive_name>/members')
+def list_database_archive_members(archive_name):
+    """列出压缩包中的文件（zip 格式直接读取索引，无需解压）"""
+    archive_path = ARCHIVE_DIR / secure_filename(archive_name)
+    try:
+        members = archive_index.list_members(archive_path)
+    except archive_index.ArchiveError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+    return jsonify({
+        'archive_name': archive_path.name,
+        'format': archive_index.archive_format(archive_path),
+        'members': members
+    })
+
+@app.route('/api/database-archives/<archive_name>/members/<path:member>')
+def download_database_archive_member(archive_name, member):
+    """流式下载压缩包中的单个文件，例如 my_db/src.zip"""
+    archive_path = ARCHIVE_DIR / secure_filename(archive_name)
+    try:
+        size = archive_index.member_size(archive_path, member)
+    except archive_index.ArchiveError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+    
+    response = Response(archive_index.iter_member(archive_path, member),
+                        mimetype='application/octet-stream')
+    response.headers['Content-Length'] = str(size)
+    response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(os.path.basename(member))}"'
+    return response
+
+@app.route('/api/database-archives/<archive_name>/convert', methods=['POST'])
+def convert_database_archive(archive_name):
+    """转换压缩包格式（zip <-> tar.gz）"""
+    target_format = (request.get_json(silent=True) or {}).get('format', 'zip')
+    if target_format not in ('zip', 'tar.gz'):
+        return jsonify({'status': 'error', 'message': f'不支持的格式: {target_format}'}), 400
+    try:
+        result = subprocess.run(['/app/scripts/database-manager.sh', 'convert', archive_name, target_format],
+                              capture_output=True, text=True, check=True)
+        new_path = result.stdout.strip().splitlines()[-1]
+        return jsonify({'status': 'success', 'archive_name': os.path.basename(new_path)})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 @app.route('/api/database-archives/cleanup', methods=['POST'])
 def cleanup_database_residuals():
     """清理残留的数据库文件"""
@@ -744,6 +1525,103 @@ def get_stats():
         'compression_rate': round(compression_rate, 2)
     })
 
+# 分布式Worker API端点
+@app.route('/api/worker/lease', methods=['POST'])
+def worker_lease():
+    """Worker 租用构建任务"""
+    worker_id = (request.get_json(silent=True) or {}).get('worker_id')
+    if not worker_id:
+        return jsonify({'error': 'worker_id required'}), 400
+    job = build_manager.lease_job(worker_id)
+    if job is None:
+        return '', 204
+    return jsonify(job)
+
+@app.route('/api/worker/jobs/<build_id>/heartbeat', methods=['POST'])
+def worker_heartbeat(build_id):
+    """Worker 续约"""
+    data = request.get_json(silent=True) or {}
+    try:
+        cancel = build_manager.heartbeat(build_id, data.get('worker_id'))
+        return jsonify({'status': 'ok', 'cancel': cancel})
+    except LeaseError as e:
+        return jsonify({'error': str(e)}), 409
+
+@app.route('/api/worker/jobs/<build_id>/user-source')
+def worker_user_source(build_id):
+    """Worker 下载任务的用户源码快照"""
+    try:
+        snapshot = build_manager.user_source_for_worker(build_id, request.args.get('worker_id'))
+    except LeaseError as e:
+        return jsonify({'error': str(e)}), 409
+    if not snapshot.exists():
+        return jsonify({'error': 'user source snapshot not found'}), 404
+    return send_file(snapshot, mimetype='application/gzip')
+
+@app.route('/api/worker/jobs/<build_id>/log', methods=['POST'])
+def worker_log(build_id):
+    """Worker 回传构建日志"""
+    data = request.get_json(silent=True) or {}
+    try:
+        build_manager.append_log(build_id, data.get('worker_id'), data.get('lines', []))
+        return jsonify({'status': 'ok'})
+    except LeaseError as e:
+        return jsonify({'error': str(e)}), 409
+
+@app.route('/api/worker/jobs/<build_id>/archive/<archive_name>', methods=['PUT'])
+def worker_upload_archive(build_id, archive_name):
+    """Worker 上传数据库压缩包（流式写入）"""
+    try:
+        build_manager.store_archive(
+            build_id,
+            request.args.get('worker_id'),
+            secure_filename(archive_name),
+            request.stream,
+            request.args.get('original_size_mb', '0')
+        )
+        return jsonify({'status': 'success'})
+    except LeaseError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        logging.error(f"Archive upload failed for {build_id}: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/worker/jobs/<build_id>/complete', methods=['POST'])
+def worker_complete(build_id):
+    """Worker 上报构建结果"""
+    data = request.get_json(silent=True) or {}
+    status = data.get('status', 'failed')
+    if status not in ('success', 'failed', 'error'):
+        return jsonify({'error': f'invalid status {status}'}), 400
+    try:
+        build_manager.complete_job(build_id, data.get('worker_id'), status, data.get('error'))
+        return jsonify({'status': 'ok'})
+    except LeaseError as e:
+        return jsonify({'error': str(e)}), 409
+
+@app.route('/api/worker/jobs')
+def list_worker_jobs():
+    """查看分布式任务队列"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT build_id, status, worker_id, lease_expires, attempts, created_time
+        FROM build_jobs
+        ORDER BY created_time DESC
+        LIMIT 50
+    ''')
+    rows = cursor.fetchall()
+    conn.close()
+    
+    return jsonify([{
+        'build_id': row[0],
+        'status': row[1],
+        'worker_id': row[2],
+        'lease_expires': row[3],
+        'attempts': row[4],
+        'created_time': row[5]
+    } for row in rows])
+
 # CodeQL管理API端点
 @app.route('/api/codeql/status')
 def get_codeql_status():
@@ -757,9 +1635,10 @@ def get_codeql_status():
 
 @app.route('/api/codeql/download', methods=['POST'])
 def download_codeql():
-    """下载CodeQL CLI"""
+    """下载CodeQL CLI，请求体可带 {"version": "2.15.1"}（默认 latest）"""
     try:
-        result = codeql_manager.download_codeql()
+        version = (request.get_json(silent=True) or {}).get('version') or 'latest'
+        result = codeql_manager.download_codeql(version=version)
         if result['success']:
             return jsonify(result)
         else:
@@ -768,6 +1647,21 @@ def download_codeql():
         logging.error(f"Failed to download CodeQL: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/codeql/versions')
+def get_codeql_versions():
+    """列出已安装的CodeQL版本和缓存的发行包"""
+    return jsonify(codeql_manager.list_versions())
+
+@app.route('/api/codeql/switch', methods=['POST'])
+def switch_codeql_version():
+    """切换到已安装的CodeQL版本（原子替换 current 符号链接）"""
+    version = (request.get_json(silent=True) or {}).get('version', '')
+    try:
+        codeql_manager.switch_version(version)
+        return jsonify({'success': True, 'version': version})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
 @app.route('/api/codeql/ensure', methods=['POST'])
 def ensure_codeql():
     """确保CodeQL可用（如果不可用则自动下载）"""
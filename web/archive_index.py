@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""
+数据库压缩包索引与随机访问
+支持三种压缩包格式:
+    zip      按条目独立压缩，中央目录即成员索引，可直接定位并读取单个成员
+    tar.gz   兼容旧格式，只能顺序解压；首次列出成员时生成 <archive>.index.json 旁路索引
+    chunked  分块去重存储（见 chunk_store.py），<name>.tar 在磁盘上只有清单，下载时还原为 tar 流
+
+用法:
+    python3 archive_index.py list <archive>
+    python3 archive_index.py cat <archive> <member>
+    python3 archive_index.py extract <archive> <dest> [--include 子路径 ...]
+    python3 archive_index.py convert <archive> <zip|tar.gz|chunked>
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from pathlib import Path, PurePosixPath
+
+import chunk_store
+
+CHUNK_SIZE = 1024 * 1024
+INDEX_SUFFIX = '.index.json'
+ARCHIVE_FORMATS = ('zip', 'tar.gz', 'chunked')
+FORMAT_EXTENSIONS = {'zip': 'zip', 'tar.gz': 'tar.gz', 'chunked': 'tar'}
+
+# 这些文件本身已经压缩过，放入 ZIP 时直接存储，避免重复压缩浪费CPU
+STORED_SUFFIXES = ('.zip', '.jar', '.gz', '.tgz', '.zst', '.xz', '.bz2')
+
+
+class ArchiveError(Exception):
+    """压缩包不存在、格式不支持或成员不存在"""
+
+
+def archive_format(path) -> str:
+    """根据文件名判断压缩包格式"""
+    name = str(path)
+    if name.endswith('.zip'):
+        return 'zip'
+    if name.endswith('.tar.gz') or name.endswith('.tgz'):
+        return 'tar.gz'
+    if name.endswith('.tar'):
+        return 'chunked'
+    raise ArchiveError(f'不支持的压缩包格式: {name}')
+
+
+def converted_name(archive_name: str, fmt: str) -> str:
+    """返回转换为目标格式后的压缩包文件名"""
+    for suffix in ('.tar.gz', '.tgz', '.zip', '.tar'):
+        if archive_name.endswith(suffix):
+            archive_name = archive_name[:-len(suffix)]
+            break
+    return f'{archive_name}.{FORMAT_EXTENSIONS[fmt]}'
+
+
+def archive_exists(path) -> bool:
+    """压缩包是否存在（分块压缩包检查清单文件）"""
+    path = Path(path)
+    if archive_format(path) == 'chunked':
+        return chunk_store.manifest_path_for(path).is_file()
+    return path.is_file()
+
+
+def catalog_entry(path) -> dict:
+    """压缩包在数据库目录 .db_metadata.json 中的登记信息（未登记时为空）"""
+    path = Path(path)
+    metadata_file = path.parent.parent / '.db_metadata.json'
+    try:
+        with open(metadata_file) as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return next((entry for entry in catalog if entry.get('archive_name') == path.name), {})
+
+
+def archive_etag(path) -> str:
+    """由登记信息和文件状态生成 ETag，不读取压缩包内容（压缩包重新生成或转换后随之变化）"""
+    path = Path(path)
+    on_disk = chunk_store.manifest_path_for(path) if archive_format(path) == 'chunked' else path
+    st = on_disk.stat()
+    entry = catalog_entry(path)
+    key = json.dumps([path.name, entry.get('created_time'), entry.get('compressed_size_mb'),
+                      st.st_size, st.st_mtime_ns])
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def iter_directory_tar(directory, compress=True, chunk_size: int = CHUNK_SIZE):
+    """将目录实时打包（tar，可选 gzip 压缩）并流式输出，不生成临时压缩包"""
+    directory = Path(directory)
+    cmd = ['tar', '-c']
+    if compress:
+        # 有 pigz 时多线程压缩
+        cmd += ['-I', 'pigz'] if shutil.which('pigz') else ['-z']
+    cmd += ['-C', str(directory.parent), directory.name]
+
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        for block in iter(lambda: process.stdout.read(chunk_size), b''):
+            yield block
+        process.wait()
+    finally:
+        # 客户端中途断开时结束 tar 进程
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+
+def _load_chunked(path: Path) -> dict:
+    manifest_path = chunk_store.manifest_path_for(path)
+    if not manifest_path.is_file():
+        raise ArchiveError(f'压缩包不存在: {path}')
+    return chunk_store.load_manifest(manifest_path)
+
+
+def normalize_member(name: str) -> str:
+    """规范化成员路径，拒绝绝对路径和 .. 路径穿越"""
+    path = PurePosixPath(name.replace('\\', '/'))
+    if path.is_absolute() or '..' in path.parts:
+        raise ArchiveError(f'非法的成员路径: {name}')
+    return '' if str(path) == '.' else str(path)
+
+
+def _member_selected(name: str, includes) -> bool:
+    """判断成员是否位于任一指定子树下"""
+    if not includes:
+        return True
+    name = name.rstrip('/')
+    for prefix in includes:
+        prefix = prefix.rstrip('/')
+        if name == prefix or name.startswith(prefix + '/'):
+            return True
+    return False
+
+
+def _tar_index_path(path: Path) -> Path:
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+def _build_tar_index(path: Path):
+    """顺序扫描 tar.gz 生成成员索引（只需一次完整解压）"""
+    members = []
+    with tarfile.open(path, 'r:gz') as tar:
+        for info in tar:
+            members.append({
+                'name': info.name + ('/' if info.isdir() else ''),
+                'size': info.size,
+                'compressed_size': None,
+                'is_dir': info.isdir(),
+                'mtime': int(info.mtime),
+            })
+
+    index_path = _tar_index_path(path)
+    tmp_path = index_path.with_name(index_path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'archive_mtime': path.stat().st_mtime, 'members': members}, f)
+    os.replace(tmp_path, index_path)
+    return members
+
+
+def list_members(path) -> list:
+    """列出压缩包成员: name, size, compressed_size, is_dir, mtime"""
+    path = Path(path)
+    if archive_format(path) == 'chunked':
+        return [{
+            'name': entry['name'] + ('/' if entry['type'] == 'dir' else ''),
+            'size': entry.get('size', 0),
+            'compressed_size': None,
+            'is_dir': entry['type'] == 'dir',
+            'mtime': entry.get('mtime', 0),
+        } for entry in _load_chunked(path)['entries']]
+    
+    if not path.is_file():
+        raise ArchiveError(f'压缩包不存在: {path}')
+
+    if archive_format(path) == 'zip':
+        with zipfile.ZipFile(path) as zf:
+            return [{
+                'name': info.filename,
+                'size': info.file_size,
+                'compressed_size': info.compress_size,
+                'is_dir': info.is_dir(),
+                'mtime': int(time.mktime(info.date_time + (0, 0, -1))),
+            } for info in zf.infolist()]
+
+    index_path = _tar_index_path(path)
+    if index_path.exists():
+        with open(index_path) as f:
+            index = json.load(f)
+        if index.get('archive_mtime') == path.stat().st_mtime:
+            return index['members']
+    return _build_tar_index(path)
+
+
+def member_size(path, member: str):
+    """返回成员的原始大小，成员不存在时抛出 ArchiveError"""
+    member = normalize_member(member)
+    for info in list_members(path):
+        if info['name'].rstrip('/') == member and not info['is_dir']:
+            return info['size']
+    raise ArchiveError(f'成员不存在: {member}')
+
+
+def iter_member(path, member: str, chunk_size: int = CHUNK_SIZE):
+    """按块读取单个成员的内容
+
+    zip 格式直接定位到成员数据；chunked 格式按清单读取该成员的块；tar.gz 需要顺序解压到该成员为止。
+    """
+    path = Path(path)
+    member = normalize_member(member)
+    
+    if archive_format(path) == 'chunked':
+        store = chunk_store.store_for(chunk_store.manifest_path_for(path))
+        for entry in _load_chunked(path)['entries']:
+            if entry['name'] == member and entry['type'] == 'file':
+                yield from store.iter_file(entry)
+                return
+        raise ArchiveError(f'成员不存在: {member}')
+
+    if archive_format(path) == 'zip':
+        with zipfile.ZipFile(path) as zf:
+            try:
+                src = zf.open(member)
+            except KeyError:
+                raise ArchiveError(f'成员不存在: {member}')
+            with src:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+    with tarfile.open(path, 'r|gz') as tar:
+        for info in tar:
+            if info.name.rstrip('/') == member and info.isfile():
+                src = tar.extractfile(info)
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+    raise ArchiveError(f'成员不存在: {member}')
+
+
+def extract_members(path, dest, includes=None) -> int:
+    """解压压缩包，includes 不为空时只解压指定的子树，返回解压的文件数"""
+    path = Path(path)
+    dest = Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+    includes = [normalize_member(p) for p in includes or []]
+    count = 0
+    
+    if archive_format(path) == 'chunked':
+        store = chunk_store.store_for(chunk_store.manifest_path_for(path))
+        for entry in _load_chunked(path)['entries']:
+            name = normalize_member(entry['name'])
+            if not _member_selected(name, includes):
+                continue
+            target = dest / name
+            if entry['type'] == 'dir':
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if entry['type'] == 'symlink':
+                if target.is_symlink():
+                    target.unlink()
+                os.symlink(entry['target'], target)
+                continue
+            with open(target, 'wb') as dst:
+                for data in store.iter_file(entry):
+                    dst.write(data)
+            os.chmod(target, entry.get('mode', 0o644) & 0o777)
+            count += 1
+        return count
+
+    if archive_format(path) == 'zip':
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                name = normalize_member(info.filename)
+                if not _member_selected(name, includes):
+                    continue
+                target = dest / name
+                if info.is_dir():
+                    target.mkdir(parents=True, exist_ok=True)
+                    continue
+                target.parent.mkdir(parents=True, exist_ok=True)
+                with zf.open(info) as src, open(target, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                # 恢复ZIP中记录的Unix权限（例如 codeql 数据库中的可执行脚本）
+                mode = (info.external_attr >> 16) & 0o777
+                if mode:
+                    os.chmod(target, mode)
+                count += 1
+        return count
+
+    with tarfile.open(path, 'r|gz') as tar:
+        for info in tar:
+            name = normalize_member(info.name)
+            if not _member_selected(name, includes):
+                continue
+            target = dest / name
+            if info.isdir():
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+            if not info.isfile():
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with tar.extractfile(info) as src, open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            os.chmod(target, info.mode & 0o777)
+            count += 1
+    return count
+
+
+def tar_to_zip(src, dst):
+    """流式将 tar.gz 转换为按条目压缩的 zip"""
+    with tarfile.open(src, 'r|gz') as tar, \
+            zipfile.ZipFile(dst, 'w', allowZip64=True) as zf:
+        for info in tar:
+            name = normalize_member(info.name)
+            if info.isdir():
+                zinfo = zipfile.ZipInfo(name + '/', time.localtime(max(info.mtime, 315532800))[:6])
+                zinfo.external_attr = (0o40000 | info.mode) << 16
+                zf.writestr(zinfo, b'')
+                continue
+            if not info.isfile():
+                continue
+            zinfo = zipfile.ZipInfo(name, time.localtime(max(info.mtime, 315532800))[:6])
+            zinfo.external_attr = (0o100000 | info.mode) << 16
+            zinfo.file_size = info.size
+            zinfo.compress_type = (zipfile.ZIP_STORED if name.endswith(STORED_SUFFIXES)
+                                   else zipfile.ZIP_DEFLATED)
+            with tar.extractfile(info) as f_in, zf.open(zinfo, 'w', force_zip64=True) as f_out:
+                shutil.copyfileobj(f_in, f_out, CHUNK_SIZE)
+
+
+def zip_to_tar(src, dst):
+    """将 zip 转换回与 tar -czf 兼容的 tar.gz"""
+    with zipfile.ZipFile(src) as zf, tarfile.open(dst, 'w:gz') as tar:
+        for info in zf.infolist():
+            name = normalize_member(info.filename)
+            tinfo = tarfile.TarInfo(name)
+            tinfo.mtime = int(time.mktime(info.date_time + (0, 0, -1)))
+            mode = (info.external_attr >> 16) & 0o7777
+            if info.is_dir():
+                tinfo.type = tarfile.DIRTYPE
+                tinfo.mode = mode or 0o755
+                tar.addfile(tinfo)
+                continue
+            tinfo.size = info.file_size
+            tinfo.mode = mode or 0o644
+            with zf.open(info) as f_in:
+                tar.addfile(tinfo, f_in)
+
+
+def chunked_to_tar(src, dst):
+    """将分块压缩包还原为 tar.gz"""
+    with gzip.open(dst, 'wb') as f:
+        for data in chunk_store.iter_tar(chunk_store.manifest_path_for(src)):
+            f.write(data)
+
+
+def chunked_to_zip(src, dst):
+    """将分块压缩包还原为 zip"""
+    store = chunk_store.store_for(chunk_store.manifest_path_for(src))
+    with zipfile.ZipFile(dst, 'w', allowZip64=True) as zf:
+        for entry in _load_chunked(Path(src))['entries']:
+            date_time = time.localtime(max(entry.get('mtime', 0), 315532800))[:6]
+            if entry['type'] == 'dir':
+                zinfo = zipfile.ZipInfo(entry['name'] + '/', date_time)
+                zinfo.external_attr = (0o40000 | entry.get('mode', 0o755)) << 16
+                zf.writestr(zinfo, b'')
+                continue
+            if entry['type'] != 'file':
+                continue
+            zinfo = zipfile.ZipInfo(entry['name'], date_time)
+            zinfo.external_attr = (0o100000 | entry.get('mode', 0o644)) << 16
+            zinfo.file_size = entry['size']
+            zinfo.compress_type = (zipfile.ZIP_STORED if entry['name'].endswith(STORED_SUFFIXES)
+                                   else zipfile.ZIP_DEFLATED)
+            with zf.open(zinfo, 'w', force_zip64=True) as f_out:
+                for data in store.iter_file(entry):
+                    f_out.write(data)
+
+
+def archive_to_chunked(src, dst):
+    """将 zip/tar.gz 解压到临时目录后分块保存，dst 为 <name>.tar"""
+    src = Path(src)
+    tmp_dir = tempfile.mkdtemp(prefix='.convert-', dir=src.parent)
+    try:
+        extract_members(src, tmp_dir)
+        roots = list(Path(tmp_dir).iterdir())
+        if len(roots) != 1 or not roots[0].is_dir():
+            raise ArchiveError(f'压缩包顶层必须是单个数据库目录: {src.name}')
+        manifest_path = chunk_store.manifest_path_for(dst)
+        chunk_store.store_for(manifest_path).store_directory(roots[0], manifest_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def convert_archive(path, fmt) -> Path:
+    """转换压缩包格式，返回新压缩包路径（原压缩包保留，由调用方决定是否删除）"""
+    path = Path(path)
+    src_fmt = archive_format(path)
+    if fmt not in ARCHIVE_FORMATS:
+        raise ArchiveError(f'不支持的目标格式: {fmt}')
+    if src_fmt == fmt:
+        return path
+    
+    dst = path.with_name(converted_name(path.name, fmt))
+    if fmt == 'chunked':
+        archive_to_chunked(path, dst)
+        return dst
+    
+    tmp = dst.with_name(f'.{dst.name}.tmp')
+    try:
+        if src_fmt == 'chunked':
+            if fmt == 'zip':
+                chunked_to_zip(path, tmp)
+            else:
+                chunked_to_tar(path, tmp)
+        elif fmt == 'zip':
+            tar_to_zip(path, tmp)
+        else:
+            zip_to_tar(path, tmp)
+        os.replace(tmp, dst)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return dst
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据库压缩包索引工具')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_list = sub.add_parser('list', help='以JSON列出压缩包成员')
+    p_list.add_argument('archive')
+
+    p_cat = sub.add_parser('cat', help='输出单个成员内容到标准输出')
+    p_cat.add_argument('archive')
+    p_cat.add_argument('member')
+
+    p_extract = sub.add_parser('extract', help='解压压缩包（可只解压指定子树）')
+    p_extract.add_argument('archive')
+    p_extract.add_argument('dest')
+    p_extract.add_argument('--include', action='append', default=[],
+                           help='只解压该子路径，可重复指定')
+
+    p_convert = sub.add_parser('convert', help='转换压缩包格式，输出新压缩包路径')
+    p_convert.add_argument('archive')
+    p_convert.add_argument('format', choices=ARCHIVE_FORMATS)
+
+    args = parser.parse_args()
+    try:
+        if args.command == 'list':
+            json.dump(list_members(args.archive), sys.stdout, ensure_ascii=False, indent=2)
+            print()
+        elif args.command == 'cat':
+            for chunk in iter_member(args.archive, args.member):
+                sys.stdout.buffer.write(chunk)
+        elif args.command == 'extract':
+            count = extract_members(args.archive, args.dest, args.include)
+            print(f'已解压 {count} 个文件', file=sys.stderr)
+        elif args.command == 'convert':
+            print(convert_archive(args.archive, args.format))
+    except ArchiveError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
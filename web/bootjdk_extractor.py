@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Boot JDK 压缩包解压服务
+Web 启动、jdk-manager.sh scan 和 build-db.sh 共用，每个压缩包按内容摘要记录解压标记，只解压一次
+
+目录布局（/app/bootjdk）:
+    *.tar.gz / *.tgz                         Boot JDK 压缩包
+    _extracted/<sha256[:16]>/<jdk目录>/      解压结果
+    _extracted/.markers/<sha256>.json        解压标记: 压缩包名、大小、修改时间、JDK路径
+
+用法:
+    python3 bootjdk_extractor.py extract            并行解压所有未解压的压缩包
+    python3 bootjdk_extractor.py ensure <archive>   确保指定压缩包已解压，输出 JDK 路径
+    python3 bootjdk_extractor.py status             以JSON输出各压缩包的解压状态
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BOOTJDK_DIR = Path(os.getenv('BOOTJDK_DIR', '/app/bootjdk'))
+EXTRACT_WORKERS = int(os.getenv('BOOTJDK_EXTRACT_WORKERS', str(min(4, os.cpu_count() or 1))))
+ARCHIVE_PATTERNS = ('*.tar.gz', '*.tgz')
+ARCHIVE_SUFFIXES = ('.tar.gz', '.tgz')
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class BootJdkExtractor:
+    def __init__(self, bootjdk_dir=BOOTJDK_DIR, workers=EXTRACT_WORKERS):
+        self.bootjdk_dir = Path(bootjdk_dir).absolute()
+        self.extract_root = self.bootjdk_dir / '_extracted'
+        self.markers_dir = self.extract_root / '.markers'
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.status = {}
+
+    def list_archives(self):
+        archives = []
+        for pattern in ARCHIVE_PATTERNS:
+            archives.extend(self.bootjdk_dir.glob(pattern))
+        return sorted(archives)
+
+    def _load_markers(self):
+        markers = []
+        if self.markers_dir.exists():
+            for path in self.markers_dir.glob('*.json'):
+                try:
+                    with open(path) as f:
+                        markers.append(json.load(f))
+                except ValueError:
+                    continue
+        return markers
+
+    def archive_digest(self, archive: Path) -> str:
+        """压缩包内容摘要；名称、大小、修改时间与已有标记一致时直接复用，避免重复计算"""
+        st = archive.stat()
+        for marker in self._load_markers():
+            if (marker['archive'] == archive.name and marker['size'] == st.st_size
+                    and marker['mtime'] == int(st.st_mtime)):
+                return marker['sha256']
+
+        digest = hashlib.sha256()
+        with open(archive, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _marker_path(self, digest: str) -> Path:
+        return self.markers_dir / f'{digest}.json'
+
+    def _read_marker(self, digest: str):
+        path = self._marker_path(digest)
+        if not path.exists():
+            return None
+        with open(path) as f:
+            marker = json.load(f)
+        if not (Path(marker['jdk_home']) / 'bin' / 'java').exists():
+            return None
+        return marker
+
+    @staticmethod
+    def _find_jdk_home(root: Path):
+        """解压目录中包含 bin/java 的目录（通常是顶层的 jdk-xx 目录）"""
+        if (root / 'bin' / 'java').exists():
+            return root
+        for candidate in sorted(root.iterdir()):
+            if candidate.is_dir() and (candidate / 'bin' / 'java').exists():
+                return candidate
+        for java in sorted(root.glob('*/*/bin/java')):
+            return java.parent.parent
+        return None
+
+    def extract_archive(self, archive: Path) -> str:
+        """解压单个压缩包（已有标记时直接返回），返回 JDK 路径"""
+        archive = Path(archive)
+        name = archive.name
+        self._set_status(name, 'hashing')
+        digest = self.archive_digest(archive)
+
+        marker = self._read_marker(digest)
+        if marker:
+            self._set_status(name, 'done', marker['jdk_home'])
+            return marker['jdk_home']
+
+        self.markers_dir.mkdir(parents=True, exist_ok=True)
+        # 文件锁: Web 进程、jdk-manager.sh 和 build-db.sh 可能同时请求同一个压缩包
+        with open(self.markers_dir / f'.{digest}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            marker = self._read_marker(digest)
+            if marker:
+                self._set_status(name, 'done', marker['jdk_home'])
+                return marker['jdk_home']
+
+            self._set_status(name, 'extracting')
+            logging.info(f"Extracting Boot JDK archive: {name}")
+            start = time.time()
+            target = self.extract_root / digest[:16]
+            tmp_dir = self.extract_root / f'.{digest[:16]}.{os.getpid()}.tmp'
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            tmp_dir.mkdir(parents=True)
+            try:
+                subprocess.run(['tar', '-xzf', str(archive), '-C', str(tmp_dir)],
+                               check=True, capture_output=True, text=True)
+                if self._find_jdk_home(tmp_dir) is None:
+                    raise ValueError(f"压缩包中没有找到 bin/java: {name}")
+                shutil.rmtree(target, ignore_errors=True)
+                os.replace(tmp_dir, target)
+            except subprocess.CalledProcessError as e:
+                self._set_status(name, 'failed', error=e.stderr.strip())
+                raise
+            except Exception as e:
+                self._set_status(name, 'failed', error=str(e))
+                raise
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+            jdk_home = str(self._find_jdk_home(target))
+            st = archive.stat()
+            marker = {
+                'archive': name,
+                'sha256': digest,
+                'size': st.st_size,
+                'mtime': int(st.st_mtime),
+                'jdk_home': jdk_home,
+                'extracted_time': int(time.time())
+            }
+            tmp_marker = self._marker_path(digest).with_suffix('.tmp')
+            with open(tmp_marker, 'w') as f:
+                json.dump(marker, f)
+            os.replace(tmp_marker, self._marker_path(digest))
+
+        logging.info(f"Successfully extracted {name} in {time.time() - start:.1f}s -> {jdk_home}")
+        self._set_status(name, 'done', jdk_home)
+        return jdk_home
+
+    def _set_status(self, name, state, jdk_home=None, error=None):
+        with self.lock:
+            self.status[name] = {'state': state, 'jdk_home': jdk_home, 'error': error}
+
+    def submit(self, archive: Path):
+        """提交解压任务，同一压缩包同时只会有一个任务"""
+        archive = Path(archive)
+        with self.lock:
+            future = self.futures.get(archive.name)
+            # 已结束的任务不复用: 同名压缩包可能已被替换，由 extract_archive 按标记判断是否需要重新解压
+            if future is None or future.done():
+                self.status.setdefault(archive.name, {'state': 'pending', 'jdk_home': None, 'error': None})
+                future = self.executor.submit(self.extract_archive, archive)
+                self.futures[archive.name] = future
+            return future
+
+    def extract_all(self):
+        """并行解压所有压缩包，返回 {压缩包名: JDK路径}"""
+        futures = {archive.name: self.submit(archive) for archive in self.list_archives()}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logging.error(f"Failed to extract {name}: {str(e)}")
+        return results
+
+    def start_background(self, on_complete=None):
+        """在后台线程中解压所有压缩包，不阻塞 Web 服务启动"""
+        def run():
+            archives = self.list_archives()
+            if not archives:
+                logging.info(f"No Boot JDK archives found in {self.bootjdk_dir}")
+                return
+            self.extract_all()
+            if on_complete:
+                on_complete()
+
+        thread = threading.Thread(target=run, name='bootjdk-extractor', daemon=True)
+        thread.start()
+        return thread
+
+    def ensure(self, boot_jdk_path: str) -> str:
+        """构建前按需解压: 传入压缩包路径时返回解压后的 JDK 路径，其他路径原样返回"""
+        if not boot_jdk_path:
+            return boot_jdk_path
+        path = Path(boot_jdk_path)
+        if path.name.endswith(ARCHIVE_SUFFIXES):
+            return self.submit(path).result()
+        return boot_jdk_path
+
+    def get_status(self):
+        """各压缩包的解压状态（未处理的压缩包按标记判断是否已解压）"""
+        markers = {m['archive']: m for m in self._load_markers()}
+        result = []
+        with self.lock:
+            status = dict(self.status)
+        for archive in self.list_archives():
+            entry = status.get(archive.name)
+            if entry is None:
+                marker = markers.get(archive.name)
+                entry = {'state': 'done' if marker else 'pending',
+                         'jdk_home': marker['jdk_home'] if marker else None, 'error': None}
+            result.append(dict(entry, archive=archive.name, path=str(archive)))
+        return result
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S', stream=sys.stderr)
+
+    parser = argparse.ArgumentParser(description='Boot JDK 压缩包解压服务')
+    parser.add_argument('--bootjdk-dir', default=str(BOOTJDK_DIR))
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('extract', help='并行解压所有未解压的压缩包')
+    p_ensure = sub.add_parser('ensure', help='确保指定压缩包已解压，输出 JDK 路径')
+    p_ensure.add_argument('archive')
+    sub.add_parser('status', help='输出解压状态')
+
+    args = parser.parse_args()
+    extractor = BootJdkExtractor(args.bootjdk_dir)
+
+    if args.command == 'extract':
+        results = extractor.extract_all()
+        failed = len(extractor.list_archives()) - len(results)
+        sys.exit(1 if failed else 0)
+    elif args.command == 'ensure':
+        print(extractor.ensure(args.archive))
+    elif args.command == 'status':
+        print(json.dumps(extractor.get_status(), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+构建矩阵
+一次提交展开为一组构建（多个 JDK 版本 × 构建模式），共享的准备工作只做一次:
+用户源码哈希、JDK 源码下载/缓存（每个版本一次）、Maven/Gradle 依赖预解析。
+之后各变体在独立的工作目录中并发执行 build-db.sh。
+
+矩阵格式:
+    {
+        "db_name": "mylib",
+        "jdk_versions": ["8", "11", "17", "21"],
+        "build_modes": ["hybrid", "jdk_only"],
+        "jdk_full_versions": {"17": "17.0.2"},       可选
+        "boot_jdk_paths": {"8": "/app/bootjdk/..."},  可选，未指定时使用 boot_jdk_path
+        "max_parallel": 2                             可选
+    }
+也可以用 "variants": [{"jdk_version": "17", "build_mode": "hybrid"}, ...] 显式列出变体。
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import chunk_store
+
+SCRIPTS_DIR = Path(os.getenv('SCRIPTS_DIR', '/app/scripts'))
+CACHE_MANAGER = str(SCRIPTS_DIR / 'cache-manager.sh')
+DOWNLOAD_SCRIPT = str(SCRIPTS_DIR / 'download-jdk.sh')
+
+SUPPORTED_JDK_VERSIONS = ('8', '11', '17', '21')
+SUPPORTED_BUILD_MODES = ('hybrid', 'jdk_only', 'user_only')
+MAX_VARIANTS = 16
+MATRIX_MAX_PARALLEL = int(os.getenv('MATRIX_MAX_PARALLEL', '2'))
+CODEQL_TOTAL_RAM_MB = int(os.getenv('CODEQL_TOTAL_RAM_MB', '51200'))
+
+ARCHIVE_NAME_RE = r'_\d{8}_\d{6}\.(zip|tar\.gz|tar)(\.manifest\.json)?$'
+
+
+def _sanitize(value):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(value))
+
+
+def expand_matrix(spec):
+    """将矩阵展开为各变体的构建配置，参数不合法时抛出 ValueError"""
+    if not isinstance(spec, dict):
+        raise ValueError('矩阵必须是 JSON 对象')
+    # 并发上限在组准备完成后才使用，提交时先校验
+    max_parallel_for(spec)
+    prefix = _sanitize(spec.get('db_name') or 'matrix')
+    full_versions = spec.get('jdk_full_versions') or {}
+    boot_jdk_paths = spec.get('boot_jdk_paths') or {}
+    if not isinstance(full_versions, dict) or not isinstance(boot_jdk_paths, dict):
+        raise ValueError('jdk_full_versions 和 boot_jdk_paths 必须是对象')
+
+    if spec.get('variants'):
+        if not isinstance(spec['variants'], list) or not all(isinstance(v, dict) for v in spec['variants']):
+            raise ValueError('variants 必须是对象列表')
+        pairs = [(str(v.get('jdk_version', '')), v.get('build_mode', 'hybrid'), v.get('jdk_full_version'))
+                 for v in spec['variants']]
+    else:
+        versions = [str(v) for v in spec.get('jdk_versions') or []]
+        modes = spec.get('build_modes') or ['hybrid']
+        pairs = [(version, mode, None) for version in versions for mode in modes]
+
+    if not pairs:
+        raise ValueError('矩阵中没有任何变体')
+    if len(pairs) > MAX_VARIANTS:
+        raise ValueError(f'变体数量 {len(pairs)} 超过上限 {MAX_VARIANTS}')
+
+    variants = []
+    seen = set()
+    for version, mode, full_version in pairs:
+        if version not in SUPPORTED_JDK_VERSIONS:
+            raise ValueError(f'不支持的JDK版本: {version}')
+        if mode not in SUPPORTED_BUILD_MODES:
+            raise ValueError(f'不支持的构建模式: {mode}')
+        full_version = full_version or full_versions.get(version, '')
+        db_name = f"{prefix}_jdk{_sanitize(full_version or version)}_{mode}"
+        if db_name in seen:
+            raise ValueError(f'重复的变体: {db_name}')
+        seen.add(db_name)
+        variants.append({
+            'jdk_version': version,
+            'jdk_full_version': full_version,
+            'build_mode': mode,
+            'db_name': db_name,
+            'boot_jdk_path': boot_jdk_paths.get(version) or spec.get('boot_jdk_path', '')
+        })
+    return variants
+
+
+def max_parallel_for(spec):
+    value = spec.get('max_parallel') or MATRIX_MAX_PARALLEL
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'max_parallel 必须是整数: {value!r}')
+    return max(1, min(value, MATRIX_MAX_PARALLEL))
+
+
+def _run(cmd, log_file, env=None, check=True):
+    """执行准备步骤，输出追加到组日志"""
+    with open(log_file, 'a') as f:
+        f.write(f"$ {' '.join(cmd)}\n")
+        f.flush()
+        result = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=f,
+                                universal_newlines=True)
+        f.write(result.stdout)
+    if check and result.returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd)} 失败 (退出码 {result.returncode})")
+    return result
+
+
+def _ensure_jdk_source(jdk_version, jdk_full_version, work_dir, log_file):
+    """确保JDK源码已在源码缓存中（未命中时下载一次并保存）"""
+    check = _run(['/bin/bash', CACHE_MANAGER, 'check-source', jdk_version, jdk_full_version],
+                 log_file, check=False)
+    if check.returncode == 0:
+        return
+
+    source_dir = work_dir / f'source-{_sanitize(jdk_version)}-{_sanitize(jdk_full_version or "latest")}'
+    source_dir.mkdir(parents=True, exist_ok=True)
+    env = dict(os.environ, JDK_VERSION=jdk_version, JDK_FULL_VERSION=jdk_full_version,
+               JDK_SOURCE_DIR=str(source_dir))
+    try:
+        _run(['/bin/bash', DOWNLOAD_SCRIPT], log_file, env=env)
+        _run(['/bin/bash', CACHE_MANAGER, 'save-source', jdk_version, jdk_full_version, str(source_dir)],
+             log_file)
+    finally:
+        shutil.rmtree(source_dir, ignore_errors=True)
+
+
+def prepare_shared(variants, user_source_dir, work_dir, log_file):
+    """组内共享的准备工作，返回传给各变体 build-db.sh 的环境变量"""
+    user_source_dir = Path(user_source_dir)
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    env = {}
+
+    user_present = user_source_dir.is_dir() and any(user_source_dir.iterdir())
+    if user_present:
+        result = _run(['/bin/bash', CACHE_MANAGER, 'hash', str(user_source_dir)], log_file)
+        env['USER_SOURCE_HASH'] = result.stdout.strip()
+
+    # 每个不同的JDK版本只下载一次，各版本并行
+    sources = sorted({(v['jdk_version'], v['jdk_full_version']) for v in variants})
+    with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+        futures = [executor.submit(_ensure_jdk_source, version, full_version, work_dir, log_file)
+                   for version, full_version in sources]
+        for future in futures:
+            future.result()
+
+    if user_present and any(v['build_mode'] != 'jdk_only' for v in variants):
+        result = _run(['/bin/bash', CACHE_MANAGER, 'prepare-deps', str(user_source_dir)], log_file)
+        offline = 'DEPS_OFFLINE=true' in result.stdout.splitlines()
+        env['DEPS_OFFLINE'] = 'true' if offline else 'false'
+
+    return env
+
+
+def prepare_workdir(work_dir, variant, user_source_dir, parallel):
+    """为变体准备独立的工作目录（JDK源码、用户源码副本和Ant构建文件互不干扰）"""
+    variant_dir = Path(work_dir) / variant['db_name']
+    shutil.rmtree(variant_dir, ignore_errors=True)
+    variant_dir.mkdir(parents=True)
+
+    user_copy = variant_dir / 'user-source'
+    user_source_dir = Path(user_source_dir)
+    if variant['build_mode'] != 'jdk_only' and user_source_dir.is_dir():
+        shutil.copytree(user_source_dir, user_copy, symlinks=True)
+    else:
+        user_copy.mkdir()
+
+    return {
+        'JDK_SOURCE_DIR': str(variant_dir / 'source'),
+        'USER_SOURCE_DIR': str(user_copy),
+        'BUILD_USER_XML_PATH': str(variant_dir / 'build-user.xml'),
+        # 并发构建分摊 CodeQL 内存上限
+        'CODEQL_RAM_MB': str(max(4096, CODEQL_TOTAL_RAM_MB // parallel))
+    }
+
+
+def find_latest_archive(archive_dir, db_name):
+    """数据库最新的压缩包（分块存储的压缩包返回清单路径）"""
+    pattern = re.compile('^' + re.escape(db_name) + ARCHIVE_NAME_RE)
+    matches = sorted(p for p in Path(archive_dir).iterdir() if pattern.match(p.name))
+    return matches[-1] if matches else None
+
+
+def _tar_header(name, size, mtime):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mode = 0o644
+    info.mtime = int(mtime)
+    return info.tobuf(tarfile.GNU_FORMAT, 'utf-8', 'surrogateescape')
+
+
+def _padding(size):
+    remainder = size % tarfile.BLOCKSIZE
+    return tarfile.BLOCKSIZE - remainder if remainder else 0
+
+
+def bundle_members(archive_dir, db_names):
+    """组合下载包含的成员: [(成员名, 大小, mtime, 读取函数)]"""
+    members = []
+    for db_name in db_names:
+        path = find_latest_archive(archive_dir, db_name)
+        if path is None:
+            continue
+        mtime = path.stat().st_mtime
+        if path.name.endswith(chunk_store.MANIFEST_SUFFIX):
+            manifest = chunk_store.load_manifest(path)
+            name = path.name[:-len(chunk_store.MANIFEST_SUFFIX)]
+            members.append((name, chunk_store.tar_size(manifest), mtime,
+                            lambda p=path: chunk_store.iter_tar(p)))
+        else:
+            members.append((path.name, path.stat().st_size, mtime, lambda p=path: _iter_file(p)))
+    return members
+
+
+def _iter_file(path, block_size=1024 * 1024):
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            yield block
+
+
+def bundle_size(members):
+    total = 0
+    for name, size, mtime, _ in members:
+        total += len(_tar_header(name, size, mtime)) + size + _padding(size)
+    total += 2 * tarfile.BLOCKSIZE
+    remainder = total % tarfile.RECORDSIZE
+    return total + (tarfile.RECORDSIZE - remainder if remainder else 0)
+
+
+def iter_bundle(members):
+    """将各变体的压缩包依次写成一个 tar 流（不落盘）"""
+    total = 0
+    for name, size, mtime, reader in members:
+        header = _tar_header(name, size, mtime)
+        total += len(header)
+        yield header
+        for data in reader():
+            total += len(data)
+            yield data
+        padding = _padding(size)
+        total += padding
+        if padding:
+            yield b'\0' * padding
+
+    trailer = 2 * tarfile.BLOCKSIZE
+    remainder = (total + trailer) % tarfile.RECORDSIZE
+    yield b'\0' * (trailer + (tarfile.RECORDSIZE - remainder if remainder else 0))
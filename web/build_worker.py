@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+分布式构建Worker
+从Web协调节点租用构建任务，执行 build-db.sh 流水线，并回传日志、状态和数据库压缩包
+
+用法:
+    python3 build_worker.py --coordinator http://coordinator:8080 --worker-id worker-1
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import tarfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+SCRIPTS_DIR = Path(os.getenv('SCRIPTS_DIR', '/app/scripts'))
+BUILD_SCRIPT = os.getenv('BUILD_SCRIPT', str(SCRIPTS_DIR / 'build-db.sh'))
+DATABASE_MANAGER = os.getenv('DATABASE_MANAGER', str(SCRIPTS_DIR / 'database-manager.sh'))
+# 每个 Worker 在 <WORKER_WORK_DIR>/<worker_id>/ 下使用独立的源码和数据库目录，同一台机器可运行多个 Worker
+WORKER_WORK_DIR = Path(os.getenv('WORKER_WORK_DIR', '/app/worker'))
+
+LOG_FLUSH_INTERVAL = 1.0
+LOG_FLUSH_LINES = 200
+
+
+def build_environment(config):
+    """根据构建配置生成 build-db.sh 的环境变量（协调节点与Worker共用）"""
+    env = os.environ.copy()
+    env.update({
+        'JDK_VERSION': config['jdk_version'],
+        'JDK_FULL_VERSION': config.get('jdk_full_version', ''),
+        'BUILD_MODE': config['build_mode'],
+        'DB_NAME': config['db_name']
+    })
+
+    if config.get('boot_jdk_path'):
+        env['BOOT_JDK_PATH'] = config['boot_jdk_path']
+    
+    # 构建矩阵的变体附带工作目录和共享准备结果（JDK_SOURCE_DIR、DEPS_OFFLINE 等）
+    env.update(config.get('env') or {})
+    
+    return env
+
+
+class LeaseLost(Exception):
+    """任务租约已失效（超时被重新分配或被停止）"""
+
+
+class BuildWorker:
+    def __init__(self, coordinator, worker_id, poll_interval=5):
+        self.coordinator = coordinator.rstrip('/')
+        self.worker_id = worker_id
+        self.poll_interval = poll_interval
+        self.session = requests.Session()
+        self.stopping = False
+        self.work_dir = WORKER_WORK_DIR / re.sub(r'[^A-Za-z0-9_.-]', '_', worker_id)
+
+    def _url(self, path):
+        return f"{self.coordinator}{path}"
+
+    def _post(self, path, payload=None, **kwargs):
+        payload = dict(payload or {}, worker_id=self.worker_id)
+        response = self.session.post(self._url(path), json=payload, timeout=30, **kwargs)
+        if response.status_code == 409:
+            raise LeaseLost(response.text)
+        response.raise_for_status()
+        return response
+
+    def lease(self):
+        """租用一个排队中的构建任务，没有任务时返回 None"""
+        response = self._post('/api/worker/lease')
+        if response.status_code == 204:
+            return None
+        return response.json()
+
+    def run_forever(self):
+        logging.info(f"Worker {self.worker_id} 已启动，协调节点: {self.coordinator}")
+        while not self.stopping:
+            try:
+                job = self.lease()
+            except Exception as e:
+                logging.warning(f"租用任务失败: {str(e)}")
+                job = None
+
+            if job is None:
+                time.sleep(self.poll_interval)
+                continue
+
+            try:
+                self.run_job(job)
+            except LeaseLost as e:
+                logging.warning(f"任务 {job['build_id']} 租约失效: {str(e)}")
+            except Exception as e:
+                logging.error(f"任务 {job['build_id']} 执行失败: {str(e)}")
+                try:
+                    self._post(f"/api/worker/jobs/{job['build_id']}/complete",
+                               {'status': 'error', 'error': str(e)})
+                except Exception:
+                    pass
+
+    def run_job(self, job):
+        build_id = job['build_id']
+        config = job['config']
+        lease_ttl = job.get('lease_ttl', 60)
+        logging.info(f"开始执行任务 {build_id}: {json.dumps(config, ensure_ascii=False)}")
+
+        # 构建矩阵变体自带的工作目录优先
+        env = build_environment(config)
+        for key, value in self._prepare_workdir(build_id, config).items():
+            if key not in (config.get('env') or {}):
+                env[key] = value
+
+        process = subprocess.Popen(
+            ['/bin/bash', BUILD_SCRIPT],
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            preexec_fn=os.setsid
+        )
+
+        lease_state = {'lost': None}
+        heartbeat_stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat_loop,
+            args=(build_id, process, max(lease_ttl / 3, 1), heartbeat_stop, lease_state),
+            daemon=True
+        )
+        heartbeat.start()
+
+        # 压缩和上传多 GB 的数据库可能远超租约时间，心跳持续到上报完成为止
+        try:
+            try:
+                self._stream_log(build_id, process)
+                return_code = process.wait()
+            finally:
+                if process.poll() is None:
+                    try:
+                        os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+
+            if lease_state['lost']:
+                raise LeaseLost(lease_state['lost'])
+
+            if return_code != 0:
+                self._post(f"/api/worker/jobs/{build_id}/complete",
+                           {'status': 'failed', 'return_code': return_code})
+                return
+
+            archive_name = self._compress_and_upload(build_id, config['db_name'], env['DATABASE_DIR'])
+            if lease_state['lost']:
+                raise LeaseLost(lease_state['lost'])
+            self._post(f"/api/worker/jobs/{build_id}/complete",
+                       {'status': 'success', 'return_code': 0, 'archive_name': archive_name})
+            logging.info(f"任务 {build_id} 完成")
+        finally:
+            heartbeat_stop.set()
+            heartbeat.join()
+
+    def _prepare_workdir(self, build_id, config):
+        """准备本 Worker 的工作目录并取回任务附带的用户源码，返回 build-db.sh 的路径环境变量"""
+        source_dir = self.work_dir / 'source'
+        user_dir = self.work_dir / 'user-source'
+        database_dir = self.work_dir / 'database'
+
+        # 上一个任务的源码可能属于其他JDK版本，每个任务都从源码缓存重新恢复
+        shutil.rmtree(source_dir, ignore_errors=True)
+        shutil.rmtree(user_dir, ignore_errors=True)
+        user_dir.mkdir(parents=True)
+        database_dir.mkdir(exist_ok=True)
+
+        if config.get('user_source'):
+            self._fetch_user_source(build_id, config['user_source'], user_dir)
+
+        return {
+            'JDK_SOURCE_DIR': str(source_dir),
+            'USER_SOURCE_DIR': str(user_dir),
+            'BUILD_USER_XML_PATH': str(self.work_dir / 'build-user.xml'),
+            'DATABASE_DIR': str(database_dir),
+            'SOURCE_ROOT': str(self.work_dir)
+        }
+
+    def _fetch_user_source(self, build_id, snapshot, user_dir):
+        """下载协调节点在入队时保存的用户源码快照，校验后解压"""
+        archive_path = self.work_dir / 'user-source.tar.gz'
+        digest = hashlib.sha256()
+        response = self.session.get(self._url(f"/api/worker/jobs/{build_id}/user-source"),
+                                    params={'worker_id': self.worker_id}, stream=True, timeout=30)
+        if response.status_code == 409:
+            raise LeaseLost(response.text)
+        response.raise_for_status()
+        try:
+            with open(archive_path, 'wb') as f:
+                for block in response.iter_content(1024 * 1024):
+                    digest.update(block)
+                    f.write(block)
+            if digest.hexdigest() != snapshot['sha256']:
+                raise RuntimeError(f"用户源码快照校验失败: {build_id}")
+            with tarfile.open(archive_path) as tar:
+                tar.extractall(user_dir)
+        finally:
+            if archive_path.exists():
+                archive_path.unlink()
+        logging.info(f"已取回用户源码快照 ({snapshot['size']} 字节)")
+
+    def _heartbeat_loop(self, build_id, process, interval, stop_event, lease_state):
+        """定期续约；任务被停止或租约失效时终止构建进程组"""
+        while not stop_event.wait(interval):
+            try:
+                response = self._post(f"/api/worker/jobs/{build_id}/heartbeat")
+                cancel = response.json().get('cancel', False)
+            except LeaseLost as e:
+                lease_state['lost'] = str(e)
+                cancel = True
+            except Exception as e:
+                logging.warning(f"心跳失败: {str(e)}")
+                continue
+
+            if cancel:
+                logging.info(f"任务 {build_id} 已取消，终止构建进程")
+                try:
+                    os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+                return
+
+    def _stream_log(self, build_id, process):
+        """批量回传构建日志"""
+        buffer = []
+        last_flush = time.time()
+        for line in process.stdout:
+            buffer.append(line)
+            if len(buffer) >= LOG_FLUSH_LINES or time.time() - last_flush >= LOG_FLUSH_INTERVAL:
+                self._send_log(build_id, buffer)
+                buffer = []
+                last_flush = time.time()
+        if buffer:
+            self._send_log(build_id, buffer)
+
+    def _send_log(self, build_id, lines):
+        try:
+            self._post(f"/api/worker/jobs/{build_id}/log", {'lines': lines})
+        except LeaseLost:
+            raise
+        except Exception as e:
+            logging.warning(f"日志回传失败: {str(e)}")
+
+    def _compress_and_upload(self, build_id, db_name, database_dir):
+        """本地压缩数据库并流式上传到协调节点"""
+        # 分块去重存储只在协调节点上，Worker 上传单文件压缩包，由协调节点登记时再分块
+        archive_format = os.getenv('ARCHIVE_FORMAT', 'zip')
+        env = dict(os.environ, DATABASE_DIR=database_dir,
+                   ARCHIVE_FORMAT='zip' if archive_format == 'chunked' else archive_format)
+        result = subprocess.run(['/bin/bash', DATABASE_MANAGER, 'compress', db_name],
+                                capture_output=True, text=True, check=True, env=env)
+        archive_path = Path(result.stdout.strip().splitlines()[-1])
+
+        info = subprocess.run(['/bin/bash', DATABASE_MANAGER, 'info', archive_path.name],
+                              capture_output=True, text=True, env=env)
+        original_size_mb = 0
+        if info.returncode == 0 and info.stdout.strip():
+            original_size_mb = json.loads(info.stdout).get('original_size_mb', 0)
+
+        logging.info(f"上传数据库压缩包: {archive_path.name}")
+        with open(archive_path, 'rb') as f:
+            response = self.session.put(
+                self._url(f"/api/worker/jobs/{build_id}/archive/{archive_path.name}"),
+                params={'worker_id': self.worker_id, 'original_size_mb': original_size_mb},
+                data=f,
+                timeout=None
+            )
+        if response.status_code == 409:
+            raise LeaseLost(response.text)
+        response.raise_for_status()
+
+        # 上传成功后删除本地副本
+        subprocess.run(['/bin/bash', DATABASE_MANAGER, 'delete', archive_path.name],
+                       capture_output=True, env=env)
+        return archive_path.name
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CodeQL Builder 分布式构建Worker')
+    parser.add_argument('--coordinator', default=os.getenv('COORDINATOR_URL', 'http://localhost:8080'),
+                        help='协调节点（Web管理界面）地址')
+    parser.add_argument('--worker-id', default=os.getenv('WORKER_ID', f"{socket.gethostname()}-{os.getpid()}"))
+    parser.add_argument('--poll-interval', type=float, default=float(os.getenv('WORKER_POLL_INTERVAL', '5')))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    worker = BuildWorker(args.coordinator, args.worker_id, args.poll_interval)
+
+    def handle_signal(signum, frame):
+        worker.stopping = True
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    worker.run_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+远程缓存服务
+为多个构建节点提供共享的内容寻址缓存（CAS），由 cache-manager.sh 作为第二级缓存使用
+
+存储布局:
+    <root>/objects/<digest[:2]>/<digest>   按 SHA-256 寻址的缓存对象（tar.gz 流）
+    <root>/refs/<cache_key>.json           缓存键 -> 对象摘要及元数据
+
+用法:
+    python3 cache_server.py --root /app/remote-cache --port 8090
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from flask import Flask, abort, jsonify, request, send_file
+
+app = Flask(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+KEY_PATTERN = re.compile(r'^[A-Za-z0-9._+-]+$')
+
+app.config['CACHE_ROOT'] = Path(os.getenv('REMOTE_CACHE_ROOT', '/app/remote-cache'))
+app.config['CACHE_TOKEN'] = os.getenv('REMOTE_CACHE_TOKEN', '')
+
+
+def objects_dir() -> Path:
+    return app.config['CACHE_ROOT'] / 'objects'
+
+
+def refs_dir() -> Path:
+    return app.config['CACHE_ROOT'] / 'refs'
+
+
+def object_path(digest: str) -> Path:
+    if not DIGEST_PATTERN.match(digest):
+        abort(400, description='invalid digest')
+    return objects_dir() / digest[:2] / digest
+
+
+def ref_path(cache_key: str) -> Path:
+    if not KEY_PATTERN.match(cache_key):
+        abort(400, description='invalid cache key')
+    return refs_dir() / f'{cache_key}.json'
+
+
+@app.before_request
+def check_token():
+    """如果配置了 REMOTE_CACHE_TOKEN，则要求 Bearer 认证"""
+    token = app.config['CACHE_TOKEN']
+    if token and request.endpoint != 'health':
+        if request.headers.get('Authorization', '') != f'Bearer {token}':
+            abort(401)
+
+
+@app.route('/health')
+def health():
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/cas/<digest>', methods=['GET', 'HEAD'])
+def get_object(digest):
+    """下载缓存对象（支持 Range，便于断点续传）"""
+    path = object_path(digest)
+    if not path.exists():
+        abort(404)
+    return send_file(path, mimetype='application/octet-stream', conditional=True, etag=digest)
+
+
+def receive_object(expected_digest=None):
+    """流式接收请求体到临时文件并计算摘要，校验通过后原子落盘"""
+    objects_dir().mkdir(parents=True, exist_ok=True)
+    sha256 = hashlib.sha256()
+    size = 0
+
+    fd, tmp_name = tempfile.mkstemp(dir=objects_dir(), prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = request.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+
+        digest = sha256.hexdigest()
+        if expected_digest and digest != expected_digest:
+            abort(400, description=f'digest mismatch: expected {expected_digest}, got {digest}')
+
+        path = object_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            os.unlink(tmp_name)
+        else:
+            os.replace(tmp_name, path)
+        return digest, size
+    finally:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+
+
+@app.route('/cas', methods=['POST'])
+def post_object():
+    """上传缓存对象，由服务端计算摘要"""
+    digest, size = receive_object()
+    logging.info(f"Stored object {digest} ({size} bytes)")
+    return jsonify({'digest': digest, 'size': size}), 201
+
+
+@app.route('/cas/<digest>', methods=['PUT'])
+def put_object(digest):
+    """按指定摘要上传缓存对象，内容与摘要不符时拒绝"""
+    object_path(digest)
+    digest, size = receive_object(expected_digest=digest)
+    return jsonify({'digest': digest, 'size': size}), 201
+
+
+@app.route('/refs')
+def list_refs():
+    refs = []
+    if refs_dir().exists():
+        for path in sorted(refs_dir().glob('*.json')):
+            try:
+                refs.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+    return jsonify(refs)
+
+
+@app.route('/refs/<cache_key>', methods=['GET'])
+def get_ref(cache_key):
+    path = ref_path(cache_key)
+    if not path.exists():
+        abort(404)
+    return send_file(path, mimetype='application/json')
+
+
+@app.route('/refs/<cache_key>', methods=['PUT'])
+def put_ref(cache_key):
+    """登记缓存键，所引用的对象必须已存在"""
+    path = ref_path(cache_key)
+    ref = request.get_json(force=True, silent=True) or {}
+    digest = ref.get('digest', '')
+    if not object_path(digest).exists():
+        abort(409, description=f'object {digest} not found')
+
+    ref['cache_key'] = cache_key
+    ref['size'] = object_path(digest).stat().st_size
+
+    refs_dir().mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=refs_dir(), prefix='.ref-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(ref, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_name, path)
+
+    logging.info(f"Registered ref {cache_key} -> {digest}")
+    return jsonify(ref), 201
+
+
+@app.route('/refs/<cache_key>', methods=['DELETE'])
+def delete_ref(cache_key):
+    path = ref_path(cache_key)
+    if not path.exists():
+        abort(404)
+    path.unlink()
+    return jsonify({'status': 'success'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CodeQL Builder 远程缓存服务')
+    parser.add_argument('--root', default=str(app.config['CACHE_ROOT']), help='缓存存储目录')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.getenv('REMOTE_CACHE_PORT', '8090')))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    app.config['CACHE_ROOT'] = Path(args.root)
+    objects_dir().mkdir(parents=True, exist_ok=True)
+    refs_dir().mkdir(parents=True, exist_ok=True)
+
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+数据库压缩包分块去重存储
+同一 JDK 版本的数据库之间 db-java 池文件、src.zip 大部分相同，按内容定义分块后每个唯一块只保存一次，
+下载时再根据清单按需拼出 tar 流。
+
+存储布局（位于压缩包目录下）:
+    archives/<name>.tar.manifest.json       压缩包清单: 文件列表及每个文件的块序列
+    archives/.chunks/objects/<d[:2]>/<d>    按未压缩内容 SHA-256 寻址的块（zlib 压缩）
+    archives/.chunks/files/<d[:2]>/<d>      整文件摘要 -> 块序列（相同文件无需再次分块）
+
+用法:
+    python3 chunk_store.py store <db_dir> <manifest>     分块保存数据库目录，输出统计JSON
+    python3 chunk_store.py tar <manifest>                将清单还原为 tar 流输出到标准输出
+    python3 chunk_store.py gc <archives_dir>             删除不再被任何清单引用的块
+    python3 chunk_store.py stats <archives_dir>          输出去重统计JSON
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import re
+import sys
+import tarfile
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+
+MANIFEST_SUFFIX = '.manifest.json'
+STORE_DIR_NAME = '.chunks'
+
+# 分块参数: 最小 64KB，平均约 256KB，最大 1MB
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+READ_SIZE = 8 * 1024 * 1024
+
+# 内容定义分块: 先用正则（C实现）找出候选字节位置，再对其前 64 字节窗口计算 crc32，
+# 低 12 位为 0 时切分。切分点只取决于局部内容，插入/删除数据不会影响后续块的边界。
+# 纯文本中不含这些候选字节，会退化为按 MAX_CHUNK_SIZE 定长切分（文本文件主要依赖整文件去重）。
+BOUNDARY_CANDIDATES = re.compile(b'[\x8f\xb3\xd5\xe9]')
+BOUNDARY_WINDOW = 64
+BOUNDARY_MASK = (1 << 12) - 1
+
+# tar 记录大小（与 GNU tar / tarfile 一致），用于预先计算流的总长度
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+TAR_RECORD_SIZE = tarfile.RECORDSIZE
+
+
+def manifest_path_for(archive_path) -> Path:
+    """压缩包路径 -> 清单路径（分块压缩包在磁盘上只有清单文件）"""
+    return Path(str(archive_path) + MANIFEST_SUFFIX)
+
+
+def store_for(manifest_path) -> 'ChunkStore':
+    """返回清单所在目录对应的块存储"""
+    return ChunkStore(Path(manifest_path).parent / STORE_DIR_NAME)
+
+
+def load_manifest(manifest_path) -> dict:
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def find_boundary(buf, start: int, end: int) -> int:
+    """在 buf[start:end] 中寻找下一个切分点，返回块结束位置"""
+    lo = start + MIN_CHUNK_SIZE
+    hi = min(start + MAX_CHUNK_SIZE, end)
+    if lo >= hi:
+        return hi
+    view = memoryview(buf)
+    for match in BOUNDARY_CANDIDATES.finditer(buf, lo, hi):
+        pos = match.end()
+        if not zlib.crc32(view[pos - BOUNDARY_WINDOW:pos]) & BOUNDARY_MASK:
+            return pos
+    return hi
+
+
+def iter_chunks(fileobj):
+    """按内容定义边界读取文件块"""
+    buf = b''
+    eof = False
+    while True:
+        if not eof and len(buf) < MAX_CHUNK_SIZE:
+            data = fileobj.read(READ_SIZE)
+            if data:
+                buf += data
+            else:
+                eof = True
+        if not buf:
+            return
+        if not eof and len(buf) < MAX_CHUNK_SIZE:
+            continue
+
+        start = 0
+        while len(buf) - start >= MAX_CHUNK_SIZE or (eof and start < len(buf)):
+            end = find_boundary(buf, start, len(buf))
+            yield buf[start:end]
+            start = end
+        buf = buf[start:]
+
+
+class ChunkStore:
+    """内容寻址的块存储"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.objects_dir = self.root / 'objects'
+        self.files_dir = self.root / 'files'
+        self.lock_file = self.root / '.lock'
+
+    @contextmanager
+    def locked(self, exclusive=False):
+        """写入块时持有共享锁，垃圾回收时持有排他锁"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_file, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def object_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest
+
+    def put_chunk(self, data: bytes):
+        """保存一个块，返回 (摘要, 新增的存储字节数)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if path.exists():
+            return digest, 0
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        compressed = zlib.compress(data, 6)
+        tmp_path = path.with_name(f'.{digest}.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+        return digest, len(compressed)
+
+    def get_chunk(self, digest: str) -> bytes:
+        with open(self.object_path(digest), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def store_file(self, fileobj):
+        """分块保存一个文件，返回 (块列表 [[摘要, 大小], ...], 新增字节数, 新增块数)"""
+        chunks = []
+        new_bytes = 0
+        new_chunks = 0
+        for data in iter_chunks(fileobj):
+            digest, added = self.put_chunk(data)
+            chunks.append([digest, len(data)])
+            new_bytes += added
+            new_chunks += 1 if added else 0
+        return chunks, new_bytes, new_chunks
+
+    def _file_index_path(self, file_digest: str) -> Path:
+        return self.files_dir / file_digest[:2] / file_digest
+
+    def _lookup_file(self, file_digest: str):
+        """整文件去重: 相同内容的文件直接复用已知的块序列"""
+        path = self._file_index_path(file_digest)
+        if not path.exists():
+            return None
+        with open(path) as f:
+            chunks = json.load(f)
+        if all(self.object_path(digest).exists() for digest, _ in chunks):
+            return chunks
+        return None
+
+    def _remember_file(self, file_digest: str, chunks):
+        path = self._file_index_path(file_digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'.{file_digest}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(chunks, f)
+        os.replace(tmp_path, path)
+
+    def store_directory(self, src_dir, manifest_path) -> dict:
+        """分块保存整个目录，条目名以目录名为根（与 tar -C parent name 一致）"""
+        src_dir = Path(src_dir)
+        root_name = src_dir.name
+        entries = []
+        summary = {'files': 0, 'chunks': 0, 'new_chunks': 0, 'logical_bytes': 0, 'new_bytes': 0}
+
+        with self.locked():
+            for dirpath, dirnames, filenames in os.walk(src_dir):
+                dirnames.sort()
+                rel_dir = Path(dirpath).relative_to(src_dir.parent).as_posix()
+                st = os.stat(dirpath)
+                entries.append({'name': rel_dir, 'type': 'dir',
+                                'mode': st.st_mode & 0o7777, 'mtime': int(st.st_mtime)})
+
+                for filename in sorted(filenames):
+                    file_path = Path(dirpath) / filename
+                    st = os.lstat(file_path)
+                    name = f'{rel_dir}/{filename}'
+                    if os.path.islink(file_path):
+                        entries.append({'name': name, 'type': 'symlink', 'target': os.readlink(file_path),
+                                        'mode': 0o777, 'mtime': int(st.st_mtime)})
+                        continue
+                    if not file_path.is_file():
+                        continue
+
+                    file_hash = hashlib.sha256()
+                    with open(file_path, 'rb') as f:
+                        for block in iter(lambda: f.read(READ_SIZE), b''):
+                            file_hash.update(block)
+                    file_digest = file_hash.hexdigest()
+
+                    chunks = self._lookup_file(file_digest)
+                    if chunks is None:
+                        with open(file_path, 'rb') as f:
+                            chunks, new_bytes, new_chunks = self.store_file(f)
+                        self._remember_file(file_digest, chunks)
+                        summary['new_bytes'] += new_bytes
+                        summary['new_chunks'] += new_chunks
+
+                    entries.append({'name': name, 'type': 'file', 'mode': st.st_mode & 0o7777,
+                                    'mtime': int(st.st_mtime), 'size': st.st_size,
+                                    'sha256': file_digest, 'chunks': chunks})
+                    summary['files'] += 1
+                    summary['chunks'] += len(chunks)
+                    summary['logical_bytes'] += st.st_size
+
+            manifest = {
+                'version': 1,
+                'created_time': int(time.time()),
+                'root': root_name,
+                'logical_bytes': summary['logical_bytes'],
+                'entries': entries
+            }
+            manifest_path = Path(manifest_path)
+            tmp_path = manifest_path.with_name(f'.{manifest_path.name}.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, manifest_path)
+
+        return summary
+
+    def iter_file(self, entry):
+        """按块输出清单中一个文件的内容"""
+        for digest, _ in entry.get('chunks', []):
+            yield self.get_chunk(digest)
+
+    def gc(self, manifest_paths) -> dict:
+        """删除不再被任何清单引用的块和整文件索引"""
+        removed_chunks = 0
+        removed_bytes = 0
+        with self.locked(exclusive=True):
+            live_chunks = set()
+            live_files = set()
+            for manifest_path in manifest_paths:
+                for entry in load_manifest(manifest_path)['entries']:
+                    if entry['type'] == 'file':
+                        live_files.add(entry['sha256'])
+                        live_chunks.update(digest for digest, _ in entry['chunks'])
+
+            if self.objects_dir.exists():
+                for path in self.objects_dir.glob('*/*'):
+                    if path.name not in live_chunks:
+                        removed_bytes += path.stat().st_size
+                        path.unlink()
+                        removed_chunks += 1
+            if self.files_dir.exists():
+                for path in self.files_dir.glob('*/*'):
+                    if path.name not in live_files:
+                        path.unlink()
+
+        return {'removed_chunks': removed_chunks, 'removed_bytes': removed_bytes}
+
+    def manifest_size(self, manifest_path) -> dict:
+        """单个压缩包的大小: 原始大小与其引用的唯一块实际占用的存储（不随其他压缩包增删而变化）"""
+        manifest = load_manifest(manifest_path)
+        digests = set()
+        for entry in manifest['entries']:
+            if entry['type'] == 'file':
+                digests.update(digest for digest, _ in entry['chunks'])
+
+        stored_bytes = 0
+        for digest in digests:
+            path = self.object_path(digest)
+            if path.exists():
+                stored_bytes += path.stat().st_size
+        return {'logical_bytes': manifest.get('logical_bytes', 0), 'stored_bytes': stored_bytes}
+
+    def stats(self, manifest_paths) -> dict:
+        """统计逻辑大小（所有压缩包原始大小之和）与去重后的实际存储大小"""
+        logical_bytes = 0
+        for manifest_path in manifest_paths:
+            logical_bytes += load_manifest(manifest_path).get('logical_bytes', 0)
+
+        stored_bytes = 0
+        chunk_count = 0
+        if self.objects_dir.exists():
+            for path in self.objects_dir.glob('*/*'):
+                stored_bytes += path.stat().st_size
+                chunk_count += 1
+
+        return {
+            'archives': len(manifest_paths),
+            'chunks': chunk_count,
+            'logical_bytes': logical_bytes,
+            'stored_bytes': stored_bytes,
+            'dedup_ratio': round(logical_bytes / stored_bytes, 2) if stored_bytes else 0
+        }
+
+
+def list_manifests(archives_dir):
+    return sorted(Path(archives_dir).glob('*' + MANIFEST_SUFFIX))
+
+
+def _tar_header(entry) -> bytes:
+    info = tarfile.TarInfo(entry['name'])
+    info.mode = entry.get('mode', 0o644)
+    info.mtime = entry.get('mtime', 0)
+    if entry['type'] == 'dir':
+        info.type = tarfile.DIRTYPE
+    elif entry['type'] == 'symlink':
+        info.type = tarfile.SYMTYPE
+        info.linkname = entry['target']
+    else:
+        info.size = entry['size']
+    return info.tobuf(tarfile.GNU_FORMAT, 'utf-8', 'surrogateescape')
+
+
+def _tar_padding(size: int) -> int:
+    remainder = size % TAR_BLOCK_SIZE
+    return TAR_BLOCK_SIZE - remainder if remainder else 0
+
+
+def tar_size(manifest) -> int:
+    """计算还原出的 tar 流的字节数（用于 Content-Length）"""
+    total = 0
+    for entry in manifest['entries']:
+        total += len(_tar_header(entry))
+        if entry['type'] == 'file':
+            total += entry['size'] + _tar_padding(entry['size'])
+    total += 2 * TAR_BLOCK_SIZE
+    remainder = total % TAR_RECORD_SIZE
+    return total + (TAR_RECORD_SIZE - remainder if remainder else 0)
+
+
+def _tar_segments(manifest, store):
+    """把 tar 流按顺序拆成 (长度, 读取函数) 片段，按字节范围输出时可跳过范围外的块而不读取"""
+    total = 0
+    for entry in manifest['entries']:
+        header = _tar_header(entry)
+        total += len(header)
+        yield len(header), lambda header=header: header
+        if entry['type'] == 'file':
+            for digest, size in entry.get('chunks', []):
+                total += size
+                yield size, lambda digest=digest: store.get_chunk(digest)
+            padding = _tar_padding(entry['size'])
+            total += padding
+            if padding:
+                yield padding, lambda padding=padding: b'\0' * padding
+
+    trailer = 2 * TAR_BLOCK_SIZE
+    remainder = (total + trailer) % TAR_RECORD_SIZE
+    trailer += TAR_RECORD_SIZE - remainder if remainder else 0
+    yield trailer, lambda: b'\0' * trailer
+
+
+def iter_tar(manifest_path, start=0, end=None):
+    """根据清单按需生成 tar 流；指定 [start, end) 时只输出该字节范围（HTTP Range）"""
+    manifest = load_manifest(manifest_path)
+    store = store_for(manifest_path)
+    offset = 0
+    for size, read in _tar_segments(manifest, store):
+        segment_start, offset = offset, offset + size
+        if offset <= start:
+            continue
+        if end is not None and segment_start >= end:
+            break
+        data = read()
+        if segment_start < start or (end is not None and offset > end):
+            data = data[max(0, start - segment_start):None if end is None else end - segment_start]
+        yield data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据库压缩包分块去重存储')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_store = sub.add_parser('store', help='分块保存数据库目录')
+    p_store.add_argument('db_dir')
+    p_store.add_argument('manifest')
+
+    p_tar = sub.add_parser('tar', help='将清单还原为 tar 流')
+    p_tar.add_argument('manifest')
+
+    p_gc = sub.add_parser('gc', help='回收未引用的块')
+    p_gc.add_argument('archives_dir')
+
+    p_stats = sub.add_parser('stats', help='输出去重统计')
+    p_stats.add_argument('archives_dir')
+
+    p_size = sub.add_parser('size', help='输出单个压缩包的原始大小与存储大小')
+    p_size.add_argument('manifest')
+
+    args = parser.parse_args()
+    if args.command == 'store':
+        store = store_for(args.manifest)
+        print(json.dumps(store.store_directory(args.db_dir, args.manifest)))
+    elif args.command == 'tar':
+        for data in iter_tar(args.manifest):
+            sys.stdout.buffer.write(data)
+    elif args.command == 'gc':
+        store = ChunkStore(Path(args.archives_dir) / STORE_DIR_NAME)
+        print(json.dumps(store.gc(list_manifests(args.archives_dir))))
+    elif args.command == 'stats':
+        store = ChunkStore(Path(args.archives_dir) / STORE_DIR_NAME)
+        print(json.dumps(store.stats(list_manifests(args.archives_dir))))
+    elif args.command == 'size':
+        print(json.dumps(store_for(args.manifest).manifest_size(args.manifest)))
+
+
+if __name__ == '__main__':
+    main()
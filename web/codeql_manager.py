@@ -2,25 +2,219 @@
 """
 CodeQL管理模块
 提供CodeQL CLI的下载、安装和管理功能
+
+目录布局（/app/codeql）:
+    bundles/<version>.zip          已下载的发行包缓存（附 .sha256 校验值）
+    bundles/<version>.zip.part     未完成的下载（附 .part.json 断点状态）
+    versions/<version>/            解压后的 CodeQL CLI
+    current -> versions/<version>  当前使用的版本（符号链接，原子切换）
+
+用法:
+    python3 codeql_manager.py install [version]   下载并切换到指定版本（默认 latest）
+    python3 codeql_manager.py use <version>       切换到已安装的版本
+    python3 codeql_manager.py list                列出已安装的版本与缓存的发行包
 """
 
+import argparse
+import hashlib
+import json
 import os
-import os
+import re
+import shutil
+import stat
 import subprocess
-import requests
+import threading
+import time
 import zipfile
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, Any, Optional
 import logging
 
+import requests
+
+# 发行包下载地址，可指向镜像或本地HTTP服务
+DOWNLOAD_BASE = os.getenv('CODEQL_DOWNLOAD_BASE', 'https://github.com/github/codeql-cli-binaries/releases')
+DOWNLOAD_CONNECTIONS = int(os.getenv('CODEQL_DOWNLOAD_CONNECTIONS', '4'))
+EXTRACT_WORKERS = int(os.getenv('CODEQL_EXTRACT_WORKERS', str(min(8, os.cpu_count() or 1))))
+
+CHUNK_SIZE = 1024 * 1024
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+MAX_RETRIES = 5
+STATE_SAVE_INTERVAL = 2.0
+VERSION_PATTERN = re.compile(r'/v?(\d+\.\d+\.\d+[\w.-]*)/')
+
+# 发行页面可能提供的校验文件后缀
+CHECKSUM_SUFFIXES = ('.sha256', '.checksum.txt')
+
+
+class RangeDownloader:
+    """多连接分段下载，支持断点续传（状态保存在 <target>.part.json）"""
+
+    def __init__(self, url, target: Path, connections=DOWNLOAD_CONNECTIONS, progress_callback=None):
+        self.url = url
+        self.target = Path(target)
+        self.part_file = self.target.with_name(self.target.name + '.part')
+        self.state_file = self.target.with_name(self.target.name + '.part.json')
+        self.connections = max(1, connections)
+        self.progress_callback = progress_callback
+        self.lock = threading.Lock()
+        self.state = None
+        self.last_save = 0
+
+    def probe(self):
+        """获取最终地址、大小以及服务器是否支持 Range 请求"""
+        response = requests.head(self.url, allow_redirects=True, timeout=30)
+        response.raise_for_status()
+        size = int(response.headers.get('content-length', 0))
+        accept_ranges = response.headers.get('accept-ranges', '').lower() == 'bytes'
+        etag = response.headers.get('etag', '')
+        return response.url, size, accept_ranges, etag
+
+    def _load_state(self, url, size, etag):
+        """读取断点状态，服务器上的文件变化时重新开始"""
+        if self.state_file.exists() and self.part_file.exists():
+            try:
+                with open(self.state_file) as f:
+                    state = json.load(f)
+                # 重定向后的签名地址每次都不同，只按大小和 ETag 判断是否为同一文件
+                if state['size'] == size and state['etag'] == etag and self.part_file.stat().st_size == size:
+                    logging.info(f"从断点继续下载: 已完成 {self._downloaded(state)}/{size} bytes")
+                    state['url'] = url
+                    return state
+            except (ValueError, KeyError):
+                pass
+
+        segment_count = max(1, min(self.connections, size // MIN_SEGMENT_SIZE))
+        segment_size = size // segment_count
+        segments = []
+        for i in range(segment_count):
+            start = i * segment_size
+            end = size - 1 if i == segment_count - 1 else start + segment_size - 1
+            segments.append({'start': start, 'end': end, 'pos': start})
+
+        with open(self.part_file, 'wb') as f:
+            f.truncate(size)
+        return {'url': url, 'size': size, 'etag': etag, 'segments': segments}
+
+    @staticmethod
+    def _downloaded(state):
+        return sum(seg['pos'] - seg['start'] for seg in state['segments'])
+
+    def _save_state(self, force=False):
+        with self.lock:
+            now = time.time()
+            if not force and now - self.last_save < STATE_SAVE_INTERVAL:
+                return
+            self.last_save = now
+            tmp = self.state_file.with_name(self.state_file.name + '.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.state_file)
+
+    def _report_progress(self):
+        if self.progress_callback:
+            self.progress_callback(self._downloaded(self.state), self.state['size'])
+
+    def _fetch_segment(self, segment):
+        """下载一个分段，失败时从已写入的位置重试"""
+        session = requests.Session()
+        attempt = 0
+        while segment['pos'] <= segment['end']:
+            try:
+                headers = {'Range': f"bytes={segment['pos']}-{segment['end']}"}
+                with session.get(self.state['url'], headers=headers, stream=True, timeout=60) as response:
+                    if response.status_code != 206:
+                        raise requests.RequestException(f"服务器未返回分段内容: HTTP {response.status_code}")
+                    with open(self.part_file, 'r+b') as f:
+                        f.seek(segment['pos'])
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            remaining = segment['end'] + 1 - segment['pos']
+                            chunk = chunk[:remaining]
+                            f.write(chunk)
+                            with self.lock:
+                                segment['pos'] += len(chunk)
+                            self._report_progress()
+                            self._save_state()
+                            if segment['pos'] > segment['end']:
+                                break
+                attempt = 0
+            except (requests.RequestException, OSError) as e:
+                attempt += 1
+                if attempt > MAX_RETRIES:
+                    raise
+                logging.warning(f"分段 {segment['start']}-{segment['end']} 下载中断，第 {attempt} 次重试: {str(e)}")
+                time.sleep(min(2 ** attempt, 30))
+
+    def _fetch_single(self, url):
+        """服务器不支持 Range 时单连接下载"""
+        for attempt in range(1, MAX_RETRIES + 2):
+            try:
+                with requests.get(url, stream=True, timeout=60) as response:
+                    response.raise_for_status()
+                    total = int(response.headers.get('content-length', 0))
+                    downloaded = 0
+                    with open(self.part_file, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            f.write(chunk)
+                            downloaded += len(chunk)
+                            if self.progress_callback:
+                                self.progress_callback(downloaded, total)
+                return
+            except requests.RequestException as e:
+                if attempt > MAX_RETRIES:
+                    raise
+                logging.warning(f"下载中断，第 {attempt} 次重试: {str(e)}")
+                time.sleep(min(2 ** attempt, 30))
+
+    def download(self) -> Path:
+        self.target.parent.mkdir(parents=True, exist_ok=True)
+        url, size, accept_ranges, etag = self.probe()
+
+        if not size or not accept_ranges:
+            logging.info("服务器不支持分段下载，使用单连接下载")
+            self._fetch_single(url)
+        else:
+            self.state = self._load_state(url, size, etag)
+            pending = [seg for seg in self.state['segments'] if seg['pos'] <= seg['end']]
+            logging.info(f"分段下载: {len(self.state['segments'])} 个连接，共 {size} bytes")
+            try:
+                with ThreadPoolExecutor(max_workers=len(pending) or 1) as executor:
+                    for future in [executor.submit(self._fetch_segment, seg) for seg in pending]:
+                        future.result()
+            finally:
+                self._save_state(force=True)
+
+        os.replace(self.part_file, self.target)
+        if self.state_file.exists():
+            self.state_file.unlink()
+        return self.target
+
+
 class CodeQLManager:
     def __init__(self, base_dir='/app'):
         self.base_dir = Path(base_dir)
         self.codeql_dir = self.base_dir / 'codeql'
-        self.codeql_bin = self.codeql_dir / 'codeql'
-        self.download_url = "https://github.com/github/codeql-cli-binaries/releases/latest/download/codeql-linux64.zip"
+        self.bundles_dir = self.codeql_dir / 'bundles'
+        self.versions_dir = self.codeql_dir / 'versions'
+        self.current_link = self.codeql_dir / 'current'
         self.file_name = "codeql-linux64.zip"
-        
+        self.download_url = f"{DOWNLOAD_BASE}/latest/download/{self.file_name}"
+        self.install_lock = threading.Lock()
+    
+    @property
+    def codeql_bin(self) -> Path:
+        """当前版本的 codeql 可执行文件（兼容旧的平铺安装方式）"""
+        current_bin = self.current_link / 'codeql'
+        if current_bin.exists():
+            return current_bin
+        return self.codeql_dir / 'codeql'
+    
+    def release_url(self, version: str) -> str:
+        if version == 'latest':
+            return self.download_url
+        return f"{DOWNLOAD_BASE}/download/v{version.lstrip('v')}/{self.file_name}"
+    
     def is_codeql_installed(self) -> bool:
         """检查CodeQL是否已安装"""
         return self.codeql_bin.exists() and self.codeql_bin.is_file()
@@ -45,18 +239,200 @@ class CodeQLManager:
             else:
                 logging.warning(f"获取CodeQL版本失败: {result.stderr}")
                 return None
-                
+        
         except Exception as e:
             logging.error(f"获取CodeQL版本时出错: {str(e)}")
             return None
     
-    def download_codeql(self, progress_callback=None) -> Dict[str, Any]:
+    def current_version(self) -> Optional[str]:
+        """当前符号链接指向的版本"""
+        if self.current_link.is_symlink():
+            return Path(os.readlink(self.current_link)).name
+        return None
+    
+    def list_versions(self) -> Dict[str, Any]:
+        """列出已解压的版本和已缓存的发行包"""
+        installed = sorted(p.name for p in self.versions_dir.iterdir()
+                           if p.is_dir() and not p.name.startswith('.')) if self.versions_dir.exists() else []
+        bundles = sorted(p.name[:-len('.zip')] for p in self.bundles_dir.glob('*.zip')) if self.bundles_dir.exists() else []
+        return {'current': self.current_version(), 'installed': installed, 'bundles': bundles}
+    
+    def resolve_version(self, version: str) -> str:
+        """将 latest 解析为具体版本号（根据发行地址的重定向）"""
+        if version != 'latest':
+            return version.lstrip('v')
+        response = requests.head(self.download_url, allow_redirects=True, timeout=30)
+        response.raise_for_status()
+        # 最终地址是不带版本号的签名 CDN 地址，版本号在 releases/download/<tag>/ 这一跳的 Location 中
+        locations = [r.headers.get('location', '') for r in response.history]
+        for location in locations + [response.url]:
+            match = VERSION_PATTERN.search(location)
+            if match:
+                return match.group(1)
+        raise ValueError(f"无法从下载地址解析 latest 对应的版本: {locations or response.url}")
+    
+    def _expected_checksum(self, url: str, expected_sha256: Optional[str]) -> Optional[str]:
+        """校验值来源: 参数/CODEQL_SHA256 环境变量，否则尝试发行页面上的校验文件"""
+        expected = expected_sha256 or os.getenv('CODEQL_SHA256')
+        if expected:
+            return expected.lower()
+        for suffix in CHECKSUM_SUFFIXES:
+            try:
+                response = requests.get(url + suffix, timeout=30)
+                if response.status_code == 200:
+                    match = re.search(r'\b[0-9a-fA-F]{64}\b', response.text)
+                    if match:
+                        return match.group(0).lower()
+            except requests.RequestException:
+                continue
+        return None
+    
+    @staticmethod
+    def _sha256(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def fetch_bundle(self, version: str, progress_callback=None, expected_sha256=None) -> Path:
+        """下载发行包到缓存（已缓存且校验通过时直接复用）"""
+        bundle = self.bundles_dir / f"{version}.zip"
+        checksum_file = bundle.with_name(bundle.name + '.sha256')
+        
+        if bundle.exists() and checksum_file.exists():
+            if self._sha256(bundle) == checksum_file.read_text().strip():
+                logging.info(f"使用缓存的发行包: {bundle}")
+                return bundle
+            logging.warning(f"缓存的发行包校验失败，重新下载: {bundle}")
+            bundle.unlink()
+        
+        url = self.release_url(version)
+        logging.info(f"开始下载CodeQL {version}: {url}")
+        RangeDownloader(url, bundle, progress_callback=progress_callback).download()
+        
+        actual = self._sha256(bundle)
+        expected = self._expected_checksum(url, expected_sha256)
+        if expected and actual != expected:
+            bundle.unlink()
+            raise ValueError(f"发行包校验失败: 期望 {expected}，实际 {actual}")
+        checksum_file.write_text(actual + '\n')
+        logging.info(f"下载完成，文件大小: {bundle.stat().st_size} bytes，SHA-256: {actual}")
+        return bundle
+    
+    @staticmethod
+    def _extract_members(bundle: Path, members, dest: Path):
+        """解压一组成员（每个线程使用独立的 ZipFile 句柄），去掉顶层 codeql/ 目录"""
+        with zipfile.ZipFile(bundle) as zf:
+            for info in members:
+                name = info.filename
+                if name.startswith('codeql/'):
+                    name = name[len('codeql/'):]
+                if not name or '..' in Path(name).parts:
+                    continue
+                target = dest / name
+                mode = info.external_attr >> 16
+                if info.is_dir():
+                    target.mkdir(parents=True, exist_ok=True)
+                    continue
+                target.parent.mkdir(parents=True, exist_ok=True)
+                if stat.S_ISLNK(mode):
+                    os.symlink(zf.read(info).decode(), target)
+                    continue
+                with zf.open(info) as src, open(target, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                if mode & 0o777:
+                    os.chmod(target, mode & 0o777)
+    
+    def extract_bundle(self, bundle: Path, version: str) -> Path:
+        """并行解压发行包到 versions/<version>，完成后原子重命名"""
+        version_dir = self.versions_dir / version
+        if (version_dir / 'codeql').exists():
+            return version_dir
+        
+        self.versions_dir.mkdir(parents=True, exist_ok=True)
+        self._sweep_stale_extractions()
+        tmp_dir = self.versions_dir / f".{version}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir()
+        
+        try:
+            with zipfile.ZipFile(bundle) as zf:
+                members = zf.infolist()
+            
+            # 按大小轮流分配，使各线程的解压量大致均衡
+            workers = max(1, EXTRACT_WORKERS)
+            groups = [[] for _ in range(workers)]
+            loads = [0] * workers
+            for info in sorted(members, key=lambda m: m.file_size, reverse=True):
+                index = loads.index(min(loads))
+                groups[index].append(info)
+                loads[index] += info.file_size
+            
+            logging.info(f"正在解压 {len(members)} 个文件到: {version_dir}（{workers} 个线程）")
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for future in [executor.submit(self._extract_members, bundle, group, tmp_dir)
+                               for group in groups if group]:
+                    future.result()
+            
+            codeql_exe = tmp_dir / 'codeql'
+            if not codeql_exe.exists():
+                raise ValueError("发行包中没有 codeql 可执行文件")
+            os.chmod(codeql_exe, 0o755)
+            
+            shutil.rmtree(version_dir, ignore_errors=True)
+            os.replace(tmp_dir, version_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return version_dir
+    
+    def _sweep_stale_extractions(self):
+        """清理被中断的解压留下的临时目录（.<version>.<pid>.tmp，进程已不存在）"""
+        # 预热在有构建开始时用 SIGTERM 终止安装进程，extract_bundle 的 finally 不会执行
+        for tmp_dir in self.versions_dir.glob('.*.tmp'):
+            pid = tmp_dir.name.rsplit('.', 2)[-2]
+            if not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                os.kill(int(pid), 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+            logging.info(f"清理中断的解压目录: {tmp_dir.name}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    
+    def switch_version(self, version: str):
+        """原子切换 current 符号链接"""
+        version_dir = self.versions_dir / version
+        if not version or '/' in version or not (version_dir / 'codeql').exists():
+            raise ValueError(f"CodeQL {version} 未安装")
+        tmp_link = self.codeql_dir / f".current.{os.getpid()}.tmp"
+        if tmp_link.is_symlink():
+            tmp_link.unlink()
+        os.symlink(Path('versions') / version, tmp_link)
+        os.replace(tmp_link, self.current_link)
+        logging.info(f"已切换到 CodeQL {version}")
+    
+    def install_version(self, version='latest', progress_callback=None, expected_sha256=None) -> Dict[str, Any]:
+        """下载（或复用缓存）、解压并切换到指定版本"""
+        with self.install_lock:
+            version = self.resolve_version(version)
+            if not (self.versions_dir / version / 'codeql').exists():
+                bundle = self.fetch_bundle(version, progress_callback, expected_sha256)
+                self.extract_bundle(bundle, version)
+            self.switch_version(version)
+            return {'version': version, 'path': str(self.versions_dir / version)}
+    
+    def download_codeql(self, progress_callback=None, version='latest') -> Dict[str, Any]:
         """
         下载CodeQL CLI
         
         Args:
             progress_callback: 进度回调函数，接收 (downloaded, total) 参数
-            
+            version: 版本号，默认 latest
+        
         Returns:
             Dict包含下载结果信息
         """
@@ -67,71 +443,16 @@ class CodeQLManager:
         }
         
         try:
-            logging.info("开始下载CodeQL...")
-            logging.info(f"下载地址: {self.download_url}")
+            installed = self.install_version(version, progress_callback)
             
-            # 创建临时目录
-            with tempfile.TemporaryDirectory() as temp_dir:
-                temp_file = Path(temp_dir) / self.file_name
-                
-                # 下载文件
-                logging.info(f"正在下载到临时文件: {temp_file}")
-                
-                response = requests.get(self.download_url, stream=True)
-                response.raise_for_status()
-                
-                total_size = int(response.headers.get('content-length', 0))
-                downloaded = 0
-                
-                with open(temp_file, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            
-                            # 调用进度回调
-                            if progress_callback:
-                                progress_callback(downloaded, total_size)
-                
-                # 验证下载的文件
-                if not temp_file.exists() or temp_file.stat().st_size == 0:
-                    result["message"] = "下载的文件无效或为空"
-                    return result
-                
-                logging.info(f"下载完成，文件大小: {temp_file.stat().st_size} bytes")
-                
-                # 确保CodeQL目录存在
-                self.codeql_dir.mkdir(parents=True, exist_ok=True)
-                
-                # 解压文件
-                logging.info(f"正在解压到: {self.codeql_dir}")
-                with zipfile.ZipFile(temp_file, 'r') as zip_ref:
-                    zip_ref.extractall(self.codeql_dir)
-                
-                # 移动文件到正确位置（如果解压后在子目录中）
-                codeql_subdir = self.codeql_dir / "codeql"
-                if codeql_subdir.exists() and codeql_subdir.is_dir():
-                    logging.info("移动CodeQL文件到根目录")
-                    for item in codeql_subdir.iterdir():
-                        shutil.move(str(item), str(self.codeql_dir / item.name))
-                    codeql_subdir.rmdir()
-                
-                # 设置执行权限
-                codeql_exe = self.codeql_dir / "codeql"
-                if codeql_exe.exists():
-                    os.chmod(codeql_exe, 0o755)
-                    logging.info("设置CodeQL可执行权限")
-                
-                logging.info("CodeQL下载和安装完成")
-                
-                # 验证安装
-                if self.is_codeql_installed():
-                    result["success"] = True
-                    result["message"] = "CodeQL下载和安装成功"
-                    result["version"] = self.get_codeql_version()
-                else:
-                    result["message"] = "CodeQL下载完成但安装验证失败"
-                
+            # 验证安装
+            if self.is_codeql_installed():
+                result["success"] = True
+                result["message"] = f"CodeQL {installed['version']} 安装成功"
+                result["version"] = self.get_codeql_version()
+            else:
+                result["message"] = "CodeQL下载完成但安装验证失败"
+        
         except requests.RequestException as e:
             result["message"] = f"下载失败: {str(e)}"
             logging.error(f"下载CodeQL时出错: {str(e)}")
@@ -150,14 +471,16 @@ class CodeQLManager:
             "installed": False,
             "version": None,
             "path": str(self.codeql_dir),
-            "executable": None
+            "executable": None,
+            "current": None
         }
         
         try:
             status["installed"] = self.is_codeql_installed()
             if status["installed"]:
                 status["version"] = self.get_codeql_version()
-                status["executable"] = str(self.codeql_dir / "codeql")
+                status["executable"] = str(self.codeql_bin)
+                status["current"] = self.current_version()
         except Exception as e:
             logging.error(f"获取CodeQL状态时出错: {str(e)}")
         
@@ -174,6 +497,38 @@ class CodeQLManager:
             }
         
         logging.info("CodeQL未安装，开始自动下载...")
-        result = self.download_codeql()
+        result = self.download_codeql(version=os.getenv('CODEQL_VERSION', 'latest'))
         result["action"] = "download"
-        return result
\ No newline at end of file
+        return result
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+    parser = argparse.ArgumentParser(description='CodeQL CLI 版本管理')
+    parser.add_argument('--base-dir', default=os.getenv('APP_BASE_DIR', '/app'))
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_install = sub.add_parser('install', help='下载并切换到指定版本')
+    p_install.add_argument('version', nargs='?', default=os.getenv('CODEQL_VERSION', 'latest'))
+    p_install.add_argument('--sha256', help='期望的发行包 SHA-256')
+
+    p_use = sub.add_parser('use', help='切换到已安装的版本')
+    p_use.add_argument('version')
+
+    sub.add_parser('list', help='列出已安装的版本')
+
+    args = parser.parse_args()
+    manager = CodeQLManager(args.base_dir)
+
+    if args.command == 'install':
+        installed = manager.install_version(args.version, expected_sha256=args.sha256)
+        print(installed['path'])
+    elif args.command == 'use':
+        manager.switch_version(args.version)
+    elif args.command == 'list':
+        print(json.dumps(manager.list_versions(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+构建日志全文索引
+日志写入时按行建立索引（SQLite FTS5，只存索引不存正文，正文按字节偏移从日志文件读取），
+同时识别错误、警告和构建阶段标记。旧日志压缩为分块 gzip（多个 gzip member），
+记录每块的偏移后仍可按字节范围随机读取，索引保持有效。
+
+用法:
+    python3 log_index.py search <关键词> [--build-id ID] [--context N]
+    python3 log_index.py index <build_id>       为已有日志补建索引
+    python3 log_index.py rotate [--days N]      压缩 N 天前的日志
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+
+LOG_DIR = Path(os.getenv('LOG_DIR', '/app/logs'))
+LOG_ROTATE_DAYS = int(os.getenv('LOG_ROTATE_DAYS', '7'))
+
+INDEX_BATCH_LINES = 500
+INDEX_BATCH_SECONDS = 1.0
+MAX_INDEXED_LINE_CHARS = 2000
+MAX_MARKER_CHARS = 500
+GZIP_BLOCK_SIZE = 1024 * 1024
+MAX_RANGE_BYTES = 1024 * 1024
+# 日志目录中不属于构建的日志（由各自的进程直接写入），不做轮转
+NON_BUILD_LOGS = ('web_ui', 'prewarm')
+
+# 日志行标记: 错误、警告、构建阶段（对应 build-db.sh 的输出）
+MARKER_PATTERNS = [
+    ('error', re.compile(r'\b(error|fatal)\b|BUILD FAILED|BUILD FAILURE|Exception in thread|^Error:', re.IGNORECASE)),
+    ('warning', re.compile(r'\bwarn(ing)?\b', re.IGNORECASE)),
+    ('phase', re.compile(r'^(=== .+ ===|Running configure|Running make|Compiling user project|Creating CodeQL database'
+                         r'|Finalizing database|Checking JDK source cache|Detecting project type|Boot JDK:'
+                         r'|Dependency cache)')),
+]
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS log_files (
+    id INTEGER PRIMARY KEY,
+    build_id TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    lines INTEGER NOT NULL DEFAULT 0,
+    compressed INTEGER NOT NULL DEFAULT 0,
+    updated_time REAL
+);
+CREATE TABLE IF NOT EXISTS log_lines (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL,
+    line_no INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_log_lines_file ON log_lines(file_id, line_no);
+CREATE TABLE IF NOT EXISTS log_markers (
+    file_id INTEGER NOT NULL,
+    line_no INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_log_markers_file ON log_markers(file_id, kind);
+CREATE TABLE IF NOT EXISTS log_blocks (
+    file_id INTEGER NOT NULL,
+    block_no INTEGER NOT NULL,
+    raw_offset INTEGER NOT NULL,
+    raw_size INTEGER NOT NULL,
+    gz_offset INTEGER NOT NULL,
+    gz_size INTEGER NOT NULL,
+    PRIMARY KEY (file_id, block_no)
+);
+'''
+
+
+def classify(text):
+    for kind, pattern in MARKER_PATTERNS:
+        if pattern.search(text):
+            return kind
+    return None
+
+
+def fts_query(query):
+    """把用户输入转换为 FTS5 查询: 每个词作为短语，避免特殊字符导致语法错误"""
+    terms = [t for t in query.split() if t]
+    return ' '.join('"' + t.replace('"', '""') + '"' for t in terms)
+
+
+class LogIndex:
+    def __init__(self, log_dir=LOG_DIR, db_path=None):
+        self.log_dir = Path(log_dir)
+        self.db_path = Path(db_path) if db_path else self.log_dir / 'log_index.db'
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        conn = self.connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        try:
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS log_fts USING fts5(text, content='')")
+            self.fts_enabled = True
+        except sqlite3.OperationalError:
+            # SQLite 未编译 FTS5 时只索引标记行
+            self.fts_enabled = False
+        conn.commit()
+        conn.close()
+
+    def connect(self):
+        return sqlite3.connect(str(self.db_path), timeout=30)
+
+    def log_path(self, build_id):
+        return self.log_dir / f'{build_id}.log'
+
+    def gz_path(self, build_id):
+        return self.log_dir / f'{build_id}.log.gz'
+
+    def _file_row(self, conn, build_id, create=True):
+        row = conn.execute('SELECT id, size, lines, compressed FROM log_files WHERE build_id = ?',
+                           (build_id,)).fetchone()
+        if row is None and create:
+            cursor = conn.execute('INSERT INTO log_files (build_id, updated_time) VALUES (?, ?)',
+                                  (build_id, time.time()))
+            conn.commit()
+            row = (cursor.lastrowid, 0, 0, 0)
+        return row
+
+    def open_writer(self, build_id, append=False):
+        """日志写入器：写文件的同时建立索引"""
+        return LogWriter(self, build_id, append=append)
+
+    def index_file(self, build_id, final=True):
+        """为已有日志补建索引（从上次索引到的位置继续）；final 为 False 时末尾不完整的行留待后续追加"""
+        path = self.log_path(build_id)
+        indexer = LineIndexer(self, build_id, reset=False)
+        try:
+            with open(path, 'rb') as f:
+                f.seek(indexer.offset)
+                for block in iter(lambda: f.read(GZIP_BLOCK_SIZE), b''):
+                    indexer.feed(block)
+        finally:
+            indexer.close(final)
+        return indexer.line_no
+
+    def read_range(self, build_id, offset, length):
+        """按字节范围读取日志（支持已压缩的分块 gzip 日志）"""
+        length = max(0, min(length, MAX_RANGE_BYTES))
+        path = self.log_path(build_id)
+        if path.exists():
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                return f.read(length)
+
+        gz_path = self.gz_path(build_id)
+        if not gz_path.exists():
+            raise FileNotFoundError(build_id)
+
+        conn = self.connect()
+        try:
+            row = self._file_row(conn, build_id, create=False)
+            blocks = conn.execute('''
+                SELECT raw_offset, raw_size, gz_offset, gz_size FROM log_blocks
+                WHERE file_id = ? AND raw_offset + raw_size > ? AND raw_offset < ?
+                ORDER BY block_no
+            ''', (row[0], offset, offset + length)).fetchall() if row else []
+        finally:
+            conn.close()
+
+        data = bytearray()
+        with open(gz_path, 'rb') as f:
+            for raw_offset, raw_size, gz_offset, gz_size in blocks:
+                f.seek(gz_offset)
+                raw = zlib.decompressobj(wbits=31).decompress(f.read(gz_size))
+                start = max(0, offset - raw_offset)
+                end = min(raw_size, offset + length - raw_offset)
+                data += raw[start:end]
+        return bytes(data)
+
+    def iter_log(self, build_id):
+        """完整日志内容（压缩日志边解压边输出）"""
+        path = self.log_path(build_id)
+        if path.exists():
+            opener = open(path, 'rb')
+        else:
+            opener = gzip.open(self.gz_path(build_id), 'rb')
+        with opener as f:
+            for block in iter(lambda: f.read(GZIP_BLOCK_SIZE), b''):
+                yield block
+
+    def _line_context(self, conn, file_id, build_id, line_no, context):
+        rows = conn.execute('''
+            SELECT line_no, offset, length FROM log_lines
+            WHERE file_id = ? AND line_no BETWEEN ? AND ?
+            ORDER BY line_no
+        ''', (file_id, line_no - context, line_no + context)).fetchall()
+        if not rows:
+            return []
+        start = rows[0][1]
+        data = self.read_range(build_id, start, rows[-1][1] + rows[-1][2] - start)
+        return [{'line_no': ln, 'text': data[off - start:off - start + size].decode('utf-8', 'replace').rstrip('\n')}
+                for ln, off, size in rows]
+
+    def search(self, query, build_id=None, kind=None, limit=50, context=0):
+        """跨构建搜索日志行，返回行号、字节偏移和上下文（只读取命中的字节范围）"""
+        limit = max(1, min(int(limit), 500))
+        context = max(0, min(int(context), 20))
+        conn = self.connect()
+        try:
+            params = []
+            if kind or not self.fts_enabled:
+                sql = '''
+                    SELECT f.id, f.build_id, m.line_no, m.offset, m.length, m.kind
+                    FROM log_markers m JOIN log_files f ON f.id = m.file_id
+                    WHERE 1 = 1
+                '''
+                if query:
+                    sql += ' AND m.text LIKE ?'
+                    params.append(f'%{query}%')
+                if kind:
+                    sql += ' AND m.kind = ?'
+                    params.append(kind)
+                order = ' ORDER BY f.id DESC, m.line_no'
+            else:
+                if not query.strip():
+                    return []
+                sql = '''
+                    SELECT f.id, f.build_id, l.line_no, l.offset, l.length, NULL
+                    FROM log_fts JOIN log_lines l ON l.id = log_fts.rowid
+                    JOIN log_files f ON f.id = l.file_id
+                    WHERE log_fts MATCH ?
+                '''
+                params.append(fts_query(query))
+                order = ' ORDER BY l.id DESC'
+            if build_id:
+                sql += ' AND f.build_id = ?'
+                params.append(build_id)
+            sql += order + ' LIMIT ?'
+            params.append(limit)
+
+            results = []
+            for file_id, bid, line_no, offset, length, marker_kind in conn.execute(sql, params).fetchall():
+                try:
+                    text = self.read_range(bid, offset, length).decode('utf-8', 'replace').rstrip('\n')
+                except FileNotFoundError:
+                    continue
+                result = {'build_id': bid, 'line_no': line_no, 'offset': offset, 'length': length, 'text': text}
+                if marker_kind:
+                    result['kind'] = marker_kind
+                if context:
+                    result['context'] = self._line_context(conn, file_id, bid, line_no, context)
+                results.append(result)
+            return results
+        finally:
+            conn.close()
+
+    def markers(self, build_id, kind=None):
+        """单个构建的错误/警告/阶段标记"""
+        conn = self.connect()
+        try:
+            sql = '''
+                SELECT m.line_no, m.offset, m.length, m.kind, m.text
+                FROM log_markers m JOIN log_files f ON f.id = m.file_id
+                WHERE f.build_id = ?
+            '''
+            params = [build_id]
+            if kind:
+                sql += ' AND m.kind = ?'
+                params.append(kind)
+            rows = conn.execute(sql + ' ORDER BY m.line_no', params).fetchall()
+        finally:
+            conn.close()
+        return [{'line_no': r[0], 'offset': r[1], 'length': r[2], 'kind': r[3], 'text': r[4]} for r in rows]
+
+    def rotate(self, max_age_days=LOG_ROTATE_DAYS, skip=()):
+        """将超过 max_age_days 未修改的日志压缩为分块 gzip，索引保留"""
+        cutoff = time.time() - max_age_days * 86400
+        rotated = []
+        for path in sorted(self.log_dir.glob('*.log')):
+            build_id = path.name[:-len('.log')]
+            if build_id in skip or build_id in NON_BUILD_LOGS or path.stat().st_mtime > cutoff:
+                continue
+            self.index_file(build_id)
+            self._compress(build_id)
+            rotated.append(build_id)
+        return rotated
+
+    def _drop_index(self, conn, build_id, file_id):
+        """删除日志的行、全文索引和标记，用于同一 build_id 重新写入日志前"""
+        if self.fts_enabled:
+            # log_fts 不保存正文，删除时需要提供原行内容，按行号顺序从旧日志中重新切分
+            rowids = iter(conn.execute('SELECT id FROM log_lines WHERE file_id = ? ORDER BY line_no',
+                                       (file_id,)).fetchall())
+            try:
+                partial = b''
+                for block in self.iter_log(build_id):
+                    lines = (partial + block).split(b'\n')
+                    partial = lines.pop()
+                    for line in lines:
+                        self._drop_fts_row(conn, next(rowids, None), line)
+                if partial:
+                    self._drop_fts_row(conn, next(rowids, None), partial)
+            except FileNotFoundError:
+                pass
+        conn.execute('DELETE FROM log_lines WHERE file_id = ?', (file_id,))
+        conn.execute('DELETE FROM log_markers WHERE file_id = ?', (file_id,))
+
+    @staticmethod
+    def _drop_fts_row(conn, row, line):
+        if row is None:
+            return
+        text = line.decode('utf-8', 'replace').rstrip('\r\n')
+        if text.strip():
+            conn.execute("INSERT INTO log_fts (log_fts, rowid, text) VALUES ('delete', ?, ?)",
+                         (row[0], text[:MAX_INDEXED_LINE_CHARS]))
+
+    def _compress(self, build_id):
+        path = self.log_path(build_id)
+        gz_path = self.gz_path(build_id)
+        tmp_path = gz_path.with_name(gz_path.name + '.tmp')
+        blocks = []
+        raw_offset = gz_offset = 0
+        with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            for block_no, raw in enumerate(iter(lambda: src.read(GZIP_BLOCK_SIZE), b'')):
+                member = gzip.compress(raw, mtime=0)
+                dst.write(member)
+                blocks.append((block_no, raw_offset, len(raw), gz_offset, len(member)))
+                raw_offset += len(raw)
+                gz_offset += len(member)
+
+        conn = self.connect()
+        try:
+            file_id = self._file_row(conn, build_id)[0]
+            conn.execute('DELETE FROM log_blocks WHERE file_id = ?', (file_id,))
+            conn.executemany('''
+                INSERT INTO log_blocks (file_id, block_no, raw_offset, raw_size, gz_offset, gz_size)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(file_id,) + block for block in blocks])
+            conn.execute('UPDATE log_files SET compressed = 1, updated_time = ? WHERE id = ?',
+                         (time.time(), file_id))
+            os.replace(tmp_path, gz_path)
+            conn.commit()
+        finally:
+            conn.close()
+        path.unlink()
+
+
+class LineIndexer:
+    """按行切分字节流并批量写入索引"""
+
+    def __init__(self, index, build_id, reset):
+        self.index = index
+        self.conn = index.connect()
+        row = index._file_row(self.conn, build_id)
+        self.file_id = row[0]
+        if reset:
+            index._drop_index(self.conn, build_id, self.file_id)
+            # 已轮转的旧日志一并删除，避免 iter_log/read_range 混读两次写入的内容
+            self.conn.execute('DELETE FROM log_blocks WHERE file_id = ?', (self.file_id,))
+            self.conn.execute('UPDATE log_files SET size = 0, lines = 0, compressed = 0 WHERE id = ?',
+                              (self.file_id,))
+            self.conn.commit()
+            gz_path = index.gz_path(build_id)
+            if gz_path.exists():
+                gz_path.unlink()
+            self.offset, self.line_no = 0, 0
+        else:
+            self.offset, self.line_no = row[1], row[2]
+        self.partial = b''
+        self.pending = []
+        self.last_flush = time.time()
+
+    def feed(self, data):
+        self.partial += data
+        while True:
+            pos = self.partial.find(b'\n')
+            if pos < 0:
+                break
+            self._add_line(self.partial[:pos + 1])
+            self.partial = self.partial[pos + 1:]
+        if len(self.pending) >= INDEX_BATCH_LINES or time.time() - self.last_flush >= INDEX_BATCH_SECONDS:
+            self.flush()
+
+    def _add_line(self, line):
+        self.line_no += 1
+        self.pending.append((self.line_no, self.offset, line))
+        self.offset += len(line)
+
+    def flush(self):
+        if self.pending:
+            cursor = self.conn.cursor()
+            for line_no, offset, line in self.pending:
+                text = line.decode('utf-8', 'replace').rstrip('\r\n')
+                cursor.execute('INSERT INTO log_lines (file_id, line_no, offset, length) VALUES (?, ?, ?, ?)',
+                               (self.file_id, line_no, offset, len(line)))
+                if self.index.fts_enabled and text.strip():
+                    cursor.execute('INSERT INTO log_fts (rowid, text) VALUES (?, ?)',
+                                   (cursor.lastrowid, text[:MAX_INDEXED_LINE_CHARS]))
+                kind = classify(text)
+                if kind:
+                    cursor.execute('''
+                        INSERT INTO log_markers (file_id, line_no, offset, length, kind, text)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', (self.file_id, line_no, offset, len(line), kind, text[:MAX_MARKER_CHARS]))
+            cursor.execute('UPDATE log_files SET size = ?, lines = ?, updated_time = ? WHERE id = ?',
+                           (self.offset, self.line_no, time.time(), self.file_id))
+            self.conn.commit()
+            self.pending = []
+        self.last_flush = time.time()
+
+    def close(self, final=True):
+        # 日志结束时末尾没有换行的内容也作为一行
+        if final and self.partial:
+            self._add_line(self.partial)
+            self.partial = b''
+        self.flush()
+        self.conn.close()
+
+
+class LogWriter:
+    """写入构建日志文件并同步建立索引"""
+
+    def __init__(self, index, build_id, append=False):
+        path = index.log_path(build_id)
+        if append and path.exists():
+            # 先补齐上次未索引的部分，保证偏移与文件一致
+            index.index_file(build_id, final=False)
+        self.append = append
+        self.indexer = LineIndexer(index, build_id, reset=not append)
+        if append and path.exists():
+            with open(path, 'rb') as f:
+                f.seek(self.indexer.offset)
+                self.indexer.partial = f.read()
+        self.file = open(path, 'ab' if append else 'wb')
+
+    def write(self, text):
+        data = text.encode('utf-8', 'replace')
+        self.file.write(data)
+        self.file.flush()
+        self.indexer.feed(data)
+
+    def close(self):
+        self.file.close()
+        # Worker 日志分批追加，最后一行可能在下一批中补全
+        self.indexer.close(final=not self.append)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='构建日志全文索引')
+    parser.add_argument('--log-dir', default=str(LOG_DIR))
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_search = sub.add_parser('search', help='搜索日志')
+    p_search.add_argument('query')
+    p_search.add_argument('--build-id')
+    p_search.add_argument('--kind', choices=['error', 'warning', 'phase'])
+    p_search.add_argument('--context', type=int, default=0)
+    p_search.add_argument('--limit', type=int, default=50)
+    p_index = sub.add_parser('index', help='为已有日志补建索引')
+    p_index.add_argument('build_id')
+    p_rotate = sub.add_parser('rotate', help='压缩旧日志（索引保留）')
+    p_rotate.add_argument('--days', type=int, default=LOG_ROTATE_DAYS)
+
+    args = parser.parse_args()
+    index = LogIndex(args.log_dir)
+
+    if args.command == 'search':
+        result = index.search(args.query, build_id=args.build_id, kind=args.kind,
+                              limit=args.limit, context=args.context)
+    elif args.command == 'index':
+        result = {'build_id': args.build_id, 'lines': index.index_file(args.build_id)}
+    else:
+        result = {'rotated': index.rotate(args.days)}
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+空闲时预热
+在没有构建运行时，提前完成新 JDK 版本首次构建才会做的准备工作:
+安装 CodeQL 运行时 JRE、下载并校验 CodeQL CLI、解析源码 tag、下载 JDK 源码到源码缓存。
+有构建开始时立即终止正在执行的预热步骤（整个进程组），空闲后重新执行；
+apt-get 安装不可中断，只在步骤之间让出。
+
+配置:
+    PREWARM_JDK_VERSIONS="17 21:21.0.2 8:8u402"   主版本[:完整版本]，空格或逗号分隔
+
+用法:
+    python3 prewarmer.py status    检查各项是否已预热
+    python3 prewarmer.py run       立即执行一轮预热（不等待空闲）
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from codeql_manager import CodeQLManager
+
+SCRIPTS_DIR = Path(os.getenv('SCRIPTS_DIR', '/app/scripts'))
+CACHE_MANAGER = str(SCRIPTS_DIR / 'cache-manager.sh')
+DOWNLOAD_SCRIPT = str(SCRIPTS_DIR / 'download-jdk.sh')
+CODEQL_MANAGER = str(Path(__file__).resolve().parent / 'codeql_manager.py')
+CACHE_DIR = Path(os.getenv('CACHE_DIR', '/app/cache'))
+JVM_DIR = Path('/usr/lib/jvm')
+
+PREWARM_JDK_VERSIONS = os.getenv('PREWARM_JDK_VERSIONS', '')
+PREWARM_IDLE_SECONDS = int(os.getenv('PREWARM_IDLE_SECONDS', '60'))
+PREWARM_INTERVAL = int(os.getenv('PREWARM_INTERVAL', '21600'))
+CODEQL_RUNTIME_MAJOR = os.getenv('CODEQL_RUNTIME_MAJOR', '17')
+CODEQL_VERSION = os.getenv('CODEQL_VERSION', 'latest')
+
+SUPPORTED_JDK_VERSIONS = ('8', '11', '17', '21')
+POLL_INTERVAL = 1.0
+LOOP_INTERVAL = 10.0
+
+
+class PrewarmInterrupted(Exception):
+    """有构建开始，预热步骤被终止"""
+
+
+def parse_targets(value):
+    """解析 PREWARM_JDK_VERSIONS，返回 [(主版本, 完整版本), ...]，不支持的版本忽略"""
+    targets = []
+    for item in re.split(r'[\s,]+', value.strip()):
+        if not item:
+            continue
+        major, _, full = item.partition(':')
+        if major not in SUPPORTED_JDK_VERSIONS:
+            logging.warning(f"预热: 忽略不支持的JDK版本 {item}")
+            continue
+        if (major, full) not in targets:
+            targets.append((major, full))
+    return targets
+
+
+class Prewarmer:
+    def __init__(self, base_dir='/app', targets=None, is_busy=None, log_file=None, work_dir=None):
+        self.base_dir = Path(base_dir)
+        self.targets = parse_targets(PREWARM_JDK_VERSIONS) if targets is None else targets
+        self.is_busy = is_busy or (lambda: False)
+        self.log_file = Path(log_file) if log_file else self.base_dir / 'logs' / 'prewarm.log'
+        self.work_dir = Path(work_dir) if work_dir else self.base_dir / 'prewarm'
+        self.codeql_manager = CodeQLManager(self.base_dir)
+        self.codeql_probe = None
+
+        self.lock = threading.Lock()
+        self.running = False
+        self.forced = False
+        self.wake = threading.Event()
+        self.last_busy = time.time()
+        self.last_pass = None
+
+        self.items = {}
+        for name, kind, _, _ in self._steps():
+            self.items[name] = {'name': name, 'kind': kind, 'state': 'unknown', 'detail': None, 'updated_time': None}
+
+    @property
+    def enabled(self):
+        return bool(self.targets)
+
+    def _steps(self):
+        """(名称, 类型, 快速检查, 预热) 列表，按执行顺序"""
+        steps = [
+            (f'openjdk-{CODEQL_RUNTIME_MAJOR}-jre', 'codeql_runtime', self._check_runtime, self._warm_runtime),
+            ('codeql-cli', 'codeql_cli', self._check_codeql, self._warm_codeql),
+        ]
+        for major, full in self.targets:
+            steps.append((f"jdk{major}-{full or 'latest'}", 'jdk_source',
+                          lambda m=major, f=full: self._check_source(m, f),
+                          lambda m=major, f=full: self._warm_source(m, f)))
+        return steps
+
+    def _set(self, name, state, detail=None):
+        self.items[name].update({'state': state, 'detail': detail, 'updated_time': time.time()})
+
+    def _run(self, cmd, env=None, interruptible=True):
+        """执行预热命令，输出写入预热日志；有构建开始时终止整个进程组"""
+        self.log_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.log_file, 'a') as log:
+            log.write(f"$ {' '.join(cmd)}\n")
+            log.flush()
+            process = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=log,
+                                       universal_newlines=True, preexec_fn=os.setsid)
+            while True:
+                try:
+                    stdout, _ = process.communicate(timeout=POLL_INTERVAL)
+                    break
+                except subprocess.TimeoutExpired:
+                    if interruptible and self.is_busy():
+                        os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+                        process.communicate()
+                        log.write("[prewarm] 有构建开始，已终止\n")
+                        raise PrewarmInterrupted()
+            log.write(stdout)
+        if process.returncode != 0:
+            raise RuntimeError(f"{' '.join(cmd)} 失败 (退出码 {process.returncode})")
+        return stdout
+
+    # CodeQL 运行时 JRE（与 build-db.sh 的 ensure_codeql_runtime 使用相同路径，已安装时构建跳过 apt-get）
+    def _runtime_home(self):
+        return JVM_DIR / f'java-{CODEQL_RUNTIME_MAJOR}-openjdk-amd64'
+
+    def _check_runtime(self):
+        java = self._runtime_home() / 'bin' / 'java'
+        return str(self._runtime_home()) if os.access(java, os.X_OK) else None
+
+    def _warm_runtime(self):
+        if not shutil.which('apt-get'):
+            raise RuntimeError('apt-get 不可用')
+        package = f'openjdk-{CODEQL_RUNTIME_MAJOR}-jre-headless'
+        # 中断 dpkg 可能损坏包数据库，安装过程不可中断
+        self._run(['/bin/bash', '-c',
+                   'apt-get -o DPkg::Lock::Timeout=600 update -y && DEBIAN_FRONTEND=noninteractive '
+                   f'apt-get -o DPkg::Lock::Timeout=600 install -y {package}'],
+                  interruptible=False)
+        home = self._check_runtime()
+        if not home:
+            raise RuntimeError(f'{package} 安装后未找到 {self._runtime_home()}')
+        return home
+
+    # CodeQL CLI
+    def _check_codeql(self):
+        if not self.codeql_manager.is_codeql_installed():
+            return None
+        # /api/prewarm 被前端轮询，可执行文件未变化时复用上次 codeql version 的结果
+        codeql_bin = self.codeql_manager.codeql_bin
+        key = (os.path.realpath(codeql_bin), codeql_bin.stat().st_mtime_ns)
+        if self.codeql_probe and self.codeql_probe[0] == key:
+            return self.codeql_probe[1]
+        version = self.codeql_manager.get_codeql_version()
+        if version:
+            self.codeql_probe = (key, version)
+        return version
+
+    def _warm_codeql(self):
+        # 发行包下载支持断点续传，被中断后下次继续
+        self._run([sys.executable, CODEQL_MANAGER, '--base-dir', str(self.base_dir), 'install', CODEQL_VERSION])
+        version = self._run([str(self.codeql_manager.codeql_bin), 'version']).strip().splitlines()
+        if not version:
+            raise RuntimeError('CodeQL CLI 校验失败')
+        return version[0]
+
+    # JDK 源码
+    def _check_source(self, major, full):
+        # 只查看本地缓存的元数据，不触发远程缓存拉取
+        cache_key = f'{major}_{full}_source'
+        if (CACHE_DIR / 'metadata' / f'{cache_key}.json').exists() and (CACHE_DIR / 'sources' / cache_key).is_dir():
+            return cache_key
+        return None
+
+    def _warm_source(self, major, full):
+        env = dict(os.environ, JDK_VERSION=major, JDK_FULL_VERSION=full)
+        tag = self._run(['/bin/bash', DOWNLOAD_SCRIPT, 'resolve-tag'], env=env).strip().splitlines()[-1]
+
+        # check-source 会在本地未命中时尝试远程缓存
+        try:
+            self._run(['/bin/bash', CACHE_MANAGER, 'check-source', major, full], env=env)
+            return tag
+        except RuntimeError:
+            pass
+
+        source_dir = self.work_dir / f'source-{major}-{full or "latest"}'
+        shutil.rmtree(source_dir, ignore_errors=True)
+        source_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            self._run(['/bin/bash', DOWNLOAD_SCRIPT], env=dict(env, JDK_SOURCE_DIR=str(source_dir)))
+            self._run(['/bin/bash', CACHE_MANAGER, 'save-source', major, full, str(source_dir)], env=env)
+        finally:
+            shutil.rmtree(source_dir, ignore_errors=True)
+        return tag
+
+    def refresh(self):
+        """快速检查各项是否已预热（不下载）"""
+        for name, _, check, _ in self._steps():
+            if self.items[name]['state'] == 'warming':
+                continue
+            try:
+                detail = check()
+            except Exception as e:
+                detail = None
+                logging.warning(f"预热检查失败 {name}: {str(e)}")
+            if detail:
+                self._set(name, 'warm', detail)
+            elif self.items[name]['state'] in ('unknown', 'warm'):
+                self._set(name, 'cold')
+
+    def run_pass(self):
+        """执行一轮预热，返回是否完整执行（被构建打断返回 False）"""
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+
+        try:
+            for name, _, check, warm in self._steps():
+                if self.is_busy():
+                    raise PrewarmInterrupted()
+                detail = check()
+                if detail:
+                    self._set(name, 'warm', detail)
+                    continue
+
+                self._set(name, 'warming')
+                try:
+                    self._set(name, 'warm', warm())
+                except PrewarmInterrupted:
+                    self._set(name, 'interrupted')
+                    raise
+                except Exception as e:
+                    logging.error(f"预热失败 {name}: {str(e)}")
+                    self._set(name, 'failed', str(e))
+            self.last_pass = time.time()
+            return True
+        except PrewarmInterrupted:
+            logging.info("有构建开始，暂停预热")
+            return False
+        finally:
+            self.running = False
+
+    def trigger(self):
+        """尽快执行一轮预热（仍然等待没有构建运行）"""
+        self.forced = True
+        self.wake.set()
+
+    def start_background(self):
+        thread = threading.Thread(target=self._loop)
+        thread.daemon = True
+        thread.start()
+
+    def _loop(self):
+        self.refresh()
+        while True:
+            self.wake.wait(LOOP_INTERVAL)
+            self.wake.clear()
+            if self.is_busy():
+                self.last_busy = time.time()
+                continue
+
+            idle = time.time() - self.last_busy >= PREWARM_IDLE_SECONDS
+            due = self.last_pass is None or time.time() - self.last_pass >= PREWARM_INTERVAL
+            if self.forced or (idle and due):
+                self.forced = False
+                try:
+                    self.run_pass()
+                except Exception as e:
+                    logging.error(f"预热出错: {str(e)}")
+
+    def get_status(self):
+        return {
+            'enabled': self.enabled,
+            'running': self.running,
+            'last_pass': self.last_pass,
+            'idle_seconds': max(0, int(time.time() - self.last_busy)) if not self.is_busy() else 0,
+            'items': list(self.items.values())
+        }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+    parser = argparse.ArgumentParser(description='JDK 源码与工具链空闲预热')
+    parser.add_argument('--base-dir', default=os.getenv('APP_BASE_DIR', '/app'))
+    parser.add_argument('--versions', default=PREWARM_JDK_VERSIONS, help='主版本[:完整版本] 列表')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help='检查各项是否已预热')
+    sub.add_parser('run', help='立即执行一轮预热')
+    args = parser.parse_args()
+
+    prewarmer = Prewarmer(args.base_dir, targets=parse_targets(args.versions))
+    if args.command == 'run':
+        prewarmer.run_pass()
+    else:
+        prewarmer.refresh()
+    print(json.dumps(prewarmer.get_status(), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()